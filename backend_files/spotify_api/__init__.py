@@ -0,0 +1,6 @@
+"""Portfolio Spotify API route modules.
+
+lambda_function.ROUTES names handlers as "<module>.<function>"; each module is
+imported the first time one of its routes is hit, so a cold start only pays
+for the code the request needs. Shared helpers live in spotify_api.core.
+"""
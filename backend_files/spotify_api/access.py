@@ -0,0 +1,379 @@
+"""Access requests: public submission and count routes, counters and the admin
+review routes.
+"""
+import json
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+from .core import (
+    ADMIN_EMAIL, ADMIN_PAGE_SIZE, ADMIN_PAGE_SIZE_MAX, DYNAMODB_SCAN_SEGMENTS, GLOBAL_PARTITION,
+    WEBSITE_DOMAIN, _decode_cursor, _encode_cursor, _get_storage, _is_owner_user_id,
+    _json_response, _require_auth,
+)
+from .outbox import _queue_email, _trigger_outbox_drain
+from .storage import ConditionFailed
+
+
+# ─── Access Request Counters ─────────────────────────────────────────────────
+# Totals per status and per country live in one global INSIGHTS_TABLE item,
+# kept current with atomic ADD updates and rebuilt by the scheduled reconcile.
+# The item only takes increments once a full recount has set its baseline
+# (reconciled_at); until then a change triggers that recount instead.
+ACCESS_COUNTS_KEY = {"user_id": GLOBAL_PARTITION, "insight_key": "access_request_counts"}
+ACCESS_REQUEST_STATUSES = ("pending", "approved", "rejected")
+
+
+def _adjust_access_counts(deltas):
+    """Atomically add `deltas` ({counter_name: n}) to the counter item.
+
+    Call after the change is stored: without a baseline the recount that runs
+    instead already includes it.
+    """
+    deltas = {k: v for k, v in deltas.items() if v}
+    if not deltas:
+        return
+    try:
+        _get_storage().update(
+            "insights", ACCESS_COUNTS_KEY, increments=deltas, condition=("exists", "reconciled_at"),
+        )
+    except ConditionFailed:
+        try:
+            _rebuild_access_counts()
+        except Exception:
+            pass  # Next count read or scheduled reconcile rebuilds it
+    except Exception:
+        pass  # Corrected by the scheduled reconcile
+
+
+def _rebuild_access_counts():
+    """Recount every access request and overwrite the counter item."""
+    storage = _get_storage()
+    counts = {"total": 0}
+    for item in storage.scan("access_requests", ("country", "status"), segments=DYNAMODB_SCAN_SEGMENTS):
+        counts["total"] += 1
+        for counter in (f"status#{item.get('status', 'pending')}",
+                        f"country#{item.get('country', 'Unknown')}"):
+            counts[counter] = counts.get(counter, 0) + 1
+    storage.put("insights", {
+        **ACCESS_COUNTS_KEY,
+        **counts,
+        "reconciled_at": int(time.time()),
+    })
+    return counts
+
+
+def _record_status_change(old_status, new_status):
+    if old_status != new_status:
+        _adjust_access_counts({f"status#{old_status}": -1, f"status#{new_status}": 1})
+
+
+# ─── Access Request Handlers ─────────────────────────────────────────────────
+def handle_submit_access_request(event):
+    """Submit an access request (public, no auth required)."""
+    try:
+        body = json.loads(event.get("body") or "{}")
+    except (json.JSONDecodeError, TypeError):
+        return _json_response(400, {"error": "Invalid JSON body"})
+
+    full_name = (body.get("full_name") or "").strip()
+    spotify_email = (body.get("spotify_email") or "").strip()
+    country = (body.get("country") or "").strip()
+
+    if not full_name or not spotify_email or not country:
+        return _json_response(400, {"error": "full_name, spotify_email, and country are required"})
+
+    # Basic email validation
+    if "@" not in spotify_email or "." not in spotify_email:
+        return _json_response(400, {"error": "Invalid email address"})
+
+    request_id = str(uuid.uuid4())
+    now = int(time.time())
+
+    _get_storage().put("access_requests", {
+        "request_id": request_id,
+        "full_name": full_name,
+        "spotify_email": spotify_email,
+        "country": country,
+        "status": "pending",
+        "requested_at": now,
+    })
+    _adjust_access_counts({"total": 1, "status#pending": 1, f"country#{country}": 1})
+
+    # Notify admin via the next email digest
+    if ADMIN_EMAIL:
+        _queue_email(
+            ADMIN_EMAIL,
+            f"New Spotify Demo Access Request from {full_name}",
+            f"""<h2>New Access Request</h2>
+            <p><strong>Name:</strong> {full_name}</p>
+            <p><strong>Spotify Email:</strong> {spotify_email}</p>
+            <p><strong>Country:</strong> {country}</p>
+            <p><strong>Request ID:</strong> {request_id}</p>
+            <p>Log in to admin panel to approve or reject.</p>""",
+            dedupe_key=f"access-request#{request_id}",
+            digest=True,
+        )
+
+    return _json_response(201, {"message": "Access request submitted", "request_id": request_id})
+
+
+def handle_access_request_count(event):
+    """Return count of total and approved access requests (public)."""
+    try:
+        item = _get_storage().get("insights", ACCESS_COUNTS_KEY)
+        counts = item if item and "reconciled_at" in item else _rebuild_access_counts()
+
+        country_counts = [
+            (name[len("country#"):], int(n)) for name, n in counts.items()
+            if name.startswith("country#") and n > 0
+        ]
+        top_countries = sorted(country_counts, key=lambda x: x[1], reverse=True)[:10]
+
+        return _json_response(200, {
+            "total_requests": int(counts.get("total", 0)),
+            "approved_count": int(counts.get("status#approved", 0)),
+            "countries": [{"country": c, "count": n} for c, n in top_countries],
+        })
+    except Exception as e:
+        return _json_response(500, {"error": str(e)})
+
+
+# ─── Admin Handlers (Owner Only) ────────────────────────────────────────────
+def _access_list_start_key(cursor, status):
+    """Decode a listing cursor into a status-index start key.
+
+    Raises ValueError unless it is a key of that index for this status, so
+    a tampered or stale cursor is a 400 rather than a storage error.
+    """
+    key = _decode_cursor(cursor)
+    if (set(key) != {"request_id", "status", "requested_at"}
+            or key["status"] != status
+            or not isinstance(key["request_id"], str)
+            or not isinstance(key["requested_at"], (int, float))
+            or isinstance(key["requested_at"], bool)):
+        raise ValueError("Invalid cursor")
+    return key
+
+
+def handle_admin_list_requests(event):
+    """List access requests by status, newest first (owner only).
+
+    Backed by the status-index GSI (range key requested_at). Query params:
+    status (pending|approved|rejected, default pending), limit (page size),
+    cursor (opaque token from the previous page's next_cursor).
+    """
+    user_id, err = _require_auth(event)
+    if err:
+        return err
+    if not _is_owner_user_id(user_id):
+        return _json_response(403, {"error": "Admin access required"})
+
+    qs = event.get("queryStringParameters") or {}
+    status = qs.get("status", "pending")
+    if status not in ACCESS_REQUEST_STATUSES:
+        return _json_response(400, {"error": f"status must be one of {list(ACCESS_REQUEST_STATUSES)}"})
+    try:
+        limit = min(max(int(qs.get("limit", ADMIN_PAGE_SIZE)), 1), ADMIN_PAGE_SIZE_MAX)
+    except ValueError:
+        return _json_response(400, {"error": "limit must be an integer"})
+
+    start_key = None
+    if qs.get("cursor"):
+        try:
+            start_key = _access_list_start_key(qs["cursor"], status)
+        except ValueError as e:
+            return _json_response(400, {"error": str(e)})
+
+    try:
+        items, last_key = _get_storage().query(
+            "access_requests", status, index="status-index", forward=False, limit=limit,
+            start_key=start_key,
+        )
+        return _json_response(200, {
+            "requests": items,
+            "next_cursor": _encode_cursor(last_key),
+        })
+    except Exception as e:
+        return _json_response(500, {"error": str(e)})
+
+
+def _approval_email(item):
+    """Return (to, subject, html) for an approval notification, or None."""
+    user_email = item.get("spotify_email", "")
+    user_name = item.get("full_name", "User")
+    if not user_email:
+        return None
+    return (
+        user_email,
+        "Your Spotify Demo Access Has Been Approved!",
+        f"""<h2>Welcome, {user_name}!</h2>
+            <p>Your request to access the Spotify Demo on
+            <a href="https://{WEBSITE_DOMAIN}/yourspotify/">babasanmiadeyemi.com</a>
+            has been approved.</p>
+            <p>You can now log in with your Spotify account to explore your personal
+            listening data, discover curated playlists, and more.</p>
+            <p>Visit <a href="https://{WEBSITE_DOMAIN}/yourspotify/">Your Spotify</a> to get started!</p>
+            <br><p>Best regards,<br>Babasanmi Adeyemi</p>""",
+    )
+
+
+def _decide_access_request(item, new_status, now):
+    """Set one request's status, conditioned on the status it was read with.
+
+    Re-reads and retries if the status changed in between. Returns the
+    request as it was just before the write, None if it no longer exists,
+    or False if it kept changing.
+    """
+    storage = _get_storage()
+    key = {"request_id": item["request_id"]}
+    for _attempt in range(3):
+        if "status" in item:
+            condition = ("=", "status", item["status"])
+        else:
+            condition = ("and", ("exists", "request_id"), ("missing", "status"))
+        try:
+            return storage.update(
+                "access_requests", key,
+                changes={"status": new_status, f"{new_status}_at": now},
+                condition=condition, return_old=True,
+            )
+        except ConditionFailed:
+            item = storage.get("access_requests", key, consistent=True)
+            if item is None:
+                return None
+    return False
+
+
+def _apply_single_decision(event, new_status):
+    """Apply one decision to one access request (owner only).
+
+    Body: {"request_id": ...}. The update is conditioned on the status the
+    request was read with (see _decide_access_request); a request deleted in
+    between is a 404 and one that kept changing a 409.
+    """
+    user_id, err = _require_auth(event)
+    if err:
+        return err
+    if not _is_owner_user_id(user_id):
+        return _json_response(403, {"error": "Admin access required"})
+
+    try:
+        body = json.loads(event.get("body") or "{}")
+    except (json.JSONDecodeError, TypeError):
+        return _json_response(400, {"error": "Invalid JSON body"})
+
+    request_id = body.get("request_id")
+    if not request_id:
+        return _json_response(400, {"error": "request_id is required"})
+
+    try:
+        item = _get_storage().get("access_requests", {"request_id": request_id}, ("request_id", "status"))
+        old = _decide_access_request(item, new_status, int(time.time())) if item else None
+        if old is None:
+            return _json_response(404, {"error": "Request not found"})
+        if old is False:
+            return _json_response(409, {"error": "Request was changed concurrently; try again"})
+        _record_status_change(old.get("status", "pending"), new_status)
+
+        # Queue approval email to user
+        email = _approval_email(old) if new_status == "approved" else None
+        if email and _queue_email(*email, dedupe_key=f"approved#{request_id}"):
+            _trigger_outbox_drain()
+
+        return _json_response(200, {"message": f"Request {new_status}", "request_id": request_id})
+    except Exception as e:
+        return _json_response(500, {"error": str(e)})
+
+
+def handle_admin_approve_request(event):
+    """Approve an access request and notify user (owner only)."""
+    return _apply_single_decision(event, "approved")
+
+
+def handle_admin_reject_request(event):
+    """Reject an access request (owner only)."""
+    return _apply_single_decision(event, "rejected")
+
+
+def _apply_bulk_decision(event, new_status):
+    """Apply one decision to many access requests (owner only).
+
+    Body: {"request_ids": [...]} (max ADMIN_PAGE_SIZE_MAX). Items are loaded
+    in batches, then each is updated conditioned on the status it was read
+    with; counter deltas come from the replaced items and are merged into
+    one ADD, and approval emails are queued in the outbox.
+    """
+    user_id, err = _require_auth(event)
+    if err:
+        return err
+    if not _is_owner_user_id(user_id):
+        return _json_response(403, {"error": "Admin access required"})
+
+    try:
+        body = json.loads(event.get("body") or "{}")
+    except (json.JSONDecodeError, TypeError):
+        return _json_response(400, {"error": "Invalid JSON body"})
+
+    request_ids = body.get("request_ids")
+    if not request_ids or not isinstance(request_ids, list):
+        return _json_response(400, {"error": "request_ids must be a non-empty list"})
+    if len(request_ids) > ADMIN_PAGE_SIZE_MAX:
+        return _json_response(400, {"error": f"At most {ADMIN_PAGE_SIZE_MAX} request_ids per call"})
+
+    try:
+        items = list(_get_storage().batch_get(
+            "access_requests", [{"request_id": rid} for rid in request_ids],
+        ))
+        now = int(time.time())
+        updated = {}
+        conflicts = []
+        if items:
+            with ThreadPoolExecutor(max_workers=min(8, len(items))) as pool:
+                for item, old in zip(items, pool.map(
+                    lambda item: _decide_access_request(item, new_status, now), items,
+                )):
+                    if old is False:
+                        conflicts.append(item["request_id"])
+                    elif old is not None:
+                        updated[item["request_id"]] = old
+
+        deltas = {}
+        emails = []
+        for old in updated.values():
+            old_status = old.get("status", "pending")
+            if old_status != new_status:
+                deltas[f"status#{old_status}"] = deltas.get(f"status#{old_status}", 0) - 1
+                deltas[f"status#{new_status}"] = deltas.get(f"status#{new_status}", 0) + 1
+            if new_status == "approved":
+                email = _approval_email(old)
+                if email:
+                    emails.append((email, old["request_id"]))
+        _adjust_access_counts(deltas)
+
+        queued = sum(
+            1 for email, rid in emails
+            if _queue_email(*email, dedupe_key=f"approved#{rid}")
+        )
+        if queued:
+            _trigger_outbox_drain()
+
+        return _json_response(200, {
+            "message": f"{len(updated)} request(s) {new_status}",
+            "updated": sorted(updated),
+            "not_found": [rid for rid in request_ids if rid not in updated and rid not in conflicts],
+            "conflicts": sorted(conflicts),
+            "emails_queued": queued,
+        })
+    except Exception as e:
+        return _json_response(500, {"error": str(e)})
+
+
+def handle_admin_bulk_approve(event):
+    """Approve many access requests and notify the users (owner only)."""
+    return _apply_bulk_decision(event, "approved")
+
+
+def handle_admin_bulk_reject(event):
+    """Reject many access requests (owner only)."""
+    return _apply_bulk_decision(event, "rejected")
@@ -0,0 +1,246 @@
+"""Auth routes: Spotify OAuth login and callback, logout, status and policy
+acknowledgement.
+"""
+import base64
+import secrets
+import time
+import uuid
+import urllib.parse
+from concurrent.futures import ThreadPoolExecutor
+
+from .core import (
+    OWNER_SESSION_MAX_AGE, POLICY_VERSION, SESSION_MAX_AGE, SPOTIFY_ACCOUNTS_BASE,
+    SPOTIFY_API_BASE, SPOTIFY_REDIRECT_URI, SPOTIFY_SCOPES, WEBSITE_DOMAIN, _clear_session_cookie,
+    _create_session, _delete_session, _emit_metrics, _encrypt_token, _generate_pkce,
+    _get_and_delete_auth_state, _get_cookie_header, _get_spotify_app_credentials, _get_storage,
+    _get_user_from_event, _http_request, _invoke_async, _is_owner_spotify_id, _is_owner_user_id,
+    _json_response, _make_session_cookie, _parse_cookies, _put_auth_state, _put_encrypted_token,
+    _redirect, _require_auth,
+)
+from .country_stats import _try_update_country_contribution
+from .storage import ConditionFailed
+
+
+# ─── User Helpers ────────────────────────────────────────────────────────────
+# Users created from now on get a deterministic id derived from their Spotify
+# id, so a returning user is found and updated with a single write.
+USER_ID_NAMESPACE = uuid.UUID("6f1c2b57-3d0e-4a8f-9c61-2e5b7d4a9f03")
+
+
+def _user_id_for_spotify_id(spotify_user_id):
+    return str(uuid.uuid5(USER_ID_NAMESPACE, spotify_user_id))
+
+
+def _update_user_profile(user_id, display_name, email, country, now, must_exist=False):
+    """Update profile fields; raises ConditionFailed if must_exist and absent."""
+    changes = {"display_name": display_name, "email": email, "updated_at": now}
+    if country:
+        changes["country"] = country
+    old = _get_storage().update(
+        "users", {"user_id": user_id}, changes=changes,
+        condition=("exists", "user_id") if must_exist else None,
+        return_old=True,
+    )
+    if country and country != old.get("country"):
+        _try_update_country_contribution(user_id, country=country)
+
+
+def _find_or_create_user(spotify_user_id, display_name, email, country=""):
+    """Upsert the user for a Spotify account. Returns user_id.
+
+    Tries a conditional update on the deterministic id first, which is the
+    only write a returning user costs. When that item does not exist the GSI
+    is consulted for a legacy (random-id) user, which is then updated; only
+    a new user goes on to the conditional put.
+    """
+    storage = _get_storage()
+    now = int(time.time())
+    user_id = _user_id_for_spotify_id(spotify_user_id)
+    try:
+        _update_user_profile(user_id, display_name, email, country, now, must_exist=True)
+        return user_id
+    except ConditionFailed:
+        pass
+
+    items, _ = storage.query("users", spotify_user_id, index="spotify-user-id-index", attributes=("user_id",))
+    if items:
+        legacy_id = items[0]["user_id"]
+        _update_user_profile(legacy_id, display_name, email, country, now)
+        return legacy_id
+
+    item = {
+        "user_id": user_id,
+        "spotify_user_id": spotify_user_id,
+        "display_name": display_name,
+        "email": email,
+        "policy_acknowledged": POLICY_VERSION,
+        "created_at": now,
+        "updated_at": now,
+    }
+    if country:
+        item["country"] = country
+    try:
+        storage.put("users", item, condition=("missing", "user_id"))
+    except ConditionFailed:
+        # A concurrent login created it first
+        _update_user_profile(user_id, display_name, email, country, now)
+        return user_id
+    if country:
+        _try_update_country_contribution(user_id, country=country)
+    return user_id
+
+
+# ─── Auth Route Handlers ────────────────────────────────────────────────────
+def handle_login(event):
+    """Start Spotify OAuth Authorization Code + PKCE flow."""
+    client_id, _ = _get_spotify_app_credentials()
+    state = secrets.token_urlsafe(32)
+    verifier, challenge = _generate_pkce()
+
+    _put_auth_state(state, verifier)
+
+    params = urllib.parse.urlencode({
+        "client_id": client_id,
+        "response_type": "code",
+        "redirect_uri": SPOTIFY_REDIRECT_URI,
+        "scope": SPOTIFY_SCOPES,
+        "state": state,
+        "code_challenge_method": "S256",
+        "code_challenge": challenge,
+    })
+    return _redirect(f"{SPOTIFY_ACCOUNTS_BASE}/authorize?{params}")
+
+
+def handle_callback(event):
+    """Handle Spotify OAuth callback — exchange code for tokens, create session."""
+    qs = event.get("queryStringParameters") or {}
+    code = qs.get("code")
+    state = qs.get("state")
+    error = qs.get("error")
+
+    if error:
+        return _redirect(f"https://{WEBSITE_DOMAIN}/yourspotify/?error=access_denied")
+    if not code or not state:
+        return _redirect(f"https://{WEBSITE_DOMAIN}/yourspotify/?error=missing_params")
+
+    started = time.monotonic()
+    pool = ThreadPoolExecutor(max_workers=3)
+    try:
+        # Validate state and get PKCE verifier (one-time use); the app
+        # credentials load alongside when the cache is cold
+        credentials = pool.submit(_get_spotify_app_credentials)
+        verifier = _get_and_delete_auth_state(state)
+        if not verifier:
+            return _redirect(f"https://{WEBSITE_DOMAIN}/yourspotify/?error=invalid_state")
+
+        # Exchange authorization code for tokens
+        client_id, client_secret = credentials.result()
+        auth_b64 = base64.b64encode(f"{client_id}:{client_secret}".encode()).decode()
+
+        result = _http_request(
+            f"{SPOTIFY_ACCOUNTS_BASE}/api/token",
+            headers={
+                "Authorization": f"Basic {auth_b64}",
+                "Content-Type": "application/x-www-form-urlencoded",
+            },
+            data={
+                "grant_type": "authorization_code",
+                "code": code,
+                "redirect_uri": SPOTIFY_REDIRECT_URI,
+                "code_verifier": verifier,
+            },
+            method="POST",
+        )
+        if result["status"] != 200:
+            return _redirect(f"https://{WEBSITE_DOMAIN}/yourspotify/?error=token_exchange_failed")
+
+        tokens = result["body"]
+        access_token = tokens["access_token"]
+        refresh_token = tokens.get("refresh_token")
+        if not refresh_token:
+            return _redirect(f"https://{WEBSITE_DOMAIN}/yourspotify/?error=no_refresh_token")
+
+        # Get Spotify user profile
+        profile = _http_request(
+            f"{SPOTIFY_API_BASE}/v1/me",
+            headers={"Authorization": f"Bearer {access_token}"},
+        )
+        if profile["status"] != 200:
+            return _redirect(f"https://{WEBSITE_DOMAIN}/yourspotify/?error=profile_failed")
+
+        spotify_user_id = profile["body"]["id"]
+        display_name = profile["body"].get("display_name", "")
+        email = profile["body"].get("email", "")
+        country = profile["body"].get("country", "")
+
+        # Owner gets permanent session; regular users get standard session
+        is_owner = _is_owner_spotify_id(spotify_user_id)
+        max_age = OWNER_SESSION_MAX_AGE if is_owner else SESSION_MAX_AGE
+
+        # Resolve the user (legacy users keep their random id) while KMS
+        # encrypts the refresh token, then write the token and the session
+        # concurrently under that id, so neither is left without a user item
+        upsert = pool.submit(_find_or_create_user, spotify_user_id, display_name, email, country)
+        encrypted = pool.submit(_encrypt_token, refresh_token)
+        user_id = upsert.result()
+        stored = pool.submit(_put_encrypted_token, user_id, encrypted.result())
+        session = pool.submit(_create_session, user_id, max_age)
+        stored.result()
+        session_id = session.result()
+    finally:
+        # An early return (e.g. invalid_state) does not wait for a cold
+        # credentials load; it completes in the background and fills the cache
+        pool.shutdown(wait=False)
+    cookie = _make_session_cookie(session_id, max_age=max_age)
+
+    # Fill the insight caches off the redirect path
+    _invoke_async("insights.prewarm", user_id=user_id, owner=is_owner)
+
+    _emit_metrics({
+        "CallbackLatency": (round((time.monotonic() - started) * 1000, 1), "Milliseconds"),
+    }, Route="callback")
+
+    # Owner goes to My Spotify; regular users go to Your Spotify
+    redirect_path = "/myspotify/" if is_owner else "/yourspotify/"
+    return _redirect(f"https://{WEBSITE_DOMAIN}{redirect_path}", cookie)
+
+
+def handle_logout(event):
+    """Destroy session and clear cookie."""
+    cookies = _parse_cookies(_get_cookie_header(event))
+    _delete_session(cookies.get("session_id"))
+    return _redirect(f"https://{WEBSITE_DOMAIN}/yourspotify/", _clear_session_cookie())
+
+
+def handle_auth_status(event):
+    """Check if user is logged in. Returns profile info, owner flag, policy status."""
+    user_id = _get_user_from_event(event)
+    if not user_id:
+        return _json_response(200, {"logged_in": False})
+
+    user = _get_storage().get("users", {"user_id": user_id}, ("display_name", "policy_acknowledged")) or {}
+    is_owner = _is_owner_user_id(user_id)
+
+    # Check if privacy policy has been updated since user last acknowledged
+    user_policy = user.get("policy_acknowledged", "")
+    policy_updated = bool(user_policy and user_policy != POLICY_VERSION)
+
+    return _json_response(200, {
+        "logged_in": True,
+        "display_name": user.get("display_name", ""),
+        "is_owner": is_owner,
+        "policy_updated": policy_updated,
+        "policy_version": POLICY_VERSION,
+    })
+
+
+def handle_acknowledge_policy(event):
+    """User acknowledges updated privacy policy."""
+    user_id, err = _require_auth(event)
+    if err:
+        return err
+    _get_storage().update(
+        "users", {"user_id": user_id},
+        changes={"policy_acknowledged": POLICY_VERSION, "updated_at": int(time.time())},
+    )
+    return _json_response(200, {"message": "Policy acknowledged", "policy_version": POLICY_VERSION})
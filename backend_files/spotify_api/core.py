@@ -0,0 +1,1142 @@
+"""Shared configuration, AWS clients, storage and HTTP helpers, sessions,
+caching and response plumbing used by every route module.
+"""
+import json
+import os
+import base64
+import hashlib
+import secrets
+import time
+import gzip
+import threading
+import zlib
+from collections import OrderedDict
+from contextlib import contextmanager
+from decimal import Decimal
+
+from .storage import ConditionFailed, _open_storage
+
+try:
+    import brotli  # Optional (not in the Lambda runtime): enables Content-Encoding: br
+except ImportError:
+    brotli = None
+
+
+# ─── Configuration ───────────────────────────────────────────────────────────
+REGION = os.environ.get("AWS_REGION", "us-east-1")
+S3_BUCKET = os.environ.get("S3_BUCKET_NAME")
+SECRET_NAME = os.environ.get("SECRET_NAME")
+KMS_KEY_ID = os.environ.get("KMS_KEY_ID")
+USERS_TABLE = os.environ.get("USERS_TABLE")
+TOKENS_TABLE = os.environ.get("TOKENS_TABLE")
+SESSIONS_TABLE = os.environ.get("SESSIONS_TABLE")
+INSIGHTS_TABLE = os.environ.get("INSIGHTS_TABLE")
+WEBSITE_DOMAIN = os.environ.get("WEBSITE_DOMAIN")
+SPOTIFY_REDIRECT_URI = os.environ.get("SPOTIFY_REDIRECT_URI")
+
+OWNER_SPOTIFY_USER_ID = os.environ.get("OWNER_SPOTIFY_USER_ID", "")
+POLICY_VERSION = os.environ.get("POLICY_VERSION", "2026-02-27")
+ACCESS_REQUESTS_TABLE = os.environ.get("ACCESS_REQUESTS_TABLE")
+PLAY_HISTORY_TABLE = os.environ.get("PLAY_HISTORY_TABLE")
+ADMIN_EMAIL = os.environ.get("ADMIN_EMAIL", "")
+SES_FROM_EMAIL = os.environ.get("SES_FROM_EMAIL", "")
+EMAIL_OUTBOX_TABLE = os.environ.get("EMAIL_OUTBOX_TABLE")
+EMAIL_SINK = os.environ.get("EMAIL_SINK", "ses")   # "memory" keeps sent mail in-process (local tests)
+
+# "dynamodb" in production; "memory" or "sqlite" run the handlers locally (see storage.py)
+STORAGE_BACKEND = os.environ.get("STORAGE_BACKEND", "dynamodb")
+STORAGE_SQLITE_PATH = os.environ.get("STORAGE_SQLITE_PATH", "spotify_api.sqlite3")
+# Refresh tokens are KMS-encrypted in production. "plain" stores them marked
+# but unencrypted, so the local backends run without KMS.
+TOKEN_CODEC = os.environ.get("TOKEN_CODEC", "kms" if STORAGE_BACKEND == "dynamodb" else "plain")
+PLAIN_TOKEN_PREFIX = "plain:"
+# When both are set they replace the SECRET_NAME lookup (local runs)
+SPOTIFY_CLIENT_ID = os.environ.get("SPOTIFY_CLIENT_ID")
+SPOTIFY_CLIENT_SECRET = os.environ.get("SPOTIFY_CLIENT_SECRET")
+STORAGE_TABLE_NAMES = {
+    "users": USERS_TABLE,
+    "tokens": TOKENS_TABLE,
+    "sessions": SESSIONS_TABLE,
+    "insights": INSIGHTS_TABLE,
+    "access_requests": ACCESS_REQUESTS_TABLE,
+    "play_history": PLAY_HISTORY_TABLE,
+    "email_outbox": EMAIL_OUTBOX_TABLE,
+}
+DYNAMODB_SCAN_SEGMENTS = int(os.environ.get("DYNAMODB_SCAN_SEGMENTS", "4"))  # full-table scans
+
+SPOTIFY_SCOPES = "user-read-recently-played user-top-read user-read-email user-read-private playlist-modify-public"
+SESSION_MAX_AGE = 86400           # 24 hours (regular users)
+OWNER_SESSION_MAX_AGE = 31536000  # 365 days (owner)
+AUTH_STATE_TTL = 600              # 10 minutes
+INSIGHT_CACHE_TTL = 3600          # 1 hour
+SNAPSHOT_BUILD_LOCK_TTL = 10      # a build lock lapses this long after its holder stops renewing it
+BUILD_WAIT_MAX = 20               # longest a request waits on another build (API Gateway cuts off at 29s)
+ADMIN_PAGE_SIZE = 50              # default page size for admin request listing
+ADMIN_PAGE_SIZE_MAX = 100         # also the max request_ids per bulk decision
+COUNTRY_STATS_S3_KEY = "data/country_stats.json"
+
+# Overridable so local runs and benchmarks can target tools/fake_spotify.py
+SPOTIFY_API_BASE = os.environ.get("SPOTIFY_API_BASE", "https://api.spotify.com").rstrip("/")
+SPOTIFY_ACCOUNTS_BASE = os.environ.get("SPOTIFY_ACCOUNTS_BASE", "https://accounts.spotify.com").rstrip("/")
+METRICS_NAMESPACE = os.environ.get("METRICS_NAMESPACE", "PortfolioSpotify")
+
+# App-wide Spotify request budget, shared by every container via a DynamoDB
+# counter item per time window. Scheduled work may only use part of a window
+# so interactive traffic always has headroom.
+SPOTIFY_BUDGET_WINDOW = int(os.environ.get("SPOTIFY_BUDGET_WINDOW", "30"))         # seconds
+SPOTIFY_BUDGET_PER_WINDOW = int(os.environ.get("SPOTIFY_BUDGET_PER_WINDOW", "150"))
+SPOTIFY_BUDGET_SCHEDULED_SHARE = 0.6
+SPOTIFY_BUDGET_LEASE_SIZE = 10    # calls pre-allocated per DynamoDB write
+SPOTIFY_BUDGET_MAX_WAIT = {"interactive": 5, "scheduled": 90}  # seconds
+
+# Items in INSIGHTS_TABLE that are app-wide rather than per user
+GLOBAL_PARTITION = "__global__"
+
+
+# ─── AWS Clients (module-level for warm-start reuse) ─────────────────────────
+# boto3 is imported on first use: it is the bulk of cold-start import time.
+_s3 = None
+_storage = None
+_kms = None
+_sm = None
+
+
+def _get_s3():
+    global _s3
+    if _s3 is None:
+        import boto3
+        _s3 = boto3.client("s3", region_name=REGION)
+    return _s3
+
+
+def _get_storage():
+    """The STORAGE_BACKEND every table is read and written through."""
+    global _storage
+    if _storage is None:
+        _storage = _open_storage(STORAGE_BACKEND, STORAGE_TABLE_NAMES, REGION, STORAGE_SQLITE_PATH)
+    return _storage
+
+
+def _get_kms():
+    global _kms
+    if _kms is None:
+        import boto3
+        _kms = boto3.client("kms", region_name=REGION)
+    return _kms
+
+
+def _get_sm():
+    global _sm
+    if _sm is None:
+        import boto3
+        _sm = boto3.client("secretsmanager", region_name=REGION)
+    return _sm
+
+
+_ses = None
+
+
+def _get_ses():
+    global _ses
+    if _ses is None:
+        import boto3
+        _ses = boto3.client("ses", region_name=REGION)
+    return _ses
+
+
+_lambda = None
+
+
+def _get_lambda():
+    global _lambda
+    if _lambda is None:
+        import boto3
+        _lambda = boto3.client("lambda", region_name=REGION)
+    return _lambda
+
+
+def _invoke_async(source, **payload):
+    """Fire-and-forget self-invocation of a TASKS handler.
+
+    Returns False when the task could not be dispatched (not running on
+    Lambda, or the invoke failed) so the caller can fall back.
+    """
+    function_name = os.environ.get("AWS_LAMBDA_FUNCTION_NAME")
+    if not function_name:
+        return False
+    try:
+        _get_lambda().invoke(
+            FunctionName=function_name,
+            InvocationType="Event",
+            Payload=json.dumps({"source": source, **payload}).encode("utf-8"),
+        )
+        return True
+    except Exception:
+        return False
+
+
+# ─── Metrics ─────────────────────────────────────────────────────────────────
+def _emit_metrics(metrics, **dimensions):
+    """Emit metrics as a CloudWatch Embedded Metric Format log line.
+
+    metrics maps name -> (value, unit). Dimensions are passed as keyword args.
+    """
+    if not metrics:
+        return
+    record = {
+        "_aws": {
+            "Timestamp": int(time.time() * 1000),
+            "CloudWatchMetrics": [{
+                "Namespace": METRICS_NAMESPACE,
+                "Dimensions": [sorted(dimensions)],
+                "Metrics": [{"Name": name, "Unit": unit} for name, (_, unit) in metrics.items()],
+            }],
+        },
+    }
+    record.update(dimensions)
+    for name, (value, _unit) in metrics.items():
+        record[name] = value
+    print(json.dumps(record))
+
+
+# ─── Spotify Request Budget ──────────────────────────────────────────────────
+# Priority of the current invocation ("interactive" or "scheduled"), set by lambda_handler
+_request_priority = "interactive"
+
+
+
+def _set_request_priority(priority):
+    global _request_priority
+    _request_priority = priority
+
+
+_budget_lock = threading.Lock()
+_budget_lease = {"window": None, "tokens": 0}
+_budget_stats = {"admitted": 0, "leases": 0, "rejected": 0, "wait_ms": 0}
+
+
+def _lease_spotify_budget(window, size, cap):
+    """Atomically reserve `size` calls in the shared counter for `window`.
+
+    Returns False when the window's cap (for the caller's priority) is used up.
+    """
+    try:
+        _get_storage().update(
+            "insights", {"user_id": GLOBAL_PARTITION, "insight_key": f"budget#{window}"},
+            increments={"used": size},
+            defaults={"expires_at": window + 2 * SPOTIFY_BUDGET_WINDOW},
+            condition=("or", ("missing", "used"), ("<=", "used", cap - size)),
+        )
+        return True
+    except ConditionFailed:
+        return False
+
+
+def _acquire_spotify_budget():
+    """Admit one Spotify Web API call against the app-wide budget.
+
+    Calls are served from a local lease of pre-allocated tokens; only when the
+    lease is empty does the container reserve another block in storage. When
+    the window is exhausted the caller waits for the next window, up to a
+    priority-dependent limit. Returns False if the call should not be made.
+    Fails open if the shared counter is unavailable.
+    """
+    priority = _request_priority
+    cap = SPOTIFY_BUDGET_PER_WINDOW
+    if priority != "interactive":
+        cap = int(SPOTIFY_BUDGET_PER_WINDOW * SPOTIFY_BUDGET_SCHEDULED_SHARE)
+    started = time.time()
+    deadline = started + SPOTIFY_BUDGET_MAX_WAIT.get(priority, 5)
+
+    while True:
+        now = time.time()
+        window = int(now) - int(now) % SPOTIFY_BUDGET_WINDOW
+        with _budget_lock:
+            if _budget_lease["window"] == window and _budget_lease["tokens"] > 0:
+                _budget_lease["tokens"] -= 1
+                admitted = True
+            else:
+                admitted = False
+                try:
+                    for size in (SPOTIFY_BUDGET_LEASE_SIZE, 1):
+                        if _lease_spotify_budget(window, size, cap):
+                            _budget_lease["window"] = window
+                            _budget_lease["tokens"] = size - 1
+                            _budget_stats["leases"] += 1
+                            admitted = True
+                            break
+                except Exception:
+                    admitted = True  # Shared counter unavailable — fail open
+            if admitted:
+                _budget_stats["admitted"] += 1
+                _budget_stats["wait_ms"] += int((now - started) * 1000)
+                return True
+
+        if now >= deadline:
+            with _budget_lock:
+                _budget_stats["rejected"] += 1
+                _budget_stats["wait_ms"] += int((now - started) * 1000)
+            return False
+        next_window = window + SPOTIFY_BUDGET_WINDOW
+        time.sleep(max(0.05, min(next_window - now, deadline - now)))
+
+
+def _flush_budget_metrics():
+    """Publish and reset this invocation's budget admission counters."""
+    with _budget_lock:
+        stats = dict(_budget_stats)
+        for k in _budget_stats:
+            _budget_stats[k] = 0
+    if not (stats["admitted"] or stats["rejected"]):
+        return
+    _emit_metrics({
+        "SpotifyBudgetAdmitted": (stats["admitted"], "Count"),
+        "SpotifyBudgetRejected": (stats["rejected"], "Count"),
+        "SpotifyBudgetLeases": (stats["leases"], "Count"),
+        "SpotifyBudgetWaitTime": (stats["wait_ms"], "Milliseconds"),
+    }, Priority=_request_priority)
+
+
+# ─── HTTP Helper ─────────────────────────────────────────────────────────────
+# While a prewarm runs, successful Spotify GETs are remembered per
+# (Authorization, url) so later stages reuse the same raw response.
+_shared_responses = None
+
+
+def _http_request(url, headers=None, data=None, method="GET"):
+    """Make an HTTP request using urllib (no external dependencies).
+
+    Spotify Web API calls are admitted through the shared request budget; a
+    rejected call returns a synthetic 429 like Spotify's own rate limiter.
+    """
+    web_api = url.startswith(f"{SPOTIFY_API_BASE}/v1/")
+    shared = _shared_responses if method == "GET" and web_api else None
+    if shared is not None:
+        shared_key = ((headers or {}).get("Authorization"), url)
+        if shared_key in shared:
+            return shared[shared_key]
+    if web_api and not _acquire_spotify_budget():
+        return {"status": 429, "body": "Spotify request budget exhausted"}
+    import urllib.error
+    import urllib.parse
+    import urllib.request  # pulls in http.client/ssl; deferred out of cold start
+
+    if data and isinstance(data, dict):
+        data = urllib.parse.urlencode(data).encode("utf-8")
+    req = urllib.request.Request(url, data=data, headers=headers or {}, method=method)
+    try:
+        with urllib.request.urlopen(req) as response:
+            body = response.read().decode("utf-8")
+            result = {"status": response.status, "body": json.loads(body)}
+    except urllib.error.HTTPError as e:
+        body = e.read().decode("utf-8")
+        return {"status": e.code, "body": body}
+    if shared is not None:
+        shared[shared_key] = result
+    return result
+
+
+@contextmanager
+def _sharing_spotify_responses():
+    """Share successful Spotify GET responses for the duration of the block."""
+    global _shared_responses
+    _shared_responses = {}
+    try:
+        yield
+    finally:
+        _shared_responses = None
+
+
+# ─── Spotify App Credentials ────────────────────────────────────────────────
+SPOTIFY_CREDENTIALS_TTL = 3600  # Warm containers re-read the secret hourly (rotation)
+_spotify_credentials_cache = {"value": None, "loaded_at": 0}
+
+
+def _get_spotify_app_credentials():
+    """Retrieve Spotify client_id and client_secret from Secrets Manager (cached).
+
+    SPOTIFY_CLIENT_ID / SPOTIFY_CLIENT_SECRET take precedence when both are set.
+    """
+    if SPOTIFY_CLIENT_ID and SPOTIFY_CLIENT_SECRET:
+        return SPOTIFY_CLIENT_ID, SPOTIFY_CLIENT_SECRET
+    now = time.time()
+    if _spotify_credentials_cache["value"] and now - _spotify_credentials_cache["loaded_at"] < SPOTIFY_CREDENTIALS_TTL:
+        return _spotify_credentials_cache["value"]
+    sm = _get_sm()
+    resp = sm.get_secret_value(SecretId=SECRET_NAME)
+    raw = resp.get("SecretString") or base64.b64decode(resp["SecretBinary"]).decode()
+    creds = json.loads(raw)
+    value = (creds["SPOTIFY_CLIENT_ID"], creds["SPOTIFY_CLIENT_SECRET"])
+    _spotify_credentials_cache.update(value=value, loaded_at=now)
+    return value
+
+
+def _get_client_token(client_id, client_secret):
+    """Get a Client Credentials token for public endpoints."""
+    auth_b64 = base64.b64encode(f"{client_id}:{client_secret}".encode()).decode()
+    result = _http_request(
+        f"{SPOTIFY_ACCOUNTS_BASE}/api/token",
+        headers={
+            "Authorization": f"Basic {auth_b64}",
+            "Content-Type": "application/x-www-form-urlencoded",
+        },
+        data={"grant_type": "client_credentials"},
+        method="POST",
+    )
+    if result["status"] != 200:
+        raise RuntimeError(f"Client Credentials auth failed: {result['body']}")
+    return result["body"]["access_token"]
+
+
+# ─── PKCE Helpers ────────────────────────────────────────────────────────────
+def _generate_pkce():
+    """Generate PKCE code_verifier and code_challenge (S256)."""
+    verifier = secrets.token_urlsafe(64)[:128]
+    challenge = base64.urlsafe_b64encode(
+        hashlib.sha256(verifier.encode("ascii")).digest()
+    ).rstrip(b"=").decode("ascii")
+    return verifier, challenge
+
+
+# ─── KMS Helpers ─────────────────────────────────────────────────────────────
+def _encrypt_token(plaintext):
+    """Encrypt a string with KMS envelope encryption (TOKEN_CODEC "kms")."""
+    if TOKEN_CODEC == "plain":
+        return PLAIN_TOKEN_PREFIX + plaintext
+    kms = _get_kms()
+    resp = kms.encrypt(KeyId=KMS_KEY_ID, Plaintext=plaintext.encode("utf-8"))
+    return base64.b64encode(resp["CiphertextBlob"]).decode("ascii")
+
+
+def _decrypt_token(ciphertext_b64):
+    """Decrypt a string from _encrypt_token."""
+    if TOKEN_CODEC == "plain" and ciphertext_b64.startswith(PLAIN_TOKEN_PREFIX):
+        return ciphertext_b64[len(PLAIN_TOKEN_PREFIX):]
+    kms = _get_kms()
+    resp = kms.decrypt(CiphertextBlob=base64.b64decode(ciphertext_b64))
+    return resp["Plaintext"].decode("utf-8")
+
+
+# ─── Cookie Helpers ──────────────────────────────────────────────────────────
+def _parse_cookies(cookie_header):
+    """Parse a Cookie header string into a dict."""
+    cookies = {}
+    if not cookie_header:
+        return cookies
+    for part in cookie_header.split(";"):
+        part = part.strip()
+        if "=" in part:
+            k, v = part.split("=", 1)
+            cookies[k.strip()] = v.strip()
+    return cookies
+
+
+def _make_session_cookie(session_id, max_age=SESSION_MAX_AGE):
+    """Create a Set-Cookie header value with security flags."""
+    return (
+        f"session_id={session_id}; "
+        f"HttpOnly; Secure; SameSite=Lax; "
+        f"Path=/; Max-Age={max_age}; "
+        f"Domain={WEBSITE_DOMAIN}"
+    )
+
+
+def _clear_session_cookie():
+    """Create a Set-Cookie header to expire the session cookie."""
+    return (
+        f"session_id=; HttpOnly; Secure; SameSite=Lax; "
+        f"Path=/; Max-Age=0; "
+        f"Domain={WEBSITE_DOMAIN}"
+    )
+
+
+# ─── Session Helpers ─────────────────────────────────────────────────────────
+def _put_auth_state(state, code_verifier):
+    """Store an OAuth state + PKCE verifier with short TTL (10 min)."""
+    _get_storage().put("sessions", {
+        "session_id": f"auth#{state}",
+        "type": "auth_state",
+        "code_verifier": code_verifier,
+        "created_at": int(time.time()),
+        "expires_at": int(time.time()) + AUTH_STATE_TTL,
+    })
+
+
+def _get_and_delete_auth_state(state):
+    """Consume an OAuth state record. Returns code_verifier or None.
+
+    One delete returning the old item: the state is one-time use and two
+    concurrent callbacks cannot both read it.
+    """
+    item = _get_storage().delete("sessions", {"session_id": f"auth#{state}"}, return_old=True)
+    if not item or item.get("type") != "auth_state":
+        return None
+    if item.get("expires_at", 0) < int(time.time()):
+        return None
+    return item.get("code_verifier")
+
+
+def _create_session(user_id, max_age=SESSION_MAX_AGE):
+    """Create a new server session. Returns session_id."""
+    session_id = secrets.token_urlsafe(32)
+    now = int(time.time())
+    _get_storage().put("sessions", {
+        "session_id": session_id,
+        "type": "session",
+        "user_id": user_id,
+        "created_at": now,
+        "expires_at": now + max_age,
+    })
+    return session_id
+
+
+def _get_session(session_id):
+    """Get user_id from session. Returns None if expired or missing.
+    Auto-extends owner sessions on each access."""
+    if not session_id:
+        return None
+    storage = _get_storage()
+    item = storage.get("sessions", {"session_id": session_id}, ("type", "user_id", "expires_at"))
+    if not item or item.get("type") != "session":
+        return None
+    now = int(time.time())
+    if item.get("expires_at", 0) < now:
+        storage.delete("sessions", {"session_id": session_id})
+        return None
+    user_id = item.get("user_id")
+    # Auto-extend owner sessions on each access
+    if user_id and _is_owner_user_id(user_id):
+        remaining = item["expires_at"] - now
+        if remaining < OWNER_SESSION_MAX_AGE // 2:
+            storage.update(
+                "sessions", {"session_id": session_id},
+                changes={"expires_at": now + OWNER_SESSION_MAX_AGE},
+            )
+    return user_id
+
+
+def _delete_session(session_id):
+    """Delete a session record."""
+    if not session_id:
+        return
+    _get_storage().delete("sessions", {"session_id": session_id})
+
+
+# ─── Owner Helpers ───────────────────────────────────────────────────────────
+_owner_user_id_cache = None
+
+
+def _is_owner_spotify_id(spotify_user_id):
+    """Check if a Spotify user ID belongs to the site owner."""
+    return bool(OWNER_SPOTIFY_USER_ID) and spotify_user_id == OWNER_SPOTIFY_USER_ID
+
+
+def _is_owner_user_id(user_id):
+    """Check if an internal user_id belongs to the site owner."""
+    owner_uid = _get_owner_user_id()
+    return owner_uid is not None and user_id == owner_uid
+
+
+def _get_owner_user_id():
+    """Get the owner's internal user_id from their Spotify user ID (cached)."""
+    global _owner_user_id_cache
+    if _owner_user_id_cache is not None:
+        return _owner_user_id_cache
+    if not OWNER_SPOTIFY_USER_ID:
+        return None
+    items, _ = _get_storage().query(
+        "users", OWNER_SPOTIFY_USER_ID, index="spotify-user-id-index", attributes=("user_id",), limit=1,
+    )
+    if items:
+        _owner_user_id_cache = items[0]["user_id"]
+        return _owner_user_id_cache
+    return None
+
+
+# ─── Token Helpers ───────────────────────────────────────────────────────────
+def _store_encrypted_token(user_id, refresh_token):
+    """Encrypt and store a Spotify refresh token."""
+    _put_encrypted_token(user_id, _encrypt_token(refresh_token))
+
+
+def _put_encrypted_token(user_id, encrypted):
+    """Store a refresh token already encrypted with _encrypt_token."""
+    _get_storage().put("tokens", {
+        "user_id": user_id,
+        "encrypted_refresh_token": encrypted,
+        "updated_at": int(time.time()),
+    })
+
+
+def _get_user_access_token(user_id):
+    """Retrieve encrypted refresh token, decrypt, exchange for access token."""
+    item = _get_storage().get("tokens", {"user_id": user_id})
+    if not item:
+        return None
+
+    refresh_token = _decrypt_token(item["encrypted_refresh_token"])
+    client_id, client_secret = _get_spotify_app_credentials()
+
+    auth_b64 = base64.b64encode(f"{client_id}:{client_secret}".encode()).decode()
+    result = _http_request(
+        f"{SPOTIFY_ACCOUNTS_BASE}/api/token",
+        headers={
+            "Authorization": f"Basic {auth_b64}",
+            "Content-Type": "application/x-www-form-urlencoded",
+        },
+        data={"grant_type": "refresh_token", "refresh_token": refresh_token},
+        method="POST",
+    )
+    if result["status"] != 200:
+        raise RuntimeError(f"Token refresh failed: {result['body']}")
+
+    body = result["body"]
+    new_refresh = body.get("refresh_token")
+    if new_refresh and new_refresh != refresh_token:
+        _store_encrypted_token(user_id, new_refresh)
+
+    return body["access_token"]
+
+
+# ─── Insight Cache ───────────────────────────────────────────────────────────
+# Cached payloads (`data`, snapshot `view_*`) are stored zlib-compressed as
+# Binary and marked with payload_format. Older items hold a plain JSON string
+# (no marker) and are still read.
+PAYLOAD_FORMAT = "zlib-json/1"
+PAYLOAD_COMPRESSION_LEVEL = 6
+_payload_stats = {"items": 0, "raw_bytes": 0, "stored_bytes": 0}
+_payload_stats_lock = threading.Lock()
+
+
+def _pack_payload(body):
+    """Compress a serialized JSON body for storage and record its sizes."""
+    packed = zlib.compress(body.encode("utf-8"), PAYLOAD_COMPRESSION_LEVEL)
+    with _payload_stats_lock:
+        _payload_stats["items"] += 1
+        _payload_stats["raw_bytes"] += len(body)
+        _payload_stats["stored_bytes"] += len(packed)
+    return packed
+
+
+def _unpack_payload(item, attr="data"):
+    """Return the serialized JSON body stored in item[attr], or None."""
+    value = item.get(attr)
+    if value is None:
+        return None
+    if isinstance(value, str):
+        return value  # Legacy uncompressed item
+    fmt = item.get("payload_format", PAYLOAD_FORMAT)
+    if fmt != PAYLOAD_FORMAT:
+        raise ValueError(f"Unsupported payload format: {fmt}")
+    return zlib.decompress(getattr(value, "value", value)).decode("utf-8")
+
+
+def _stored_deflate(item, attr="data"):
+    """The stored compressed bytes of item[attr] (a valid HTTP deflate body), or None."""
+    value = item.get(attr)
+    if value is None or isinstance(value, str):
+        return None
+    return getattr(value, "value", value)
+
+
+def _flush_payload_metrics():
+    """Publish and reset this invocation's payload compression stats."""
+    with _payload_stats_lock:
+        stats = dict(_payload_stats)
+        for k in _payload_stats:
+            _payload_stats[k] = 0
+    if not stats["items"]:
+        return
+    _emit_metrics({
+        "PayloadsStored": (stats["items"], "Count"),
+        "PayloadRawBytes": (stats["raw_bytes"], "Bytes"),
+        "PayloadStoredBytes": (stats["stored_bytes"], "Bytes"),
+        "PayloadCompressionRatio": (round(stats["stored_bytes"] / stats["raw_bytes"], 3), "None"),
+    }, Table="insights")
+
+def _get_cached_insight(user_id, insight_type, wait_for_build=False, raw=False):
+    """Get cached insight data if still fresh.
+
+    With raw=True the stored JSON is returned unparsed as a _CachedJSON,
+    ready to be passed straight to _json_response.
+
+    With wait_for_build, a miss while a build of this insight (e.g. the login
+    prewarm) holds its build lock polls until it lands instead of repeating
+    the same Spotify calls.
+    """
+    item = _get_storage().get(
+        "insights", {"user_id": user_id, "insight_key": insight_type},
+        ("data", "payload_format", "content_hash", "expires_at"),
+    )
+    if not item or item.get("expires_at", 0) < int(time.time()):
+        if wait_for_build and _wait_for_build(user_id, insight_type):
+            return _get_cached_insight(user_id, insight_type, raw=raw)
+        return None
+    body = _unpack_payload(item) or "null"
+    if raw:
+        return _CachedJSON(body, item.get("content_hash"), _stored_deflate(item))
+    return json.loads(body)
+
+
+# Per-user build locks: concurrent misses wait for one build instead of racing.
+# `target` names what is being built — the insight snapshot or an insight key
+# such as "playlist_suggestions" — so unrelated builds don't wait on each other.
+# The item records its holder's token: only the holder renews or releases it,
+# and a holder that dies lets it lapse after SNAPSHOT_BUILD_LOCK_TTL.
+def _build_lock_key(user_id, target="snapshot"):
+    return {"user_id": user_id, "insight_key": f"build_lock#{target}"}
+
+
+_build_lock_renewals = {}  # owner token -> Event that stops its renewal
+
+
+def _acquire_build_lock(user_id, target="snapshot"):
+    """Claim a build lock. Returns its owner token, or None if another build holds it.
+
+    The lock is renewed in the background until _release_build_lock, so a
+    build that runs longer than SNAPSHOT_BUILD_LOCK_TTL keeps it.
+    """
+    key = _build_lock_key(user_id, target)
+    token = secrets.token_hex(16)
+    now = int(time.time())
+    try:
+        _get_storage().put(
+            "insights", {**key, "owner": token, "expires_at": now + SNAPSHOT_BUILD_LOCK_TTL},
+            condition=("or", ("missing", "insight_key"), ("<", "expires_at", now)),
+        )
+    except ConditionFailed:
+        return None
+    stop = _build_lock_renewals[token] = threading.Event()
+    threading.Thread(target=_renew_build_lock, args=(key, token, stop), daemon=True).start()
+    return token
+
+
+def _renew_build_lock(key, token, stop):
+    """Push the lock's expiry forward every half TTL until stopped or lost."""
+    while not stop.wait(SNAPSHOT_BUILD_LOCK_TTL / 2):
+        try:
+            _get_storage().update(
+                "insights", key,
+                changes={"expires_at": int(time.time()) + SNAPSHOT_BUILD_LOCK_TTL},
+                condition=("=", "owner", token),
+            )
+        except ConditionFailed:
+            return  # Lapsed and taken by another build
+        except Exception:
+            _emit_metrics({"BuildLockRenewalErrors": (1, "Count")})
+
+
+def _release_build_lock(user_id, token, target="snapshot"):
+    """Release a lock taken by _acquire_build_lock, if this holder still has it."""
+    stop = _build_lock_renewals.pop(token, None)
+    if stop is not None:
+        stop.set()
+    try:
+        _get_storage().delete("insights", _build_lock_key(user_id, target),
+                              condition=("=", "owner", token))
+    except ConditionFailed:
+        pass  # Lapsed and taken by another build; that one is theirs to release
+
+
+def _wait_for_build(user_id, target="snapshot"):
+    """Block while a build holds the lock, for at most BUILD_WAIT_MAX seconds.
+
+    True if one finished; False if none was running or it outlasted the wait.
+    """
+    waited = False
+    deadline = time.monotonic() + BUILD_WAIT_MAX
+    while True:
+        lock = _get_storage().get("insights", _build_lock_key(user_id, target), consistent=True)
+        if not lock or lock.get("expires_at", 0) < int(time.time()):
+            return waited
+        if time.monotonic() >= deadline:
+            return False
+        waited = True
+        time.sleep(0.25)
+
+
+# ─── Response Helpers ────────────────────────────────────────────────────────
+def _json_default(value):
+    """JSON-encode DynamoDB Decimals as int/float."""
+    if isinstance(value, Decimal):
+        return int(value) if value == value.to_integral_value() else float(value)
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+def _serialize_json(data):
+    return json.dumps(data, default=_json_default)
+
+
+def _content_hash(body):
+    """Stable hash of a serialized body (stored alongside cached payloads)."""
+    return hashlib.sha256(body.encode("utf-8")).hexdigest()[:32]
+
+
+class _CachedJSON:
+    """An already-serialized JSON body and its content hash.
+
+    Cache reads return this so a hit goes to the response without a
+    json.loads/json.dumps round trip; .data parses only when needed.
+    `deflated` is the zlib form as stored, reused for Content-Encoding: deflate.
+    """
+
+    __slots__ = ("body", "content_hash", "deflated")
+
+    def __init__(self, body, content_hash=None, deflated=None):
+        self.body = body
+        self.content_hash = content_hash or _content_hash(body)
+        self.deflated = deflated
+
+    @property
+    def data(self):
+        return json.loads(self.body)
+
+
+def _json_response(status, body, extra_headers=None):
+    """Return a JSON API response.
+
+    A _CachedJSON body is passed through as-is, with its stored hash as ETag.
+    """
+    h = {"Content-Type": "application/json", "Cache-Control": "no-store"}
+    if isinstance(body, _CachedJSON):
+        h["ETag"] = f'"{body.content_hash}"'
+        if body.deflated:
+            _remember_compressed((h["ETag"], "deflate"), body.deflated)
+    if extra_headers:
+        h.update(extra_headers)
+    if isinstance(body, _CachedJSON):
+        return {"statusCode": status, "headers": h, "body": body.body}
+    return {"statusCode": status, "headers": h, "body": _serialize_json(body)}
+
+
+# ─── Response Compression ────────────────────────────────────────────────────
+# Bodies above the threshold are compressed per Accept-Encoding. Compressed
+# forms are kept per (ETag, encoding), so a cached payload is compressed at
+# most once per container; cached payloads already stored zlib-compressed are
+# served as "deflate" with no compression work at all. Sizes and time are
+# totalled per encoding and published once per invocation.
+COMPRESSION_MIN_BYTES = 1024
+COMPRESSED_BODY_CACHE_MAX_ENTRIES = 64
+
+_compressed_bodies = OrderedDict()  # (etag, encoding) -> bytes
+_compression_stats = {}  # encoding -> this invocation's totals
+_compression_stats_lock = threading.Lock()
+
+
+def _remember_compressed(key, payload):
+    _compressed_bodies[key] = payload
+    _compressed_bodies.move_to_end(key)
+    while len(_compressed_bodies) > COMPRESSED_BODY_CACHE_MAX_ENTRIES:
+        _compressed_bodies.popitem(last=False)
+
+
+def _accepted_encodings(header):
+    """Encodings from an Accept-Encoding header, excluding q=0."""
+    accepted = set()
+    for part in header.split(","):
+        name, _, params = part.partition(";")
+        name = name.strip().lower()
+        params = params.strip()
+        try:
+            q = float(params[2:]) if params.startswith("q=") else 1.0
+        except ValueError:
+            q = 1.0
+        if name and q > 0:
+            accepted.add(name)
+    return accepted
+
+
+def _choose_encoding(accepted, etag):
+    if etag and "deflate" in accepted and (etag, "deflate") in _compressed_bodies:
+        return "deflate"
+    if brotli is not None and "br" in accepted:
+        return "br"
+    if "gzip" in accepted:
+        return "gzip"
+    return None
+
+
+def _compress_response(event, response):
+    """Compress a large response body per Accept-Encoding (base64 for API Gateway)."""
+    body = response.get("body")
+    if not body or response.get("isBase64Encoded"):
+        return response
+    raw = body.encode("utf-8")
+    headers = response.setdefault("headers", {})
+    if len(raw) < COMPRESSION_MIN_BYTES or "Content-Encoding" in headers:
+        return response
+    headers["Vary"] = "Accept-Encoding"
+    etag = headers.get("ETag")
+    encoding = _choose_encoding(
+        _accepted_encodings((event.get("headers") or {}).get("accept-encoding", "")), etag
+    )
+    if not encoding:
+        return response
+
+    started = time.monotonic()
+    payload = _compressed_bodies.get((etag, encoding)) if etag else None
+    if payload is None:
+        if encoding == "br":
+            payload = brotli.compress(raw, quality=5)
+        else:
+            payload = gzip.compress(raw, compresslevel=6, mtime=0)
+        if etag:
+            _remember_compressed((etag, encoding), payload)
+    elapsed_ms = (time.monotonic() - started) * 1000
+
+    headers["Content-Encoding"] = encoding
+    response["body"] = base64.b64encode(payload).decode("ascii")
+    response["isBase64Encoded"] = True
+    with _compression_stats_lock:
+        stats = _compression_stats.setdefault(
+            encoding, {"responses": 0, "raw_bytes": 0, "sent_bytes": 0, "time_ms": 0.0}
+        )
+        stats["responses"] += 1
+        stats["raw_bytes"] += len(raw)
+        stats["sent_bytes"] += len(payload)
+        stats["time_ms"] += elapsed_ms
+    return response
+
+
+def _flush_compression_metrics():
+    """Publish and reset this invocation's response compression totals."""
+    with _compression_stats_lock:
+        by_encoding = dict(_compression_stats)
+        _compression_stats.clear()
+    for encoding, stats in by_encoding.items():
+        _emit_metrics({
+            "ResponsesCompressed": (stats["responses"], "Count"),
+            "ResponseBytesRaw": (stats["raw_bytes"], "Bytes"),
+            "ResponseBytesSent": (stats["sent_bytes"], "Bytes"),
+            "ResponseCompressionTime": (round(stats["time_ms"], 2), "Milliseconds"),
+        }, Encoding=encoding)
+
+
+# ─── Response Projection ─────────────────────────────────────────────────────
+# ?fields=name,image keeps only those keys on each listed item and
+# ?image_size=small|medium|large|<px> swaps "image" for the smallest stored
+# variant at least that wide. Both are applied to the cached body, so a
+# projected response costs no upstream calls.
+IMAGE_SIZES = {"small": 64, "medium": 300, "large": 640}
+PROJECTED_LISTS = ("artists", "albums", "tracks", "genres")
+
+
+def _parse_projection(event):
+    """Return ((fields, min_width), error_response); (None, None) if not requested."""
+    qs = event.get("queryStringParameters") or {}
+    raw_fields = qs.get("fields", "")
+    raw_size = qs.get("image_size", "").strip().lower()
+    if not raw_fields and not raw_size:
+        return None, None
+    fields = frozenset(f.strip() for f in raw_fields.split(",") if f.strip()) or None
+    width = None
+    if raw_size:
+        width = IMAGE_SIZES.get(raw_size)
+        if width is None:
+            if not raw_size.isdigit() or int(raw_size) <= 0:
+                return None, _json_response(400, {
+                    "error": "image_size must be a positive pixel width or one of: "
+                             + ", ".join(IMAGE_SIZES),
+                })
+            width = int(raw_size)
+    return (fields, width), None
+
+
+def _image_variants(images):
+    """Compact copy of a Spotify images array, kept so ?image_size= can pick one."""
+    return [{"url": i["url"], "width": i.get("width") or 0} for i in images or [] if i.get("url")]
+
+
+def _strip_image_variants(value, images):
+    """Copy of `value` with every item's `images` moved into images[item["image"]].
+
+    Stored and default payloads carry a single `image`; the variants are kept
+    beside them (see _get_image_variants) for projections that ask for them.
+    """
+    if isinstance(value, list):
+        return [_strip_image_variants(v, images) for v in value]
+    if not isinstance(value, dict):
+        return value
+    out = {}
+    for key, v in value.items():
+        if key == "images" and "image" in value:
+            if value["image"] and v:
+                images[value["image"]] = v
+            continue
+        out[key] = _strip_image_variants(v, images)
+    return out
+
+
+def _projection_needs_images(projection):
+    """True if a parsed projection picks an image size or asks for `images`."""
+    if projection is None:
+        return False
+    fields, min_width = projection
+    return min_width is not None or (fields is not None and "images" in fields)
+
+
+def _get_image_variants(user_id, insight_keys):
+    """The {image url: variants} maps stored beside the given insight items."""
+    images = {}
+    keys = [{"user_id": user_id, "insight_key": key} for key in insight_keys]
+    for item in _get_storage().batch_get("insights", keys, ("images", "payload_format")):
+        body = _unpack_payload(item, "images")
+        if body:
+            images.update(json.loads(body))
+    return images
+
+
+def _pick_image(images, min_width):
+    """Smallest image at least min_width wide, else the largest available."""
+    fitting = [i for i in images if i["width"] >= min_width]
+    if fitting:
+        return min(fitting, key=lambda i: i["width"])["url"]
+    return max(images, key=lambda i: i["width"])["url"]
+
+
+def _project_item(item, fields, min_width, images):
+    # Items stored before the variants moved out still carry them inline
+    variants = item.get("images") or images.get(item.get("image"))
+    out = {k: v for k, v in item.items() if k != "images" and (fields is None or k in fields)}
+    if variants and fields is not None and "images" in fields:
+        out["images"] = variants
+    if variants and min_width and (fields is None or "image" in fields):
+        out["image"] = _pick_image(variants, min_width)
+    return out
+
+
+def _project_value(value, fields, min_width, images=None):
+    images = images or {}
+    if isinstance(value, list):
+        return [_project_value(v, fields, min_width, images) for v in value]
+    if not isinstance(value, dict):
+        return value
+    out = {}
+    for key, v in value.items():
+        if key in PROJECTED_LISTS and isinstance(v, list) and v and isinstance(v[0], dict):
+            out[key] = [_project_item(item, fields, min_width, images) for item in v]
+        else:
+            out[key] = _project_value(v, fields, min_width, images)
+    return out
+
+
+def _project_response(data, projection, images=None):
+    """Apply a parsed projection to a response body. No-op without one.
+
+    `images` is the variants map for items whose variants are stored apart.
+    """
+    if projection is None or data is None:
+        return data
+    if isinstance(data, _CachedJSON):
+        data = data.data
+    return _CachedJSON(_serialize_json(_project_value(data, *projection, images)))
+
+
+# ─── HTTP Caching ────────────────────────────────────────────────────────────
+# Cache-Control per GET route; anything not listed stays no-store. Public data
+# may be cached by CloudFront and browsers; per-user data is private and must
+# be revalidated, which costs only a 304 when the ETag still matches.
+def _public_cache(max_age, stale_while_revalidate):
+    return f"public, max-age={max_age}, stale-while-revalidate={stale_while_revalidate}"
+
+
+PRIVATE_REVALIDATE = "private, no-cache"
+
+ROUTE_CACHE_POLICIES = {
+    "/api/owner/top-artists":        _public_cache(300, 3600),
+    "/api/owner/top-albums":         _public_cache(300, 3600),
+    "/api/owner/recent-listens":     _public_cache(300, 3600),
+    "/api/owner/top-genres":         _public_cache(300, 3600),
+    "/api/owner/frequent-listens":   _public_cache(300, 3600),
+    "/api/owner/dashboard":          _public_cache(300, 3600),
+    "/api/me/new-releases":          _public_cache(3600, 86400),
+    "/api/stats/countries":          _public_cache(300, 3600),
+    "/api/access/count":             _public_cache(60, 300),
+    "/api/me/top-artists":           PRIVATE_REVALIDATE,
+    "/api/me/top-albums":            PRIVATE_REVALIDATE,
+    "/api/me/recent-listens":        PRIVATE_REVALIDATE,
+    "/api/me/top-genres":            PRIVATE_REVALIDATE,
+    "/api/me/frequent-listens":      PRIVATE_REVALIDATE,
+    "/api/me/dashboard":             PRIVATE_REVALIDATE,
+    "/api/me/playlists/suggestions": PRIVATE_REVALIDATE,
+    "/api/me/playlists/genres":      PRIVATE_REVALIDATE,
+}
+
+
+def _etag_matches(if_none_match, etag):
+    """True if an If-None-Match header value matches the (strong) ETag."""
+    for candidate in if_none_match.split(","):
+        candidate = candidate.strip()
+        if candidate.startswith("W/"):
+            candidate = candidate[2:]
+        if candidate in ("*", etag):
+            return True
+    return False
+
+
+def _apply_cache_policy(event, method, path, response):
+    """Set Cache-Control and ETag on a 200 GET response for a cacheable route.
+
+    A matching If-None-Match turns the response into a bodiless 304.
+    """
+    policy = ROUTE_CACHE_POLICIES.get(path) if method == "GET" else None
+    if not policy or response.get("statusCode") != 200:
+        return response
+    headers = response.setdefault("headers", {})
+    etag = headers.get("ETag") or f'"{_content_hash(response.get("body", ""))}"'
+    headers["ETag"] = etag
+    headers["Cache-Control"] = policy
+    if _etag_matches((event.get("headers") or {}).get("if-none-match", ""), etag):
+        return {"statusCode": 304, "headers": {"ETag": etag, "Cache-Control": policy}, "body": ""}
+    return response
+
+
+def _encode_cursor(last_evaluated_key):
+    """Encode a query's last_key as an opaque URL-safe cursor."""
+    if not last_evaluated_key:
+        return None
+    raw = json.dumps(last_evaluated_key, default=_json_default, separators=(",", ":"))
+    return base64.urlsafe_b64encode(raw.encode("utf-8")).decode("ascii").rstrip("=")
+
+
+def _decode_cursor(cursor):
+    """Decode a cursor from _encode_cursor. Raises ValueError if malformed."""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        key = json.loads(raw)
+    except (ValueError, TypeError) as e:
+        raise ValueError("Invalid cursor") from e
+    if not isinstance(key, dict):
+        raise ValueError("Invalid cursor")
+    return key
+
+
+def _redirect(url, cookie=None):
+    """Return a 302 redirect, optionally setting a cookie."""
+    h = {"Location": url}
+    resp = {"statusCode": 302, "headers": h, "body": ""}
+    if cookie:
+        resp["cookies"] = [cookie]
+    return resp
+
+
+# ─── Auth Event Helpers ──────────────────────────────────────────────────────
+def _get_cookie_header(event):
+    """Extract raw cookie string from API Gateway v2 event."""
+    if event.get("cookies"):
+        return "; ".join(event["cookies"])
+    return event.get("headers", {}).get("cookie", "")
+
+
+def _get_user_from_event(event):
+    """Extract user_id from session cookie. Returns None if not authenticated."""
+    cookies = _parse_cookies(_get_cookie_header(event))
+    return _get_session(cookies.get("session_id"))
+
+
+def _require_auth(event):
+    """Return (user_id, None) or (None, 401_response)."""
+    user_id = _get_user_from_event(event)
+    if not user_id:
+        return None, _json_response(401, {"error": "Not authenticated"})
+    return user_id, None
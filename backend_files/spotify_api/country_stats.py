@@ -0,0 +1,243 @@
+"""Materialized per-country statistics and the public country stats route."""
+import json
+import time
+
+from .core import (
+    COUNTRY_STATS_S3_KEY, DYNAMODB_SCAN_SEGMENTS, GLOBAL_PARTITION, PAYLOAD_FORMAT, S3_BUCKET,
+    _CachedJSON, _content_hash, _emit_metrics, _get_s3, _get_storage, _json_response,
+    _pack_payload, _serialize_json, _stored_deflate, _unpack_payload,
+)
+from .storage import DYNAMODB_BATCH_GET_MAX, ConditionFailed
+
+
+# ─── Materialized Country Stats ──────────────────────────────────────────────
+# Each user's contribution (country + top-genre counts) is kept on the user
+# item; the per-country aggregate lives in one global INSIGHTS_TABLE item and
+# is adjusted by the difference whenever a contribution changes. Every write
+# is conditioned on the version it read. The aggregate is only adjusted once
+# the scheduled rebuild has created it; until then changes are only recorded
+# on the user item and the route serves an empty list.
+COUNTRY_STATS_KEY = {"user_id": GLOBAL_PARTITION, "insight_key": "country_stats"}
+COUNTRY_STATS_REBUILD_ATTEMPTS = 3
+COUNTRY_STATS_MAX_GENRES = 25     # per country, keeps the item well under 400KB
+
+
+def _country_stats_body(aggregate):
+    """Build the public /api/stats/countries payload from the aggregate."""
+    stats = []
+    for country, entry in aggregate.items():
+        top = sorted(entry["genres"].items(), key=lambda x: x[1], reverse=True)[:5]
+        stats.append({
+            "country": country,
+            "user_count": entry["user_count"],
+            "top_genres": [{"name": g, "count": c} for g, c in top],
+        })
+    stats.sort(key=lambda x: x["user_count"], reverse=True)
+    return {"country_stats": stats}
+
+
+def _apply_contribution(aggregate, contribution, sign):
+    country = (contribution or {}).get("country")
+    if not country:
+        return
+    entry = aggregate.setdefault(country, {"user_count": 0, "genres": {}})
+    entry["user_count"] += sign
+    for name, count in contribution.get("genres", {}).items():
+        entry["genres"][name] = entry["genres"].get(name, 0) + sign * count
+        if entry["genres"][name] <= 0:
+            del entry["genres"][name]
+    if entry["user_count"] <= 0:
+        del aggregate[country]
+
+
+def _get_country_stats_version():
+    """The aggregate's current version, or None if it has not been built."""
+    item = _get_storage().get("insights", COUNTRY_STATS_KEY, ("version",), consistent=True)
+    return None if item is None else int(item.get("version", 0))
+
+
+def _trim_country_genres(aggregate):
+    """Keep only each country's COUNTRY_STATS_MAX_GENRES most counted genres.
+
+    Counts of a trimmed genre are lost until the next full rebuild, which
+    only affects genres far outside the published top five.
+    """
+    for entry in aggregate.values():
+        if len(entry["genres"]) > COUNTRY_STATS_MAX_GENRES:
+            top = sorted(entry["genres"].items(), key=lambda x: x[1], reverse=True)
+            entry["genres"] = dict(top[:COUNTRY_STATS_MAX_GENRES])
+
+
+def _save_country_stats(aggregate, version):
+    """Write the aggregate and its response body; False on a version conflict.
+
+    version is the one read before computing `aggregate` (None: not built).
+    """
+    _trim_country_genres(aggregate)
+    body = _serialize_json(_country_stats_body(aggregate))
+    if version is None:
+        condition = ("missing", "insight_key")
+    else:
+        condition = ("=", "version", version)
+    try:
+        _get_storage().put("insights", {
+            **COUNTRY_STATS_KEY,
+            "aggregate": json.dumps(aggregate),
+            "data": _pack_payload(body),
+            "payload_format": PAYLOAD_FORMAT,
+            "content_hash": _content_hash(body),
+            "version": (version or 0) + 1,
+            "updated_at": int(time.time()),
+        }, condition=condition)
+        return True
+    except ConditionFailed:
+        return False
+
+
+def _update_country_aggregate(old, new):
+    """Move one user's contribution from `old` to `new` in the aggregate.
+
+    Returns None without writing if the aggregate has not been built yet.
+    """
+    for _attempt in range(5):
+        item = _get_storage().get("insights", COUNTRY_STATS_KEY, ("aggregate", "version"))
+        if item is None:
+            return None
+        aggregate = json.loads(item.get("aggregate", "{}"))
+        _apply_contribution(aggregate, old, -1)
+        _apply_contribution(aggregate, new, +1)
+        if _save_country_stats(aggregate, int(item.get("version", 0))):
+            return True
+    return False
+
+
+def _update_country_contribution(user_id, country=None, genres=None, remove=False):
+    """Record a change to a user's country and/or top genres in the aggregate."""
+    storage = _get_storage()
+    user = storage.get("users", {"user_id": user_id}, ("country", "country_contribution")) or {}
+    old = json.loads(user.get("country_contribution", "null"))
+
+    if remove:
+        new = None
+    else:
+        new = {
+            "country": country or user.get("country") or (old or {}).get("country", ""),
+            "genres": (old or {}).get("genres", {}),
+        }
+        if genres is not None:
+            new["genres"] = {g["name"]: int(g.get("count", 1)) for g in genres if g.get("name")}
+        if not new["country"]:
+            new = None
+    if new == old:
+        return
+
+    # Before the first rebuild there is no aggregate to adjust; the stored
+    # contribution is picked up by that rebuild.
+    _update_country_aggregate(old, new)
+    if not remove:
+        storage.update(
+            "users", {"user_id": user_id},
+            changes={"country_contribution": json.dumps(new)},
+            condition=("exists", "user_id"),
+        )
+
+
+def _try_update_country_contribution(user_id, **kwargs):
+    """Best-effort _update_country_contribution for request paths.
+
+    A failure is counted rather than raised; the scheduled rebuild corrects
+    the aggregate.
+    """
+    try:
+        _update_country_contribution(user_id, **kwargs)
+    except Exception:
+        _emit_metrics({"CountryStatsUpdateErrors": (1, "Count")})
+
+
+def _rebuild_country_stats():
+    """Rebuild the aggregate from every user's stored contribution.
+
+    Users without a stored contribution are backfilled from the top_genres
+    view of their insight snapshot (or a legacy top_genres item), fetched in
+    batch-get chunks. The write is conditioned on the version read before the
+    scan, so an update made during it makes the rebuild start over rather
+    than be overwritten. Also publishes the result as a static S3 object
+    when S3_BUCKET is set.
+    """
+    for _attempt in range(COUNTRY_STATS_REBUILD_ATTEMPTS):
+        version = _get_country_stats_version()
+        aggregate = _aggregate_contributions()
+        if _save_country_stats(aggregate, version):
+            break
+    else:
+        return None  # Kept changing under us; incremental updates hold it
+    if S3_BUCKET:  # Unset in local runs
+        _get_s3().put_object(
+            Bucket=S3_BUCKET,
+            Key=COUNTRY_STATS_S3_KEY,
+            Body=json.dumps(_country_stats_body(aggregate)),
+            ContentType="application/json",
+        )
+    return len(aggregate)
+
+
+def _aggregate_contributions():
+    """Sum every user's contribution, backfilling users that have none."""
+    storage = _get_storage()
+    aggregate = {}
+    pending = {}  # user_id -> country, awaiting a top_genres lookup
+
+    def _backfill():
+        found = {}
+        for insight in storage.batch_get(
+            "insights",
+            [{"user_id": uid, "insight_key": key} for uid in pending for key in ("snapshot", "top_genres")],
+            ("user_id", "insight_key", "data", "view_top_genres", "payload_format"),
+        ):
+            if "view_top_genres" in insight:
+                found[insight["user_id"]] = json.loads(_unpack_payload(insight, "view_top_genres")).get("genres", [])
+            elif "data" in insight:
+                found.setdefault(insight["user_id"], json.loads(_unpack_payload(insight)).get("genres", []))
+        for uid, country in pending.items():
+            contribution = {
+                "country": country,
+                "genres": {g["name"]: int(g.get("count", 1)) for g in found.get(uid, []) if g.get("name")},
+            }
+            try:
+                storage.update(
+                    "users", {"user_id": uid},
+                    changes={"country_contribution": json.dumps(contribution)},
+                    condition=("exists", "user_id"),
+                )
+            except ConditionFailed:
+                continue  # Deleted since the scan
+            _apply_contribution(aggregate, contribution, +1)
+        pending.clear()
+
+    for user in storage.scan("users", ("user_id", "country", "country_contribution"),
+                             segments=DYNAMODB_SCAN_SEGMENTS):
+        if "country_contribution" in user:
+            _apply_contribution(aggregate, json.loads(user["country_contribution"]), +1)
+        elif user.get("country"):
+            pending[user["user_id"]] = user["country"]
+            if len(pending) >= DYNAMODB_BATCH_GET_MAX:
+                _backfill()
+    if pending:
+        _backfill()
+    return aggregate
+
+
+# ─── Country Stats Handler ───────────────────────────────────────────────────
+def handle_country_stats(event):
+    """Music stats by country (public) — served from the materialized aggregate."""
+    try:
+        storage = _get_storage()
+        attributes = ("data", "content_hash", "payload_format")
+        item = storage.get("insights", COUNTRY_STATS_KEY, attributes)
+        if not item:  # Not built yet; the scheduled rebuild creates it
+            return _json_response(200, {"country_stats": []})
+        return _json_response(200, _CachedJSON(
+            _unpack_payload(item), item.get("content_hash"), _stored_deflate(item)
+        ))
+    except Exception as e:
+        return _json_response(500, {"error": str(e)})
@@ -0,0 +1,176 @@
+"""User data deletion: the DELETE /api/me/data route and its async deletion job."""
+import secrets
+import time
+
+from .core import (
+    _clear_session_cookie, _delete_session, _get_cookie_header, _get_storage, _invoke_async,
+    _is_owner_user_id, _json_response, _parse_cookies, _require_auth,
+)
+from .country_stats import _try_update_country_contribution
+from .outbox import _email_job_id
+from .storage import ConditionFailed
+
+
+# ─── Data Deletion Handlers ────────────────────────────────────────────────────
+def handle_delete_data(event):
+    """Delete all user data (CCPA / ICDPA compliance). Owner cannot delete.
+
+    The profile, tokens and current session are removed immediately; insights,
+    play history and other sessions are deleted by an async job whose status
+    is available from /api/data/deletion.
+    """
+    user_id, err = _require_auth(event)
+    if err:
+        return err
+    # Prevent owner from accidentally deleting their account
+    if _is_owner_user_id(user_id):
+        return _json_response(403, {"error": "Owner account cannot be deleted via this endpoint"})
+    try:
+        _try_update_country_contribution(user_id, remove=True)
+        storage = _get_storage()
+        # Delete tokens first so no scheduled refresh writes new data
+        storage.delete("tokens", {"user_id": user_id})
+        # Delete user record, keeping the email for the outbox and access requests
+        user = storage.delete("users", {"user_id": user_id}, return_old=True) or {}
+        email = user.get("email", "")
+        # Delete session
+        cookies = _parse_cookies(_get_cookie_header(event))
+        _delete_session(cookies.get("session_id"))
+
+        job_id = _create_deletion_job()
+        if not _invoke_async("data.delete", user_id=user_id, job_id=job_id, email=email):
+            _run_data_deletion(user_id, job_id, email)
+
+        return _json_response(202,
+                              {"message": "Your data is being deleted.",
+                               "job_id": job_id,
+                               "status_url": f"/api/data/deletion?job_id={job_id}"},
+                              {"Set-Cookie": _clear_session_cookie()})
+    except Exception as e:
+        return _json_response(500, {"error": str(e)})
+
+
+# ─── Data Deletion Jobs ──────────────────────────────────────────────────────
+# Job records live in the sessions table as deljob#<id> (never valid sessions) and
+# expire after a week. They hold counts only, never the user_id.
+DELETION_JOB_TTL = 7 * 86400
+
+
+def _create_deletion_job():
+    job_id = secrets.token_urlsafe(16)
+    now = int(time.time())
+    _get_storage().put("sessions", {
+        "session_id": f"deljob#{job_id}",
+        "type": "deletion_job",
+        "status": "pending",
+        "created_at": now,
+        "updated_at": now,
+        "expires_at": now + DELETION_JOB_TTL,
+    })
+    return job_id
+
+
+def _update_deletion_job(job_id, status, **fields):
+    _get_storage().update(
+        "sessions", {"session_id": f"deljob#{job_id}"},
+        changes={"status": status, "updated_at": int(time.time()), **fields},
+    )
+
+
+def _delete_email_records(email):
+    """Remove an email address from the outbox and access requests.
+
+    Neither table is keyed by email, so both are scanned. Outbox jobs to the
+    address are deleted, as are the admin notifications about its access
+    requests. The requests themselves lose their name and email but keep
+    status, country and time, which the access counters are built from.
+    Returns (outbox jobs deleted, access requests anonymized).
+    """
+    storage = _get_storage()
+    email = email.strip().lower()
+    requests = [
+        item["request_id"]
+        for item in storage.scan("access_requests", ("request_id", "spotify_email"))
+        if item.get("spotify_email", "").strip().lower() == email
+    ]
+    jobs = {_email_job_id(f"access-request#{rid}") for rid in requests}
+    jobs.update(
+        item["job_id"]
+        for item in storage.scan("email_outbox", ("job_id", "to_email"))
+        if item.get("to_email", "").strip().lower() == email
+    )
+    deleted = storage.batch_delete("email_outbox", ({"job_id": job_id} for job_id in jobs))
+    anonymized = 0
+    for rid in requests:
+        try:
+            storage.update(
+                "access_requests", {"request_id": rid},
+                remove=("full_name", "spotify_email"),
+                condition=("exists", "request_id"),
+            )
+            anonymized += 1
+        except ConditionFailed:
+            continue  # Deleted since the scan
+    return deleted, anonymized
+
+
+def _run_data_deletion(user_id, job_id, email=""):
+    """Page through every table holding the user's data and batch-delete it.
+
+    With the account's email, outbox jobs and access requests carrying it
+    are removed too (see _delete_email_records).
+
+    Safe to re-run: Lambda retries a failed async job and deletes are idempotent.
+    """
+    _update_deletion_job(job_id, "running")
+    storage = _get_storage()
+    try:
+        deleted = {
+            "insights": storage.batch_delete("insights", (
+                {"user_id": user_id, "insight_key": item["insight_key"]}
+                for item in storage.query_all("insights", user_id, attributes=("insight_key",))
+            )),
+            "play_history": storage.batch_delete("play_history", (
+                {"user_id": user_id, "played_at": item["played_at"]}
+                for item in storage.query_all("play_history", user_id, attributes=("played_at",))
+            )),
+            "sessions": storage.batch_delete("sessions", (
+                {"session_id": item["session_id"]}
+                for item in storage.query_all(
+                    "sessions", user_id, index="user-id-index", attributes=("session_id",)
+                )
+            )),
+        }
+        if email:
+            deleted["email_outbox"], deleted["access_requests"] = _delete_email_records(email)
+        # Again, in case a request in flight re-created them
+        storage.delete("tokens", {"user_id": user_id})
+        storage.delete("users", {"user_id": user_id})
+    except Exception as e:
+        _update_deletion_job(job_id, "failed", error=str(e)[:500])
+        raise
+    _update_deletion_job(job_id, "completed", deleted=deleted, completed_at=int(time.time()))
+    return deleted
+
+
+def handle_deletion_status(event):
+    """GET /api/data/deletion?job_id= — progress of a data deletion job.
+
+    Unauthenticated (the session is gone by then); the job id is unguessable.
+    """
+    job_id = (event.get("queryStringParameters") or {}).get("job_id", "")
+    if not job_id:
+        return _json_response(400, {"error": "job_id is required"})
+    try:
+        item = _get_storage().get("sessions", {"session_id": f"deljob#{job_id}"})
+        if not item or item.get("type") != "deletion_job":
+            return _json_response(404, {"error": "Deletion job not found"})
+        return _json_response(200, {
+            "job_id": job_id,
+            "status": item["status"],
+            "deleted": item.get("deleted", {}),
+            "created_at": item.get("created_at"),
+            "completed_at": item.get("completed_at"),
+        })
+    except Exception as e:
+        return _json_response(500, {"error": str(e)})
@@ -0,0 +1,546 @@
+"""Insight routes: the per-user insight snapshot, login prewarm, and the insight
+and dashboard handlers.
+"""
+import json
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from .core import (
+    INSIGHT_CACHE_TTL, PAYLOAD_FORMAT, SPOTIFY_API_BASE, _CachedJSON, _acquire_build_lock,
+    _content_hash, _get_cached_insight, _get_client_token, _get_owner_user_id,
+    _get_image_variants, _get_spotify_app_credentials, _get_storage,
+    _get_user_access_token, _http_request, _image_variants, _json_response, _pack_payload,
+    _parse_projection, _project_response, _projection_needs_images, _release_build_lock,
+    _require_auth, _serialize_json, _sharing_spotify_responses, _stored_deflate,
+    _strip_image_variants, _unpack_payload, _wait_for_build,
+)
+from .country_stats import _try_update_country_contribution
+
+
+# ─── Spotify Data Fetch Helpers ──────────────────────────────────────────────
+def _fetch_new_releases(token):
+    """Fetch public new album releases."""
+    result = _http_request(
+        f"{SPOTIFY_API_BASE}/v1/browse/new-releases?limit=20",
+        headers={"Authorization": f"Bearer {token}"},
+    )
+    if result["status"] != 200:
+        return []
+    items = result["body"].get("albums", {}).get("items", [])
+    return [
+        {
+            "name": a["name"],
+            "artist": ", ".join(art["name"] for art in a.get("artists", [])),
+            "url": a["external_urls"].get("spotify", ""),
+            "image": a["images"][0]["url"] if a.get("images") else "",
+            "release_date": a.get("release_date", ""),
+        }
+        for a in items
+    ]
+
+
+# Raw Spotify resources behind the insight views. The URLs match the ones the
+# playlist supplement requests, so a prewarm can share the responses.
+INSIGHT_SOURCES = {
+    "top_artists": "/v1/me/top/artists?limit=50&time_range=medium_term",
+    "top_tracks_medium": "/v1/me/top/tracks?limit=50&time_range=medium_term",
+    "top_tracks_short": "/v1/me/top/tracks?limit=50&time_range=short_term",
+    "recently_played": "/v1/me/player/recently-played?limit=50",
+}
+TOP_ARTISTS_LIMIT = 20
+
+
+def _fetch_insight_source(token, source):
+    """GET one raw insight source. Returns the response body, or None on error."""
+    result = _http_request(
+        f"{SPOTIFY_API_BASE}{INSIGHT_SOURCES[source]}",
+        headers={"Authorization": f"Bearer {token}"},
+    )
+    if result["status"] != 200:
+        return None
+    return result["body"]
+
+
+def _fetch_insight_sources(token):
+    """Fetch every raw insight source once, concurrently. Returns {source: body}."""
+    with ThreadPoolExecutor(max_workers=len(INSIGHT_SOURCES)) as pool:
+        bodies = pool.map(lambda src: _fetch_insight_source(token, src), INSIGHT_SOURCES)
+        return dict(zip(INSIGHT_SOURCES, bodies))
+
+
+def _parse_top_artists(body):
+    return [
+        {
+            "name": a["name"],
+            "url": a["external_urls"].get("spotify", ""),
+            "image": a["images"][0]["url"] if a.get("images") else "",
+            "images": _image_variants(a.get("images")),
+            "genres": a.get("genres", []),
+            "popularity": a.get("popularity", 0),
+        }
+        for a in (body or {}).get("items", [])[:TOP_ARTISTS_LIMIT]
+    ]
+
+
+def _parse_top_tracks(body):
+    return [
+        {
+            "name": t["name"],
+            "artist": ", ".join(art["name"] for art in t.get("artists", [])),
+            "url": t["external_urls"].get("spotify", ""),
+            "image": t["album"]["images"][0]["url"] if t.get("album", {}).get("images") else "",
+            "images": _image_variants(t.get("album", {}).get("images")),
+            "album": t.get("album", {}).get("name", ""),
+        }
+        for t in (body or {}).get("items", [])
+    ]
+
+
+def _parse_recently_played(body):
+    return [
+        {
+            "name": item["track"]["name"],
+            "artist": ", ".join(art["name"] for art in item["track"].get("artists", [])),
+            "url": item["track"]["external_urls"].get("spotify", ""),
+            "image": item["track"]["album"]["images"][0]["url"]
+            if item["track"].get("album", {}).get("images")
+            else "",
+            "images": _image_variants(item["track"].get("album", {}).get("images")),
+            "played_at": item.get("played_at", ""),
+        }
+        for item in (body or {}).get("items", [])
+    ]
+
+
+def _derive_top_albums(tracks):
+    """Derive top albums from top tracks by counting occurrences."""
+    album_counts = {}
+    for t in tracks:
+        key = t.get("album", "")
+        if not key:
+            continue
+        if key not in album_counts:
+            album_counts[key] = {
+                "name": key, "artist": t["artist"],
+                "url": t["url"], "image": t["image"], "images": t.get("images", []), "count": 0,
+            }
+        album_counts[key]["count"] += 1
+    return sorted(album_counts.values(), key=lambda x: x["count"], reverse=True)[:20]
+
+
+def _derive_top_genres(artists):
+    """Derive top genres from top artists by counting genre occurrences."""
+    genre_counts = {}
+    genre_artists = {}
+    for a in artists:
+        for g in a.get("genres", []):
+            genre_counts[g] = genre_counts.get(g, 0) + 1
+            if g not in genre_artists:
+                genre_artists[g] = []
+            genre_artists[g].append(a["name"])
+    sorted_genres = sorted(genre_counts.items(), key=lambda x: x[1], reverse=True)
+    return [
+        {"name": name, "count": count, "artists": genre_artists[name]}
+        for name, count in sorted_genres[:20]
+    ]
+
+
+def _derive_frequent_listens(short_term_tracks):
+    """Return short-term top tracks as 'frequent listens' (heavy rotation)."""
+    for i, t in enumerate(short_term_tracks):
+        t["play_count"] = len(short_term_tracks) - i
+    return short_term_tracks[:20]
+
+
+def _derive_insight_views(sources):
+    """Derive every insight view from one set of raw sources."""
+    artists = _parse_top_artists(sources.get("top_artists"))
+    return {
+        "top_artists": {"artists": artists},
+        "top_albums": {"albums": _derive_top_albums(_parse_top_tracks(sources.get("top_tracks_medium")))},
+        "recent_listens": {"tracks": _parse_recently_played(sources.get("recently_played"))},
+        "top_genres": {"genres": _derive_top_genres(artists)},
+        "frequent_listens": {"tracks": _derive_frequent_listens(_parse_top_tracks(sources.get("top_tracks_short")))},
+    }
+
+
+# ─── Insight Snapshot ────────────────────────────────────────────────────────
+# Every insight view is derived from one snapshot: the raw sources are fetched
+# once per user (one token refresh, four Spotify calls) and stored as a single
+# insights item with one zlib-compressed attribute per view, so a route
+# reads only its own view. Image variants live in their own attribute and are
+# only read for ?image_size= / ?fields=images. A per-user build lock makes
+# concurrent misses wait for one build instead of each fetching the same data.
+SNAPSHOT_VIEWS = ("top_artists", "top_albums", "recent_listens", "top_genres", "frequent_listens")
+
+
+def _snapshot_key(owner=False):
+    return "owner_snapshot" if owner else "snapshot"
+
+
+def _store_insight_snapshot(user_id, views, images, owner=False):
+    now = int(time.time())
+    item = {
+        "user_id": user_id,
+        "insight_key": _snapshot_key(owner),
+        "payload_format": PAYLOAD_FORMAT,
+        "images": _pack_payload(_serialize_json(images)),
+        "created_at": now,
+        "expires_at": now + INSIGHT_CACHE_TTL,
+    }
+    for name in SNAPSHOT_VIEWS:
+        body = _serialize_json(views[name])
+        item[f"view_{name}"] = _pack_payload(body)
+        item[f"hash_{name}"] = _content_hash(body)
+    _get_storage().put("insights", item)
+    if not owner:
+        _try_update_country_contribution(user_id, genres=views["top_genres"]["genres"])
+
+
+def _build_insight_snapshot(user_id, token, owner=False):
+    """Fetch the raw sources once, derive and store every view. Returns the views."""
+    images = {}
+    views = _strip_image_variants(_derive_insight_views(_fetch_insight_sources(token)), images)
+    _store_insight_snapshot(user_id, views, images, owner)
+    return views
+
+
+def _snapshot_view_from_item(item, view, raw=False):
+    """Decode one view of a snapshot item; raw=True keeps it serialized."""
+    body = _unpack_payload(item, f"view_{view}")
+    if raw:
+        return _CachedJSON(body, item.get(f"hash_{view}"), _stored_deflate(item, f"view_{view}"))
+    return json.loads(body)
+
+
+def _get_snapshot_view(user_id, view, owner=False, raw=False):
+    """Read one view from a fresh snapshot, or None."""
+    item = _get_storage().get(
+        "insights", {"user_id": user_id, "insight_key": _snapshot_key(owner)},
+        (f"view_{view}", f"hash_{view}", "expires_at", "payload_format"),
+    )
+    if not item or item.get("expires_at", 0) < int(time.time()) or f"view_{view}" not in item:
+        return None
+    return _snapshot_view_from_item(item, view, raw)
+
+
+def _get_insight_view(user_id, view, owner=False):
+    """Serve one view from the snapshot, building the snapshot on a miss.
+
+    A hit is returned still serialized (_CachedJSON). Returns None if the
+    user's Spotify account is not connected.
+    """
+    data = _get_snapshot_view(user_id, view, owner, raw=True)
+    if data is not None:
+        return data
+    views = _fill_insight_snapshot(user_id, owner)
+    return views[view] if views else None
+
+
+def _fill_insight_snapshot(user_id, owner=False, token=None):
+    """Build the snapshot after a miss, or wait for a build already running.
+
+    Returns every view, or None if the user's Spotify account is not connected.
+    """
+    lock = _acquire_build_lock(user_id)
+    if lock is None:
+        _wait_for_build(user_id)
+        views = {view: _get_snapshot_view(user_id, view, owner) for view in SNAPSHOT_VIEWS}
+        if all(data is not None for data in views.values()):
+            return views
+    try:
+        token = token or _get_user_access_token(user_id)
+        if not token:
+            return None
+        return _build_insight_snapshot(user_id, token, owner)
+    finally:
+        if lock is not None:
+            _release_build_lock(user_id, lock)
+
+
+# ─── Login Prewarm ───────────────────────────────────────────────────────────
+# After login the callback dispatches an async prewarm that builds the insight
+# snapshot and the playlist suggestions before the dashboard asks for them.
+def _prewarm_user_insights(user_id, owner=False):
+    """Build the snapshot (and playlists) for a freshly logged-in user.
+
+    Skips items that are still fresh, and items whose build lock is held by
+    another build. Each lock is held only while its own item is built.
+    Returns the list of insight keys written.
+    """
+    from .playlists import _refresh_playlist_suggestions
+
+    wanted = [_snapshot_key(owner)]
+    if not owner:
+        wanted.append("playlist_suggestions")
+    now = int(time.time())
+    fresh = {
+        item["insight_key"]
+        for item in _get_storage().batch_get(
+            "insights",
+            [{"user_id": user_id, "insight_key": key} for key in wanted],
+            ("insight_key", "expires_at"),
+        )
+        if item.get("expires_at", 0) >= now
+    }
+    stale = [key for key in wanted if key not in fresh]
+    if not stale:
+        return []
+
+    written = []
+    with _sharing_spotify_responses():
+        token = _get_user_access_token(user_id)
+        if not token:
+            return []
+        for key in stale:
+            target = "snapshot" if key == _snapshot_key(owner) else key
+            lock = _acquire_build_lock(user_id, target)
+            if lock is None:
+                continue
+            try:
+                if target == "snapshot":
+                    _build_insight_snapshot(user_id, token, owner)
+                else:
+                    _refresh_playlist_suggestions(user_id, token)
+            finally:
+                _release_build_lock(user_id, lock, target)
+            written.append(key)
+    return written
+
+
+# ─── Data Route Handlers ────────────────────────────────────────────────────
+def handle_new_releases(event):
+    """Fetch new releases (public data, no auth required)."""
+    try:
+        client_id, client_secret = _get_spotify_app_credentials()
+        token = _get_client_token(client_id, client_secret)
+        releases = _fetch_new_releases(token)
+        return _json_response(200, {"albums": releases})
+    except Exception as e:
+        return _json_response(500, {"error": str(e)})
+
+
+def _handle_user_insight(event, view):
+    """Generic handler for user-scoped insights, served from the snapshot."""
+    user_id, err = _require_auth(event)
+    if err:
+        return err
+    projection, err = _parse_projection(event)
+    if err:
+        return err
+    try:
+        data = _get_insight_view(user_id, view)
+        if data is None:
+            return _json_response(401, {"error": "Spotify account not connected"})
+        images = None
+        if _projection_needs_images(projection):
+            images = _get_image_variants(user_id, [_snapshot_key()])
+        return _json_response(200, _project_response(data, projection, images))
+    except Exception as e:
+        return _json_response(500, {"error": str(e)})
+
+
+def handle_top_artists(event):
+    return _handle_user_insight(event, "top_artists")
+
+
+def handle_top_albums(event):
+    return _handle_user_insight(event, "top_albums")
+
+
+def handle_recent_listens(event):
+    return _handle_user_insight(event, "recent_listens")
+
+
+def handle_top_genres(event):
+    return _handle_user_insight(event, "top_genres")
+
+
+def handle_frequent_listens(event):
+    return _handle_user_insight(event, "frequent_listens")
+
+
+# ─── Owner Data Route Handlers ───────────────────────────────────────────────
+def _handle_owner_insight(event, view):
+    """Generic handler for owner's public data (no visitor auth needed)."""
+    user_id = _get_owner_user_id()
+    if not user_id:
+        return _json_response(503, {"error": "Owner account not configured"})
+    projection, err = _parse_projection(event)
+    if err:
+        return err
+    try:
+        data = _get_insight_view(user_id, view, owner=True)
+        if data is None:
+            return _json_response(503, {"error": "Owner Spotify not connected"})
+        images = None
+        if _projection_needs_images(projection):
+            images = _get_image_variants(user_id, [_snapshot_key(owner=True)])
+        return _json_response(200, _project_response(data, projection, images))
+    except Exception as e:
+        return _json_response(500, {"error": str(e)})
+
+
+def handle_owner_top_artists(event):
+    return _handle_owner_insight(event, "top_artists")
+
+
+def handle_owner_top_albums(event):
+    return _handle_owner_insight(event, "top_albums")
+
+
+def handle_owner_recent_listens(event):
+    return _handle_owner_insight(event, "recent_listens")
+
+
+def handle_owner_top_genres(event):
+    return _handle_owner_insight(event, "top_genres")
+
+
+def handle_owner_frequent_listens(event):
+    return _handle_owner_insight(event, "frequent_listens")
+
+
+# ─── Dashboard Handlers ──────────────────────────────────────────────────────
+# One request for a whole page: authenticate once, read every requested
+# section with a single BatchGetItem, fill misses concurrently.
+DASHBOARD_SECTIONS = SNAPSHOT_VIEWS + ("playlist_suggestions",)
+OWNER_DASHBOARD_SECTIONS = SNAPSHOT_VIEWS
+
+
+def _parse_dashboard_sections(event, allowed):
+    """Return (sections, error_response) from ?sections=a,b (default: all)."""
+    raw = (event.get("queryStringParameters") or {}).get("sections", "")
+    if not raw:
+        return list(allowed), None
+    sections = list(dict.fromkeys(s.strip() for s in raw.split(",") if s.strip()))
+    unknown = [s for s in sections if s not in allowed]
+    if unknown or not sections:
+        return None, _json_response(400, {
+            "error": f"Unknown sections: {', '.join(unknown)}" if unknown else "No sections requested",
+            "allowed": list(allowed),
+        })
+    return sections, None
+
+
+def _load_dashboard(user_id, sections, owner=False):
+    """Return {section: data} for the requested sections.
+
+    Returns None if a section had to be built and the user's Spotify account
+    is not connected.
+    """
+    views = [s for s in sections if s in SNAPSHOT_VIEWS]
+    keys = []
+    if views:
+        keys.append({"user_id": user_id, "insight_key": _snapshot_key(owner)})
+    if "playlist_suggestions" in sections:
+        keys.append({"user_id": user_id, "insight_key": "playlist_suggestions"})
+    attributes = ["insight_key", "expires_at", "content_hash", "payload_format", "data"]
+    for view in views:
+        attributes += [f"view_{view}", f"hash_{view}"]
+
+    now = int(time.time())
+    found = {}
+    for item in _get_storage().batch_get("insights", keys, attributes):
+        if item.get("expires_at", 0) < now:
+            continue
+        if item["insight_key"] == "playlist_suggestions":
+            found["playlist_suggestions"] = _CachedJSON(
+                _unpack_payload(item), item.get("content_hash"), _stored_deflate(item)
+            )
+        else:
+            for view in views:
+                if f"view_{view}" in item:
+                    found[view] = _snapshot_view_from_item(item, view, raw=True)
+
+    missing = [s for s in sections if s not in found]
+    if missing:
+        from .playlists import _refresh_playlist_suggestions
+
+        token = _get_user_access_token(user_id)
+        if not token:
+            return None
+
+        # Waits only on the playlists' own build lock (e.g. the login
+        # prewarm), never on the snapshot lock the thread beside it takes.
+        def _fill_playlists():
+            cached = _get_cached_insight(user_id, "playlist_suggestions", wait_for_build=True, raw=True)
+            return cached if cached is not None else _refresh_playlist_suggestions(user_id, token)
+
+        with ThreadPoolExecutor(max_workers=2) as pool:
+            snapshot = None
+            if any(s in SNAPSHOT_VIEWS for s in missing):
+                snapshot = pool.submit(_fill_insight_snapshot, user_id, owner, token)
+            playlists = pool.submit(_fill_playlists) if "playlist_suggestions" in missing else None
+            if snapshot is not None:
+                views_built = snapshot.result() or {}
+                for s in missing:
+                    if s in views_built:
+                        found[s] = views_built[s]
+            if playlists is not None:
+                found["playlist_suggestions"] = playlists.result()
+    return {s: found.get(s) for s in sections}
+
+
+def _dashboard_body(sections, projection=None, images=None):
+    """Serialize {"sections": {...}}, splicing cached bodies in unparsed."""
+    parts = []
+    for name, data in sections.items():
+        data = _project_response(data, projection, images)
+        body = data.body if isinstance(data, _CachedJSON) else _serialize_json(data)
+        parts.append(f"{json.dumps(name)}: {body}")
+    return _CachedJSON('{"sections": {' + ", ".join(parts) + "}}")
+
+
+def _dashboard_image_variants(user_id, sections, projection, owner=False):
+    """Image variants for the sections, if the projection needs them."""
+    if not _projection_needs_images(projection):
+        return None
+    keys = []
+    if any(s in SNAPSHOT_VIEWS for s in sections):
+        keys.append(_snapshot_key(owner))
+    if "playlist_suggestions" in sections:
+        keys.append("playlist_suggestions")
+    return _get_image_variants(user_id, keys)
+
+
+def handle_dashboard(event):
+    """GET /api/me/dashboard?sections=top_artists,... — all sections in one body."""
+    user_id, err = _require_auth(event)
+    if err:
+        return err
+    sections, err = _parse_dashboard_sections(event, DASHBOARD_SECTIONS)
+    if err:
+        return err
+    projection, err = _parse_projection(event)
+    if err:
+        return err
+    try:
+        data = _load_dashboard(user_id, sections)
+        if data is None:
+            return _json_response(401, {"error": "Spotify account not connected"})
+        images = _dashboard_image_variants(user_id, sections, projection)
+        return _json_response(200, _dashboard_body(data, projection, images))
+    except Exception as e:
+        return _json_response(500, {"error": str(e)})
+
+
+def handle_owner_dashboard(event):
+    """GET /api/owner/dashboard?sections=... — owner's public sections in one body."""
+    user_id = _get_owner_user_id()
+    if not user_id:
+        return _json_response(503, {"error": "Owner account not configured"})
+    sections, err = _parse_dashboard_sections(event, OWNER_DASHBOARD_SECTIONS)
+    if err:
+        return err
+    projection, err = _parse_projection(event)
+    if err:
+        return err
+    try:
+        data = _load_dashboard(user_id, sections, owner=True)
+        if data is None:
+            return _json_response(503, {"error": "Owner Spotify not connected"})
+        images = _dashboard_image_variants(user_id, sections, projection, owner=True)
+        return _json_response(200, _dashboard_body(data, projection, images))
+    except Exception as e:
+        return _json_response(500, {"error": str(e)})
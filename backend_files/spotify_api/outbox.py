@@ -0,0 +1,231 @@
+"""Email outbox: queued, deduplicated SES notifications drained asynchronously."""
+import hashlib
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from .core import (
+    EMAIL_SINK, SES_FROM_EMAIL, WEBSITE_DOMAIN, _emit_metrics, _get_ses, _get_storage,
+    _invoke_async,
+)
+from .storage import ConditionFailed
+
+
+# ─── Email Outbox ────────────────────────────────────────────────────────────
+# Handlers only write email jobs to the email_outbox table; a drain stage (async
+# self-invocation after the write, plus an hourly schedule) delivers them with
+# retry. Admin notifications are bundled into a digest on the hourly drain.
+EMAIL_MAX_ATTEMPTS = 5
+EMAIL_DRAIN_BATCH = 25
+EMAIL_CLAIM_TIMEOUT = 900         # "sending" jobs older than this are retried
+EMAIL_SENT_TTL = 7 * 86400        # keep delivered jobs for dedupe, then expire
+
+_memory_email_sink = []  # deliveries when EMAIL_SINK == "memory"
+
+
+def _deliver_email(to_email, subject, body_html, body_text=""):
+    """Send one email via SES (or the in-memory sink). Raises on failure."""
+    if EMAIL_SINK == "memory":
+        _memory_email_sink.append({
+            "to": to_email, "subject": subject, "html": body_html, "text": body_text or subject,
+        })
+        return
+    _get_ses().send_email(
+        Source=SES_FROM_EMAIL,
+        Destination={"ToAddresses": [to_email]},
+        Message={
+            "Subject": {"Data": subject, "Charset": "UTF-8"},
+            "Body": {
+                "Html": {"Data": body_html, "Charset": "UTF-8"},
+                "Text": {"Data": body_text or subject, "Charset": "UTF-8"},
+            },
+        },
+    )
+
+
+def _email_job_id(dedupe_key):
+    """The outbox job_id of a job queued with this dedupe_key."""
+    return hashlib.sha256(dedupe_key.encode("utf-8")).hexdigest()[:32]
+
+
+def _queue_email(to_email, subject, body_html, body_text="", dedupe_key=None, digest=False):
+    """Write an email job to the outbox. Returns the job_id, or None if the job
+    was skipped (no recipient / SES not configured) or is a duplicate.
+
+    Jobs are deduplicated on dedupe_key (default: recipient + subject + body).
+    digest=True jobs wait for the next digest instead of being sent one by one.
+    """
+    if not to_email or (EMAIL_SINK != "memory" and not SES_FROM_EMAIL):
+        return None
+    dedupe_key = dedupe_key or f"{to_email}|{subject}|{body_html}"
+    job_id = _email_job_id(dedupe_key)
+    try:
+        _get_storage().put(
+            "email_outbox",
+            {
+                "job_id": job_id,
+                "status": "digest" if digest else "pending",
+                "to_email": to_email,
+                "subject": subject,
+                "body_html": body_html,
+                "body_text": body_text,
+                "attempts": 0,
+                "next_attempt_at": 0,
+                "created_at": int(time.time()),
+            },
+            condition=("missing", "job_id"),
+        )
+    except ConditionFailed:
+        return None
+    return job_id
+
+
+def _trigger_outbox_drain():
+    """Start an asynchronous drain of pending email jobs.
+
+    Uses an Event (fire-and-forget) self-invocation so the SES round trip is
+    not part of the caller's latency. With the in-memory sink the drain runs
+    inline instead; otherwise an undispatched drain is left to the hourly one.
+    """
+    if EMAIL_SINK == "memory":
+        _drain_outbox()
+        return
+    _invoke_async("outbox.drain")
+
+
+def _claim_email_job(job, from_status):
+    """Move a job to "sending"; False if another drain claimed it first."""
+    try:
+        _get_storage().update(
+            "email_outbox", {"job_id": job["job_id"]},
+            changes={"status": "sending", "claimed_at": int(time.time())},
+            increments={"attempts": 1},
+            condition=("=", "status", from_status),
+        )
+        return True
+    except ConditionFailed:
+        return False
+
+
+def _finish_email_job(job, error=None):
+    """Mark a claimed job sent, or schedule a retry (failed after max attempts)."""
+    now = int(time.time())
+    if error is None:
+        _get_storage().update(
+            "email_outbox", {"job_id": job["job_id"]},
+            changes={"status": "sent", "sent_at": now, "expires_at": now + EMAIL_SENT_TTL},
+        )
+        return "sent"
+    attempts = int(job.get("attempts", 0)) + 1
+    status = "failed" if attempts >= EMAIL_MAX_ATTEMPTS else "pending"
+    _get_storage().update(
+        "email_outbox", {"job_id": job["job_id"]},
+        changes={"status": status, "next_attempt_at": now + 60 * (2 ** attempts), "last_error": str(error)[:500]},
+    )
+    return status
+
+
+def _requeue_email_job(job, now):
+    """Return a job whose drain died mid-send to the queue.
+
+    Its claim already counted the attempt, so attempts is left alone; the
+    condition skips a job that was finished or re-claimed in the meantime.
+    """
+    status = "failed" if int(job.get("attempts", 0)) >= EMAIL_MAX_ATTEMPTS else "pending"
+    try:
+        _get_storage().update(
+            "email_outbox", {"job_id": job["job_id"]},
+            changes={"status": status, "next_attempt_at": 0, "last_error": "claim timed out"},
+            condition=("and", ("=", "status", "sending"), ("<", "claimed_at", now - EMAIL_CLAIM_TIMEOUT)),
+        )
+    except ConditionFailed:
+        pass
+
+
+def _send_email_job(job):
+    try:
+        _deliver_email(job["to_email"], job["subject"], job["body_html"], job.get("body_text", ""))
+        return _finish_email_job(job)
+    except Exception as e:
+        return _finish_email_job(job, e)
+
+
+def _send_admin_digest(jobs):
+    """Bundle queued admin notifications into one email per recipient.
+
+    A failed digest puts its jobs back in the digest queue until they reach
+    EMAIL_MAX_ATTEMPTS, then marks them failed. Returns the number of jobs sent.
+    """
+    sent = 0
+    by_recipient = {}
+    for job in jobs:
+        by_recipient.setdefault(job["to_email"], []).append(job)
+    for to_email, group in by_recipient.items():
+        group = [j for j in group if _claim_email_job(j, "digest")]
+        if not group:
+            continue
+        group.sort(key=lambda j: j.get("created_at", 0))
+        sections = "<hr>".join(j["body_html"] for j in group)
+        try:
+            _deliver_email(
+                to_email,
+                f"{len(group)} new notification(s) from {WEBSITE_DOMAIN}",
+                f"<h2>{len(group)} new notification(s)</h2>{sections}",
+                "\n".join(j["subject"] for j in group),
+            )
+            error = None
+        except Exception as e:
+            error = e
+        if error is None:
+            for job in group:
+                _finish_email_job(job)
+            sent += len(group)
+            continue
+        for job in group:
+            # Back in the digest queue rather than sent individually
+            attempts = int(job.get("attempts", 0)) + 1  # counted by the claim
+            _get_storage().update(
+                "email_outbox", {"job_id": job["job_id"]},
+                changes={
+                    "status": "failed" if attempts >= EMAIL_MAX_ATTEMPTS else "digest",
+                    "last_error": str(error)[:500],
+                },
+            )
+    return sent
+
+
+def _drain_outbox(include_digest=False):
+    """Deliver due outbox jobs in concurrent batches. Returns a summary dict."""
+    storage = _get_storage()
+    now = int(time.time())
+    summary = {"sent": 0, "retrying": 0, "failed": 0, "digested": 0}
+
+    # Re-queue jobs whose drain died mid-send
+    for job in storage.query_all("email_outbox", "sending", sort=("<=", now), index="status-index"):
+        if job.get("claimed_at", 0) < now - EMAIL_CLAIM_TIMEOUT:
+            _requeue_email_job(job, now)
+
+    due = [
+        job for job in storage.query_all("email_outbox", "pending", index="status-index")
+        if job.get("next_attempt_at", 0) <= now
+    ]
+    for i in range(0, len(due), EMAIL_DRAIN_BATCH):
+        batch = [j for j in due[i:i + EMAIL_DRAIN_BATCH] if _claim_email_job(j, "pending")]
+        if not batch:
+            continue
+        with ThreadPoolExecutor(max_workers=min(8, len(batch))) as pool:
+            for outcome in pool.map(_send_email_job, batch):
+                key = {"pending": "retrying"}.get(outcome, outcome)
+                summary[key] += 1
+
+    if include_digest:
+        digest_jobs = list(storage.query_all("email_outbox", "digest", index="status-index"))
+        if digest_jobs:
+            summary["digested"] = _send_admin_digest(digest_jobs)
+
+    _emit_metrics({
+        "EmailsSent": (summary["sent"], "Count"),
+        "EmailsRetrying": (summary["retrying"], "Count"),
+        "EmailsFailed": (summary["failed"], "Count"),
+        "EmailsDigested": (summary["digested"], "Count"),
+    })
+    return summary
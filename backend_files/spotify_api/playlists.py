@@ -0,0 +1,1441 @@
+"""Playlist engine: play history H(T), candidate pools, recommendations and the
+playlist routes.
+"""
+import json
+import hashlib
+import time
+import urllib.parse
+import calendar
+import random
+import threading
+import zlib
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from .core import (
+    GLOBAL_PARTITION, PAYLOAD_FORMAT, S3_BUCKET, SPOTIFY_API_BASE, _content_hash, _emit_metrics,
+    _get_cached_insight, _get_client_token, _get_image_variants, _get_s3,
+    _get_spotify_app_credentials, _get_storage, _get_user_access_token, _http_request,
+    _image_variants, _json_response, _pack_payload, _parse_projection, _project_response,
+    _project_value, _projection_needs_images, _require_auth, _serialize_json,
+    _strip_image_variants, _unpack_payload,
+)
+from .storage import ConditionFailed
+
+
+# ─── Playlist Engine ─────────────────────────────────────────────────────────
+
+# Maps user-facing timeframe to parameters
+TIMEFRAME_CONFIG = {
+    "2w": {"days": 14, "label": "2 Weeks", "spotify_time_range": "short_term"},
+    "1m": {"days": 30, "label": "1 Month", "spotify_time_range": "short_term"},
+    "3m": {"days": 90, "label": "3 Months", "spotify_time_range": "medium_term"},
+}
+
+PLAY_HISTORY_TTL_DAYS = 95  # Slightly more than 3 months
+# Attributes H(T) consumers read (taste stats, supplement merge)
+PLAY_HISTORY_ATTRIBUTES = ("track_id", "track_name", "artist_name", "artist_ids", "genres")
+
+# Spotify recently-played endpoint returns max 50 items (no time filtering)
+SPOTIFY_RECENTLY_PLAYED_MAX = 50
+
+# Per-user Bloom filter over every track in the retained play history, stored
+# (zlib-compressed) on the user item. 64 Kbit with 7 hashes keeps the false
+# positive rate well under 1% for a few thousand distinct tracks.
+EXCLUSION_FILTER_BITS = 1 << 16
+EXCLUSION_FILTER_HASHES = 7
+EXCLUSION_FILTER_REBUILD_AGE = 30 * 86400  # rebuild so expired plays age out
+
+PLAYLIST_THEMES = [
+    {
+        "id": "essentials",
+        "name": "Your Essentials",
+        "description": "A mix built from your top artists and tracks",
+        "default_params": {"limit": 20},
+        "seed_type": "taste",
+    },
+    {
+        "id": "hidden_gems",
+        "name": "Hidden Gems",
+        "description": "Popular tracks you haven't discovered yet in your genres",
+        "default_params": {"limit": 40, "min_popularity": 70},
+        "seed_type": "genres",
+    },
+    {
+        "id": "energy_boost",
+        "name": "Energy Boost",
+        "description": "High-energy bangers to power your day",
+        "default_params": {"limit": 40, "target_energy": 0.9, "target_danceability": 0.8, "min_tempo": 120},
+        "seed_type": "genres",
+    },
+    {
+        "id": "chill_mode",
+        "name": "Chill Mode",
+        "description": "Laid-back vibes for relaxation",
+        "default_params": {"limit": 40, "target_energy": 0.3, "target_acousticness": 0.7, "max_tempo": 105},
+        "seed_type": "genres",
+    },
+    {
+        "id": "discovery_mix",
+        "name": "Discovery Mix",
+        "description": "Explore new genres outside your comfort zone",
+        "default_params": {"limit": 40, "min_popularity": 70},
+        "seed_type": "discovery",
+    },
+]
+
+PLAYLIST_CACHE_TTL = 259200  # 72 hours (3 days)
+
+# Each theme keeps an over-fetched candidate pool (Spotify's per-call maximum)
+# next to playlist_suggestions, so regenerate can re-sample without API calls.
+PLAYLIST_SIZE = 20
+PLAYLIST_POOL_SIZE = 100
+
+# Spotify's genre-seed list is global, so one copy is shared by every user:
+# in-process for GENRE_SEEDS_TTL, persisted to S3 and refreshed by the schedule.
+GENRE_SEEDS_S3_KEY = "data/genre_seeds.json"
+GENRE_SEEDS_TTL = 86400             # 24 hours (in-process)
+GENRE_SEEDS_RETRY_TTL = 300         # in-process, after a failed refresh (stale or empty list)
+GENRE_SEEDS_MAX_AGE = 7 * 86400     # persisted copy older than this is refetched
+
+# Recommendation responses depend only on seeds + tuning params, so they are
+# shared across users: in-process LRU, backed by global items in the insights table.
+RECOMMENDATION_CACHE_TTL = 86400            # 24 hours
+RECOMMENDATION_CACHE_MAX_ENTRIES = 256      # in-process LRU bound
+
+DEFAULT_PLAYLIST_PREFERENCES = {
+    "timeframe": "1m",
+    "exclude_listened": True,
+    "genres": [],
+    "discovery_genres": [],
+    "excluded_genres": [],
+}
+
+
+def _parse_played_at(played_at):
+    """Parse a Spotify ISO 8601 timestamp to epoch milliseconds."""
+    base = played_at.split(".")[0]
+    t = time.strptime(base, "%Y-%m-%dT%H:%M:%S")
+    epoch_ms = int(calendar.timegm(t) * 1000)
+    if "." in played_at:
+        frac = played_at.split(".")[1].rstrip("Z")
+        epoch_ms += int(frac[:3].ljust(3, "0"))
+    return epoch_ms
+
+
+def _record_recent_plays(user_id, token):
+    """Fetch recently-played tracks from Spotify, enrich with genres, store in H(T).
+
+    This is the H(T) accumulation mechanism — each call captures up to 50
+    recent plays and persists them with a TTL slightly beyond the longest
+    supported timeframe window (95 days).
+    """
+    result = _http_request(
+        f"{SPOTIFY_API_BASE}/v1/me/player/recently-played?limit=50",
+        headers={"Authorization": f"Bearer {token}"},
+    )
+    if result["status"] != 200:
+        return 0
+
+    items = result["body"].get("items", [])
+    if not items:
+        return 0
+
+    # Extract unique artist IDs across all tracks
+    artist_ids_seen = set()
+    for item in items:
+        for artist in item.get("track", {}).get("artists", []):
+            aid = artist.get("id")
+            if aid:
+                artist_ids_seen.add(aid)
+
+    # Batch-fetch artist details for genre data (max 50 per request)
+    genre_map = {}
+    artist_id_list = list(artist_ids_seen)
+    for i in range(0, len(artist_id_list), 50):
+        batch_ids = artist_id_list[i:i + 50]
+        ids_param = ",".join(batch_ids)
+        artist_resp = _http_request(
+            f"{SPOTIFY_API_BASE}/v1/artists?ids={ids_param}",
+            headers={"Authorization": f"Bearer {token}"},
+        )
+        if artist_resp["status"] == 200:
+            for artist in artist_resp["body"].get("artists", []):
+                if artist and artist.get("id"):
+                    genre_map[artist["id"]] = artist.get("genres", [])
+
+    # Write each play event to the play history
+    records = []
+    now_epoch = int(time.time())
+    expires_at = now_epoch + (PLAY_HISTORY_TTL_DAYS * 86400)
+
+    for item in items:
+        track = item.get("track")
+        played_at_str = item.get("played_at", "")
+        if not track or not played_at_str:
+            continue
+
+        try:
+            epoch_ms = _parse_played_at(played_at_str)
+        except (ValueError, IndexError):
+            continue
+
+        track_genres = set()
+        track_artist_ids = []
+        for artist in track.get("artists", []):
+            aid = artist.get("id")
+            if aid:
+                track_artist_ids.append(aid)
+                track_genres.update(genre_map.get(aid, []))
+
+        records.append({
+            "user_id": user_id,
+            "played_at": epoch_ms,
+            "track_id": track.get("id", ""),
+            "track_name": track.get("name", ""),
+            "artist_name": ", ".join(a.get("name", "") for a in track.get("artists", [])),
+            "artist_ids": track_artist_ids,
+            "genres": sorted(track_genres),
+            "album_name": track.get("album", {}).get("name", ""),
+            "image_url": (
+                track["album"]["images"][0]["url"]
+                if track.get("album", {}).get("images")
+                else ""
+            ),
+            "uri": track.get("uri", ""),
+            "spotify_url": track.get("external_urls", {}).get("spotify", ""),
+            "expires_at": expires_at,
+        })
+    count = _get_storage().batch_put("play_history", records)
+    track_ids = [record["track_id"] for record in records if record["track_id"]]
+
+    # Keep the persisted exclusion index in step with H(T)
+    if track_ids:
+        _add_to_exclusion_filter(user_id, track_ids)
+
+    return count
+
+
+def _build_play_history(user_id, timeframe):
+    """Query the play history for the user's plays within timeframe T."""
+    config = TIMEFRAME_CONFIG.get(timeframe)
+    if not config:
+        return []
+
+    cutoff_ms = (int(time.time()) - config["days"] * 86400) * 1000
+    return list(_get_storage().query_all(
+        "play_history", user_id, sort=(">=", cutoff_ms), attributes=PLAY_HISTORY_ATTRIBUTES,
+    ))
+
+
+def _build_spotify_supplement(token, timeframe):
+    """Fetch Spotify's supplementary data when H(T) is insufficient.
+
+    Retrieves recently-played, top tracks, and top artists from Spotify,
+    then enriches tracks with genre data from the top artists response.
+    """
+    config = TIMEFRAME_CONFIG.get(timeframe, TIMEFRAME_CONFIG["1m"])
+    spotify_range = config["spotify_time_range"]
+
+    # Recently played (raw)
+    recent_resp = _http_request(
+        f"{SPOTIFY_API_BASE}/v1/me/player/recently-played?limit=50",
+        headers={"Authorization": f"Bearer {token}"},
+    )
+    recent_tracks = []
+    if recent_resp["status"] == 200:
+        for item in recent_resp["body"].get("items", []):
+            track = item.get("track", {})
+            recent_tracks.append({
+                "track_id": track.get("id", ""),
+                "track_name": track.get("name", ""),
+                "artist_name": ", ".join(a.get("name", "") for a in track.get("artists", [])),
+                "artist_ids": [a.get("id", "") for a in track.get("artists", []) if a.get("id")],
+                "genres": [],
+            })
+
+    # Top tracks
+    top_tracks_resp = _http_request(
+        f"{SPOTIFY_API_BASE}/v1/me/top/tracks?limit=50&time_range={spotify_range}",
+        headers={"Authorization": f"Bearer {token}"},
+    )
+    top_tracks = []
+    if top_tracks_resp["status"] == 200:
+        for t in top_tracks_resp["body"].get("items", []):
+            top_tracks.append({
+                "track_id": t.get("id", ""),
+                "track_name": t.get("name", ""),
+                "artist_name": ", ".join(a.get("name", "") for a in t.get("artists", [])),
+                "artist_ids": [a.get("id", "") for a in t.get("artists", []) if a.get("id")],
+                "genres": [],
+            })
+
+    # Top artists
+    top_artists_resp = _http_request(
+        f"{SPOTIFY_API_BASE}/v1/me/top/artists?limit=50&time_range={spotify_range}",
+        headers={"Authorization": f"Bearer {token}"},
+    )
+    artists = []
+    genres_map = {}
+    if top_artists_resp["status"] == 200:
+        for a in top_artists_resp["body"].get("items", []):
+            aid = a.get("id", "")
+            genres = a.get("genres", [])
+            artists.append({
+                "artist_id": aid,
+                "artist_name": a.get("name", ""),
+                "genres": genres,
+            })
+            if aid:
+                genres_map[aid] = genres
+
+    # Enrich tracks with genres from their artists
+    all_tracks = recent_tracks + top_tracks
+    for track in all_tracks:
+        track_genres = set()
+        for aid in track.get("artist_ids", []):
+            track_genres.update(genres_map.get(aid, []))
+        track["genres"] = sorted(track_genres)
+
+    return {"tracks": all_tracks, "artists": artists, "genres_map": genres_map}
+
+
+def _compute_taste_stats(plays):
+    """Compute frequency statistics from a list of play items.
+
+    Returns dict with: N, U_tracks, U_genres, top_track_ids, top_artist_ids,
+    genre_counts, track_ids_set.
+    """
+    n = len(plays)
+    track_freq = {}
+    artist_freq = {}
+    genre_freq = {}
+    all_track_ids = set()
+
+    for play in plays:
+        tid = play.get("track_id", "")
+        if tid:
+            track_freq[tid] = track_freq.get(tid, 0) + 1
+            all_track_ids.add(tid)
+
+        for aid in play.get("artist_ids", []):
+            if aid:
+                artist_freq[aid] = artist_freq.get(aid, 0) + 1
+
+        for genre in play.get("genres", []):
+            if genre:
+                genre_freq[genre] = genre_freq.get(genre, 0) + 1
+
+    top_tracks = sorted(track_freq.items(), key=lambda x: x[1], reverse=True)[:20]
+    top_artists = sorted(artist_freq.items(), key=lambda x: x[1], reverse=True)[:20]
+
+    return {
+        "N": n,
+        "U_tracks": len(all_track_ids),
+        "U_genres": len(genre_freq),
+        "top_track_ids": top_tracks,
+        "top_artist_ids": top_artists,
+        "genre_counts": genre_freq,
+        "track_ids_set": all_track_ids,
+    }
+
+
+def _should_supplement(stats, playlist_id, selected_genres_count):
+    """Determine whether Spotify supplement data is needed.
+
+    Uses dynamic thresholds based on play-history richness.
+    """
+    if playlist_id == "essentials":
+        h_threshold = max(60, int(2.5 * stats["U_tracks"]))
+        if stats["N"] < h_threshold or stats["U_tracks"] < 25:
+            return True
+        return False
+
+    # Playlists 2-5: genre-based thresholds
+    g = selected_genres_count
+    capped_g = min(15, max(8, g))
+    h_threshold = max(80, 10 * capped_g)
+    if stats["N"] < h_threshold or stats["U_genres"] < 8:
+        return True
+    return False
+
+
+class _BloomFilter:
+    """Fixed-size Bloom filter over track IDs (double hashing on blake2b)."""
+
+    def __init__(self, bits=None, count=0):
+        self.bits = bytearray(bits) if bits else bytearray(EXCLUSION_FILTER_BITS // 8)
+        self.count = count
+
+    def _positions(self, key):
+        digest = hashlib.blake2b(key.encode("utf-8"), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], "little")
+        h2 = int.from_bytes(digest[8:], "little") | 1
+        size = len(self.bits) * 8
+        return [(h1 + i * h2) % size for i in range(EXCLUSION_FILTER_HASHES)]
+
+    def add(self, key):
+        """Set the key's bits; count it only if at least one bit flipped."""
+        flipped = False
+        for pos in self._positions(key):
+            mask = 1 << (pos & 7)
+            if not self.bits[pos >> 3] & mask:
+                self.bits[pos >> 3] |= mask
+                flipped = True
+        if flipped:
+            self.count += 1
+
+    def update(self, keys):
+        for key in keys:
+            if key:
+                self.add(key)
+
+    def __contains__(self, key):
+        return all(self.bits[pos >> 3] & (1 << (pos & 7)) for pos in self._positions(key))
+
+    def __len__(self):
+        return self.count
+
+    def to_bytes(self):
+        return zlib.compress(bytes(self.bits))
+
+    @classmethod
+    def from_bytes(cls, data, count=0):
+        return cls(zlib.decompress(data), count)
+
+
+def _load_exclusion_filter(user_id):
+    """Load the user's exclusion filter with a single read.
+
+    Returns (filter, version); filter is None if it must be (re)built.
+    """
+    item = _get_storage().get("users", {"user_id": user_id}, (
+        "exclusion_filter", "exclusion_filter_count", "exclusion_filter_version", "exclusion_filter_built_at",
+    )) or {}
+    version = int(item.get("exclusion_filter_version", 0))
+    raw = item.get("exclusion_filter")
+    if raw is None or item.get("exclusion_filter_built_at", 0) < time.time() - EXCLUSION_FILTER_REBUILD_AGE:
+        return None, version
+    raw = getattr(raw, "value", raw)
+    return _BloomFilter.from_bytes(raw, int(item.get("exclusion_filter_count", 0))), version
+
+
+def _save_exclusion_filter(user_id, bloom, version, rebuilt=False):
+    """Persist the filter if nobody else updated it since `version` was read."""
+    changes = {
+        "exclusion_filter": bloom.to_bytes(),
+        "exclusion_filter_count": bloom.count,
+        "exclusion_filter_version": version + 1,
+    }
+    condition = ("exists", "user_id")
+    if rebuilt:
+        changes["exclusion_filter_built_at"] = int(time.time())
+    else:
+        condition = ("and", condition, ("=", "exclusion_filter_version", version))
+    try:
+        _get_storage().update("users", {"user_id": user_id}, changes=changes, condition=condition)
+        return True
+    except ConditionFailed:
+        return False
+
+
+def _rebuild_exclusion_filter(user_id):
+    """Build the filter from the user's whole retained play history."""
+    bloom = _BloomFilter()
+    bloom.update(item.get("track_id") for item in _get_storage().query_all(
+        "play_history", user_id, attributes=("track_id",),
+    ))
+    _, version = _load_exclusion_filter(user_id)
+    _save_exclusion_filter(user_id, bloom, version, rebuilt=True)
+    return bloom
+
+
+def _add_to_exclusion_filter(user_id, track_ids):
+    """Incrementally add newly ingested plays to the persisted filter.
+
+    A missing or lost update is harmless: the next rebuild reads the history.
+    """
+    for _attempt in range(3):
+        bloom, version = _load_exclusion_filter(user_id)
+        if bloom is None:
+            return  # Built from full history on next use
+        bloom.update(track_ids)
+        if _save_exclusion_filter(user_id, bloom, version):
+            return
+
+
+def _build_exclusion_index(user_id, spotify_tracks):
+    """Return the membership index of track IDs to exclude from recommendations.
+
+    Covers the user's whole retained history via the persisted filter, plus the
+    current Spotify supplement tracks (in memory only).
+    """
+    bloom, _ = _load_exclusion_filter(user_id)
+    if bloom is None:
+        bloom = _rebuild_exclusion_filter(user_id)
+    bloom.update(t.get("track_id") for t in spotify_tracks)
+    return bloom
+
+
+def _merge_plays_with_supplement(h_plays, supplement_data):
+    """Merge app-recorded plays H(T) with Spotify supplement data.
+
+    H(T) items take priority — supplement only adds tracks not already present.
+    """
+    seen_track_ids = set()
+    merged = []
+
+    for play in h_plays:
+        tid = play.get("track_id", "")
+        merged.append({
+            "track_id": tid,
+            "track_name": play.get("track_name", ""),
+            "artist_name": play.get("artist_name", ""),
+            "artist_ids": play.get("artist_ids", []),
+            "genres": play.get("genres", []),
+        })
+        if tid:
+            seen_track_ids.add(tid)
+
+    for track in supplement_data.get("tracks", []):
+        tid = track.get("track_id", "")
+        if tid and tid not in seen_track_ids:
+            merged.append({
+                "track_id": tid,
+                "track_name": track.get("track_name", ""),
+                "artist_name": track.get("artist_name", ""),
+                "artist_ids": track.get("artist_ids", []),
+                "genres": track.get("genres", []),
+            })
+            seen_track_ids.add(tid)
+
+    return merged
+
+
+def _get_user_playlist_preferences(user_id):
+    """Get the user's saved playlist preferences from the users table."""
+    item = _get_storage().get("users", {"user_id": user_id}, ("playlist_preferences",))
+    if item is None:
+        return dict(DEFAULT_PLAYLIST_PREFERENCES)
+
+    stored = item.get("playlist_preferences", {})
+    if not stored or not isinstance(stored, dict):
+        return dict(DEFAULT_PLAYLIST_PREFERENCES)
+
+    prefs = dict(DEFAULT_PLAYLIST_PREFERENCES)
+    prefs.update(stored)
+
+    if prefs["timeframe"] not in TIMEFRAME_CONFIG:
+        prefs["timeframe"] = "1m"
+    for list_key in ("genres", "discovery_genres", "excluded_genres"):
+        if not isinstance(prefs.get(list_key), list):
+            prefs[list_key] = []
+    if not isinstance(prefs.get("exclude_listened"), bool):
+        prefs["exclude_listened"] = True
+
+    return prefs
+
+
+def _save_user_playlist_preferences(user_id, prefs):
+    """Validate and persist playlist preferences to the users table."""
+    if prefs.get("timeframe") not in TIMEFRAME_CONFIG:
+        raise ValueError(f"Invalid timeframe: {prefs.get('timeframe')}. "
+                         f"Must be one of {list(TIMEFRAME_CONFIG.keys())}")
+
+    for key in ("genres", "discovery_genres"):
+        val = prefs.get(key, [])
+        if not isinstance(val, list):
+            raise ValueError(f"{key} must be a list")
+        if len(val) > 15:
+            raise ValueError(f"{key} must have at most 15 items")
+
+    _get_storage().update(
+        "users", {"user_id": user_id},
+        changes={"playlist_preferences": prefs, "updated_at": int(time.time())},
+    )
+
+
+def _fetch_available_genre_seeds(token):
+    """Fetch the list of valid genre seeds from Spotify."""
+    resp = _http_request(
+        f"{SPOTIFY_API_BASE}/v1/recommendations/available-genre-seeds",
+        headers={"Authorization": f"Bearer {token}"},
+    )
+    if resp["status"] == 200:
+        return sorted(resp["body"].get("genres", []))
+    return []
+
+
+_genre_seeds_cache = {"genres": None, "set": frozenset(), "expires_at": 0}
+
+
+def _set_genre_seeds_cache(genres, ttl=GENRE_SEEDS_TTL):
+    _genre_seeds_cache["genres"] = genres
+    _genre_seeds_cache["set"] = frozenset(genres)
+    _genre_seeds_cache["expires_at"] = time.time() + ttl
+
+
+def _refresh_genre_seeds(client_token=None):
+    """Fetch genre seeds with an app token and persist them to S3.
+
+    Called by the scheduled job; also the fallback when no fresh copy exists.
+    Returns the genre list, or None if Spotify returned nothing.
+    """
+    if client_token is None:
+        client_id, client_secret = _get_spotify_app_credentials()
+        client_token = _get_client_token(client_id, client_secret)
+    genres = _fetch_available_genre_seeds(client_token)
+    if not genres:
+        return None
+    if S3_BUCKET:  # Unset in local runs: the process cache is the only copy
+        _get_s3().put_object(
+            Bucket=S3_BUCKET,
+            Key=GENRE_SEEDS_S3_KEY,
+            Body=json.dumps({"genres": genres, "updated_at": int(time.time())}),
+            ContentType="application/json",
+        )
+    _set_genre_seeds_cache(genres)
+    return genres
+
+
+def _get_available_genre_seeds():
+    """Return (sorted genre list, frozenset) of valid genre seeds.
+
+    Served from the process cache, then the persisted S3 copy; Spotify is only
+    called when neither is fresh. A stale copy is preferred over an empty list;
+    either is only cached for GENRE_SEEDS_RETRY_TTL, so Spotify is retried soon.
+    """
+    now = time.time()
+    if _genre_seeds_cache["genres"] is not None and now < _genre_seeds_cache["expires_at"]:
+        return _genre_seeds_cache["genres"], _genre_seeds_cache["set"]
+
+    persisted = None
+    try:
+        if S3_BUCKET:
+            obj = _get_s3().get_object(Bucket=S3_BUCKET, Key=GENRE_SEEDS_S3_KEY)
+            persisted = json.loads(obj["Body"].read())
+    except Exception:
+        pass
+
+    if persisted and persisted.get("genres") and now - persisted.get("updated_at", 0) < GENRE_SEEDS_MAX_AGE:
+        _set_genre_seeds_cache(persisted["genres"])
+    else:
+        try:
+            genres = _refresh_genre_seeds()
+        except Exception:
+            genres = None
+        if not genres:
+            stale = (persisted or {}).get("genres") or _genre_seeds_cache["genres"] or []
+            _set_genre_seeds_cache(stale, GENRE_SEEDS_RETRY_TTL)
+    return _genre_seeds_cache["genres"], _genre_seeds_cache["set"]
+
+
+def _filter_exclusions(tracks, exclusion_set):
+    """Remove recommended tracks whose ID is in the exclusion set.
+
+    exclusion_set may be a set or an exclusion _BloomFilter.
+    """
+    if not exclusion_set:
+        return tracks
+
+    filtered = []
+    for t in tracks:
+        tid = ""
+        uri = t.get("uri", "")
+        if uri and uri.startswith("spotify:track:"):
+            tid = uri.split(":")[-1]
+        elif t.get("url"):
+            parts = t["url"].rstrip("/").split("/")
+            if parts:
+                tid = parts[-1].split("?")[0]
+
+        if tid and tid in exclusion_set:
+            continue
+        filtered.append(t)
+    return filtered
+
+
+_rec_cache = OrderedDict()   # key -> (expires_at, tracks)
+_rec_cache_stats = {"hits": 0, "misses": 0}
+_rec_cache_lock = threading.Lock()  # theme pools are fetched on concurrent threads
+
+
+def _recommendation_cache_key(query_params):
+    """Canonical hash of seeds + tuning params (seed order is irrelevant)."""
+    canonical = {}
+    for k, v in query_params.items():
+        if k.startswith("seed_"):
+            v = ",".join(sorted(v.split(",")))
+        canonical[k] = v
+    raw = json.dumps(canonical, sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+def _get_cached_recommendations(key):
+    """Look up a shared recommendation pool in memory, then in storage."""
+    now = int(time.time())
+    with _rec_cache_lock:
+        entry = _rec_cache.get(key)
+        if entry and entry[0] >= now:
+            _rec_cache.move_to_end(key)
+            return entry[1]
+    try:
+        item = _get_storage().get("insights", {"user_id": GLOBAL_PARTITION, "insight_key": f"recs#{key}"})
+    except Exception:
+        return None
+    if not item or item.get("expires_at", 0) < now:
+        return None
+    tracks = json.loads(_unpack_payload(item) or "[]")
+    _remember_recommendations(key, int(item["expires_at"]), tracks)
+    return tracks
+
+
+def _remember_recommendations(key, expires_at, tracks):
+    with _rec_cache_lock:
+        _rec_cache[key] = (expires_at, tracks)
+        _rec_cache.move_to_end(key)
+        while len(_rec_cache) > RECOMMENDATION_CACHE_MAX_ENTRIES:
+            _rec_cache.popitem(last=False)
+
+
+def _cache_recommendations(key, tracks):
+    expires_at = int(time.time()) + RECOMMENDATION_CACHE_TTL
+    _remember_recommendations(key, expires_at, tracks)
+    try:
+        _get_storage().put("insights", {
+            "user_id": GLOBAL_PARTITION,
+            "insight_key": f"recs#{key}",
+            "data": _pack_payload(_serialize_json(tracks)),
+            "payload_format": PAYLOAD_FORMAT,
+            "created_at": int(time.time()),
+            "expires_at": expires_at,
+        })
+    except Exception:
+        pass  # The in-process copy still serves this container
+
+
+def _count_recommendation_lookup(outcome):
+    with _rec_cache_lock:
+        _rec_cache_stats[outcome] += 1
+
+
+def _reset_recommendation_cache_stats():
+    with _rec_cache_lock:
+        _rec_cache_stats.update(hits=0, misses=0)
+
+
+def _recommendation_cache_summary():
+    with _rec_cache_lock:
+        hits, misses = _rec_cache_stats["hits"], _rec_cache_stats["misses"]
+    total = hits + misses
+    return {"hits": hits, "misses": misses, "hit_rate": round(hits / total, 3) if total else 0.0}
+
+
+def _fetch_recommendations(token, seed_artists=None, seed_tracks=None,
+                            seed_genres=None, refresh=False, **params):
+    """Fetch recommendations from Spotify API.
+
+    Responses are cached across users by seeds + params; callers apply any
+    per-user exclusion filtering to the returned (shared) list. refresh=True
+    skips the cache lookup (the fresh response still replaces the entry).
+    """
+    query_params = {k: v for k, v in params.items() if v is not None}
+    if seed_artists:
+        query_params["seed_artists"] = ",".join(seed_artists[:5])
+    if seed_tracks:
+        query_params["seed_tracks"] = ",".join(seed_tracks[:5])
+    if seed_genres:
+        query_params["seed_genres"] = ",".join(seed_genres[:5])
+
+    # Total seeds must not exceed 5
+    total_seeds = len(seed_artists or []) + len(seed_tracks or []) + len(seed_genres or [])
+    if total_seeds == 0:
+        return []
+
+    cache_key = _recommendation_cache_key(query_params)
+    cached = None if refresh else _get_cached_recommendations(cache_key)
+    if cached is not None:
+        _count_recommendation_lookup("hits")
+        return cached
+    _count_recommendation_lookup("misses")
+
+    qs = urllib.parse.urlencode(query_params)
+    result = _http_request(
+        f"{SPOTIFY_API_BASE}/v1/recommendations?{qs}",
+        headers={"Authorization": f"Bearer {token}"},
+    )
+    if result["status"] != 200:
+        return []
+
+    tracks = [
+        {
+            "name": t["name"],
+            "artist": ", ".join(art["name"] for art in t.get("artists", [])),
+            "url": t["external_urls"].get("spotify", ""),
+            "uri": t.get("uri", ""),
+            "image": t["album"]["images"][0]["url"] if t.get("album", {}).get("images") else "",
+            "images": _image_variants(t.get("album", {}).get("images")),
+            "album": t.get("album", {}).get("name", ""),
+            "preview_url": t.get("preview_url"),
+        }
+        for t in result["body"].get("tracks", [])
+    ]
+    if tracks:
+        _cache_recommendations(cache_key, tracks)
+    return tracks
+
+
+def _prepare_playlist_context(user_id, token, prefs):
+    """Gather the per-user inputs for playlist seeding: H(T), the Spotify
+    supplement, the exclusion set and the validated genre selections.
+
+    Records recent plays into H(T) as a side effect.
+    """
+    timeframe = prefs["timeframe"]
+
+    # Side effect: accumulate recent plays into H(T)
+    _record_recent_plays(user_id, token)
+
+    # Build play history from storage and compute taste stats
+    h_plays = _build_play_history(user_id, timeframe)
+    h_stats = _compute_taste_stats(h_plays)
+
+    # Fetch Spotify supplement (always fetch; used for exclusion + fallback)
+    supplement_data = _build_spotify_supplement(token, timeframe)
+
+    exclusion_set = set()
+    if prefs["exclude_listened"]:
+        exclusion_set = _build_exclusion_index(user_id, supplement_data["tracks"])
+
+    available_genres, available_genres_set = _get_available_genre_seeds()
+
+    return {
+        "h_plays": h_plays,
+        "h_stats": h_stats,
+        "merged_stats": None,  # computed lazily by _playlist_stats_for
+        "supplement": supplement_data,
+        "exclusion_set": exclusion_set,
+        "available_genres": available_genres,
+        "available_genres_set": available_genres_set,
+        "valid_user_genres": [g for g in prefs.get("genres", []) if g in available_genres_set],
+        "valid_discovery_genres": [g for g in prefs.get("discovery_genres", []) if g in available_genres_set],
+        "excluded_genres_set": set(prefs.get("excluded_genres", [])),
+    }
+
+
+def _playlist_stats_for(ctx, playlist_id, genre_count):
+    """Return H(T) stats, or merged H(T)+supplement stats if H(T) is too thin."""
+    if not _should_supplement(ctx["h_stats"], playlist_id, genre_count):
+        return ctx["h_stats"]
+    if ctx["merged_stats"] is None:
+        merged_plays = _merge_plays_with_supplement(ctx["h_plays"], ctx["supplement"])
+        ctx["merged_stats"] = _compute_taste_stats(merged_plays)
+    return ctx["merged_stats"]
+
+
+def _select_theme_seeds(theme, ctx):
+    """Return (seed_artists, seed_tracks, seed_genres) for a playlist theme."""
+    pid = theme["id"]
+    seeds_a, seeds_t, seeds_g = [], [], []
+    available_genres = ctx["available_genres"]
+    excluded_genres_set = ctx["excluded_genres_set"]
+
+    if pid == "essentials":
+        stats = _playlist_stats_for(ctx, pid, len(ctx["valid_user_genres"]))
+
+        # Seeds: top artists[:3] + top tracks[:2] (max 5 total)
+        if excluded_genres_set and stats["top_artist_ids"]:
+            artist_genre_map = ctx["supplement"].get("genres_map", {})
+            filtered_artists = []
+            for aid, _count in stats["top_artist_ids"]:
+                artist_genres = set(artist_genre_map.get(aid, []))
+                if not artist_genres.intersection(excluded_genres_set):
+                    filtered_artists.append(aid)
+                if len(filtered_artists) >= 3:
+                    break
+            seeds_a = filtered_artists[:3]
+        else:
+            seeds_a = [aid for aid, _ in stats["top_artist_ids"][:3]]
+
+        seeds_t = [tid for tid, _ in stats["top_track_ids"][:2]]
+        total = len(seeds_a) + len(seeds_t)
+        if total > 5:
+            seeds_t = seeds_t[:max(0, 5 - len(seeds_a))]
+
+    elif pid in ("hidden_gems", "energy_boost", "chill_mode"):
+        stats = _playlist_stats_for(ctx, pid, len(ctx["valid_user_genres"]))
+
+        if ctx["valid_user_genres"]:
+            seeds_g = ctx["valid_user_genres"][:5]
+        else:
+            top_genres_from_stats = sorted(
+                stats["genre_counts"].items(), key=lambda x: x[1], reverse=True
+            )
+            seeds_g = [
+                g for g, _ in top_genres_from_stats
+                if g in ctx["available_genres_set"]
+            ][:5]
+
+        if not seeds_g:
+            seeds_a = [aid for aid, _ in stats["top_artist_ids"][:5]]
+
+    elif pid == "discovery_mix":
+        stats = _playlist_stats_for(ctx, pid, len(ctx["valid_discovery_genres"]))
+
+        user_genre_set = set(stats["genre_counts"].keys())
+        if ctx["valid_discovery_genres"]:
+            seeds_g = ctx["valid_discovery_genres"][:5]
+        else:
+            seeds_g = [
+                g for g in available_genres
+                if g not in user_genre_set
+            ][:5]
+        if not seeds_g:
+            seeds_g = available_genres[:5]
+
+    return seeds_a, seeds_t, seeds_g
+
+
+def _build_theme_pool(theme, ctx, token, refresh=False, seeds=None):
+    """Fetch a theme's over-fetched candidate pool, already exclusion-filtered.
+
+    The pool keeps its seeds so a regenerate can refetch it without
+    rebuilding the context.
+    """
+    seeds_a, seeds_t, seeds_g = seeds or _select_theme_seeds(theme, ctx)
+    if not seeds_a and not seeds_t and not seeds_g:
+        return {"seeded": False, "seeds": [[], [], []], "candidates": [], "served": [], "images": {}}
+
+    params = dict(theme["default_params"])
+    params["limit"] = PLAYLIST_POOL_SIZE
+    tracks = _fetch_recommendations(
+        token,
+        seed_artists=seeds_a or None,
+        seed_tracks=seeds_t or None,
+        seed_genres=seeds_g or None,
+        refresh=refresh,
+        **params,
+    )
+    if ctx["exclusion_set"]:
+        tracks = _filter_exclusions(tracks, ctx["exclusion_set"])
+    images = {}
+    return {"seeded": True, "seeds": [seeds_a, seeds_t, seeds_g],
+            "candidates": _strip_image_variants(tracks, images), "served": [], "images": images}
+
+
+def _pool_rebuild_context(user_id, prefs, listened):
+    """The context _build_theme_pool needs to refetch a pool from its seeds.
+
+    Only the exclusion set: the persisted filter plus the supplement tracks
+    stored with the pools. Makes no Spotify calls and records no plays.
+    """
+    if not prefs["exclude_listened"]:
+        return {"exclusion_set": set()}
+    return {"exclusion_set": _build_exclusion_index(user_id, [{"track_id": t} for t in listened])}
+
+
+def _pool_remaining(pool):
+    """Return the pool's candidates that have not been served yet."""
+    served = set(pool["served"])
+    return [t for t in pool["candidates"] if t.get("uri") not in served]
+
+
+def _carry_served(pool, old):
+    """Keep the served marks of the pool a rebuild from the same seeds replaces.
+
+    Tracks already shown stay out of later draws, unless that would leave
+    less than a playlist's worth, in which case the rebuilt pool starts over.
+    """
+    if pool["seeds"] != old["seeds"]:
+        return
+    candidates = {t.get("uri") for t in pool["candidates"]}
+    served = [uri for uri in old["served"] if uri in candidates]
+    if len(candidates) - len(served) >= PLAYLIST_SIZE:
+        pool["served"] = served
+
+
+def _draw_playlist(theme, pool, shuffle=False):
+    """Draw up to PLAYLIST_SIZE unserved tracks from a pool and mark them served.
+
+    The first draw keeps Spotify's ranking; regenerations re-sample at random.
+    """
+    remaining = _pool_remaining(pool)
+    if shuffle:
+        tracks = random.sample(remaining, min(PLAYLIST_SIZE, len(remaining)))
+    else:
+        tracks = remaining[:PLAYLIST_SIZE]
+    pool["served"].extend(t.get("uri") for t in tracks)
+
+    playlist = {
+        "id": theme["id"],
+        "name": theme["name"],
+        "description": theme["description"],
+        "tracks": tracks,
+    }
+    if not pool["seeded"]:
+        playlist["message"] = "Not enough data to generate this playlist"
+    return playlist
+
+
+def _iter_playlist_suggestions(user_id, token, prefs, pools, listened):
+    """Run the playlist pipeline incrementally, filling `pools` by theme id.
+
+    Yields ("stats", None, stats) once every theme's seeds are chosen, then
+    ("playlist", index, playlist) for each theme as soon as its pool has been
+    fetched and exclusion-filtered. Themes are fetched concurrently, so they
+    arrive in completion order; index is the theme's position. `listened`
+    is filled with the supplement track IDs excluded beyond the filter.
+    """
+    ctx = _prepare_playlist_context(user_id, token, prefs)
+    if prefs["exclude_listened"]:
+        listened.extend(dict.fromkeys(
+            t["track_id"] for t in ctx["supplement"]["tracks"] if t.get("track_id")
+        ))
+    # Seed selection is local; doing it first settles "supplemented" for the header
+    seeds = [_select_theme_seeds(theme, ctx) for theme in PLAYLIST_THEMES]
+    h_stats = ctx["h_stats"]
+    timeframe = prefs["timeframe"]
+    yield "stats", None, {
+        "total_plays": h_stats["N"],
+        "unique_tracks": h_stats["U_tracks"],
+        "unique_genres": h_stats["U_genres"],
+        "timeframe": timeframe,
+        "timeframe_label": TIMEFRAME_CONFIG[timeframe]["label"],
+        "supplemented": ctx["merged_stats"] is not None,
+    }
+
+    with ThreadPoolExecutor(max_workers=len(PLAYLIST_THEMES)) as executor:
+        futures = {
+            executor.submit(_build_theme_pool, theme, ctx, token, seeds=theme_seeds): i
+            for i, (theme, theme_seeds) in enumerate(zip(PLAYLIST_THEMES, seeds))
+        }
+        for future in as_completed(futures):
+            index = futures[future]
+            theme = PLAYLIST_THEMES[index]
+            pools[theme["id"]] = future.result()
+            yield "playlist", index, _draw_playlist(theme, pools[theme["id"]])
+
+
+def _generate_playlist_suggestions(user_id, token, prefs):
+    """Run the full playlist pipeline. Returns (result, pools, listened)."""
+    pools = {}
+    listened = []
+    result = {"playlists": [None] * len(PLAYLIST_THEMES), "preferences": prefs, "stats": None}
+    for kind, index, payload in _iter_playlist_suggestions(user_id, token, prefs, pools, listened):
+        if kind == "stats":
+            result["stats"] = payload
+        else:
+            result["playlists"][index] = payload
+    return result, pools, listened
+
+
+def _playlist_image_variants(result, pools):
+    """Image variants of the tracks drawn into `result`, taken from their pools."""
+    variants = {}
+    for pool in pools.values():
+        variants.update(pool.get("images") or {})
+    return {
+        track["image"]: variants[track["image"]]
+        for playlist in result["playlists"] if playlist
+        for track in playlist["tracks"] if track.get("image") in variants
+    }
+
+
+def _store_playlist_suggestions(user_id, result, pools, listened):
+    """Cache playlist suggestions and their candidate pools for 72 hours.
+
+    The suggestions item keeps its tracks' image variants in a separate
+    `images` attribute; pools keep theirs in the pool. The pools item keeps
+    the `listened` supplement track IDs for regenerate's pool rebuilds.
+    """
+    now = int(time.time())
+    images = _playlist_image_variants(result, pools)
+    for insight_key, data in (("playlist_suggestions", result), ("playlist_pools", pools)):
+        body = _serialize_json(data)
+        item = {
+            "user_id": user_id,
+            "insight_key": insight_key,
+            "data": _pack_payload(body),
+            "payload_format": PAYLOAD_FORMAT,
+            "content_hash": _content_hash(body),
+            "created_at": now,
+            "expires_at": now + PLAYLIST_CACHE_TTL,
+        }
+        if insight_key == "playlist_suggestions":
+            item["images"] = _pack_payload(_serialize_json(images))
+        else:
+            item["listened"] = _pack_payload(_serialize_json(listened))
+        _get_storage().put("insights", item)
+
+
+def _get_playlist_pools(user_id):
+    """Return the cached (pools, listened), or (None, []) if absent or expired."""
+    item = _get_storage().get(
+        "insights", {"user_id": user_id, "insight_key": "playlist_pools"},
+        ("data", "listened", "payload_format", "expires_at"),
+    )
+    if not item or item.get("expires_at", 0) < int(time.time()):
+        return None, []
+    return json.loads(_unpack_payload(item)), json.loads(_unpack_payload(item, "listened") or "[]")
+
+
+def _refresh_playlist_suggestions(user_id, token):
+    """Generate and cache a fresh set of playlist suggestions. Returns them."""
+    prefs = _get_user_playlist_preferences(user_id)
+    result, pools, listened = _generate_playlist_suggestions(user_id, token, prefs)
+    _store_playlist_suggestions(user_id, result, pools, listened)
+    return result
+
+
+def _invalidate_playlist_suggestions(user_id):
+    """Drop cached playlist suggestions and their candidate pools."""
+    for insight_key in ("playlist_suggestions", "playlist_pools"):
+        _get_storage().delete("insights", {"user_id": user_id, "insight_key": insight_key})
+
+
+def _stream_playlist_suggestions(user_id, token, cached=None, projection=None, images=None):
+    """Yield playlist suggestions as NDJSON lines.
+
+    A {"type": "stats"} header comes first, then one {"type": "playlist"} line
+    per theme as soon as it is ready, then {"type": "done"}. A fresh result is
+    cached once complete. Time to first playlist is emitted as a metric.
+    `images` holds the cached result's image variants for the projection.
+    """
+    started = time.monotonic()
+    first_ms = None
+    pools = {}
+    listened = []
+    if cached is not None:
+        result = cached
+        events = [("stats", None, cached["stats"])]
+        events += [("playlist", i, p) for i, p in enumerate(cached["playlists"])]
+    else:
+        prefs = _get_user_playlist_preferences(user_id)
+        result = {"playlists": [None] * len(PLAYLIST_THEMES), "preferences": prefs, "stats": None}
+        events = _iter_playlist_suggestions(user_id, token, prefs, pools, listened)
+
+    for kind, index, payload in events:
+        if kind == "stats":
+            result["stats"] = payload
+            line = {"type": "stats", "stats": payload, "preferences": result["preferences"]}
+        else:
+            result["playlists"][index] = payload
+            if projection is not None:
+                variants = images if cached is not None else pools[payload["id"]]["images"]
+                payload = _project_value(payload, *projection, variants)
+            line = {"type": "playlist", "index": index, "playlist": payload}
+            if first_ms is None:
+                first_ms = (time.monotonic() - started) * 1000
+        yield _serialize_json(line) + "\n"
+
+    if cached is None:
+        _store_playlist_suggestions(user_id, result, pools, listened)
+    total_ms = (time.monotonic() - started) * 1000
+    yield _serialize_json({"type": "done", "count": len(result["playlists"])}) + "\n"
+    _emit_metrics({
+        "PlaylistTimeToFirst": (round(first_ms or total_ms, 2), "Milliseconds"),
+        "PlaylistStreamTime": (round(total_ms, 2), "Milliseconds"),
+    }, Cached="true" if cached is not None else "false")
+
+
+def handle_playlist_suggestions_stream(event, write):
+    """Streaming entry point for playlist suggestions.
+
+    Calls write(line) with each NDJSON line as it is produced, for transports
+    that can flush incrementally (a streaming Function URL adapter or a local
+    harness). Returns an error response if one occurs before any output,
+    otherwise None.
+    """
+    user_id, err = _require_auth(event)
+    if err:
+        return err
+    projection, err = _parse_projection(event)
+    if err:
+        return err
+    qs = event.get("queryStringParameters") or {}
+    try:
+        cached = None
+        if qs.get("force", "").lower() != "true":
+            cached = _get_cached_insight(user_id, "playlist_suggestions", wait_for_build=True)
+        token = None
+        images = None
+        if cached is None:
+            token = _get_user_access_token(user_id)
+            if not token:
+                return _json_response(401, {"error": "Spotify account not connected"})
+        elif _projection_needs_images(projection):
+            images = _get_image_variants(user_id, ["playlist_suggestions"])
+        for line in _stream_playlist_suggestions(user_id, token, cached, projection, images):
+            write(line)
+        return None
+    except Exception as e:
+        return _json_response(500, {"error": str(e)})
+
+
+def _project_suggestions(user_id, result, projection):
+    """Apply ?fields= / ?image_size= to stored suggestions."""
+    images = None
+    if _projection_needs_images(projection):
+        images = _get_image_variants(user_id, ["playlist_suggestions"])
+    return _project_response(result, projection, images)
+
+
+def handle_playlist_suggestions(event):
+    """Generate 5 curated playlists using play-history H(T), Spotify supplement,
+    user preferences, and exclusion filtering.
+
+    Supports ?force=true to bypass cache, ?fields= / ?image_size=, and
+    ?stream=ndjson for the line-per-playlist format (buffered by API Gateway;
+    see handle_playlist_suggestions_stream).
+    """
+    qs = event.get("queryStringParameters") or {}
+    if qs.get("stream") == "ndjson":
+        lines = []
+        err = handle_playlist_suggestions_stream(event, lines.append)
+        if err:
+            return err
+        return {
+            "statusCode": 200,
+            "headers": {"Content-Type": "application/x-ndjson", "Cache-Control": "no-store"},
+            "body": "".join(lines),
+        }
+
+    user_id, err = _require_auth(event)
+    if err:
+        return err
+    projection, err = _parse_projection(event)
+    if err:
+        return err
+
+    # Check for force-refresh query param
+    force = qs.get("force", "").lower() == "true"
+
+    if not force:
+        cached = _get_cached_insight(user_id, "playlist_suggestions", wait_for_build=True, raw=True)
+        if cached:
+            return _json_response(200, _project_suggestions(user_id, cached, projection))
+
+    try:
+        token = _get_user_access_token(user_id)
+        if not token:
+            return _json_response(401, {"error": "Spotify account not connected"})
+
+        result = _refresh_playlist_suggestions(user_id, token)
+
+        return _json_response(200, _project_suggestions(user_id, result, projection))
+
+    except Exception as e:
+        return _json_response(500, {"error": str(e)})
+
+
+def handle_save_playlist(event):
+    """Save a curated playlist to the user's Spotify account."""
+    user_id, err = _require_auth(event)
+    if err:
+        return err
+
+    try:
+        body = json.loads(event.get("body") or "{}")
+    except (json.JSONDecodeError, TypeError):
+        return _json_response(400, {"error": "Invalid JSON body"})
+
+    playlist_name = body.get("playlist_name", "").strip()
+    track_uris = body.get("track_uris", [])
+    description = body.get("description", "").strip()
+
+    if not playlist_name:
+        return _json_response(400, {"error": "playlist_name is required"})
+    if not track_uris or not isinstance(track_uris, list):
+        return _json_response(400, {"error": "track_uris must be a non-empty list"})
+
+    try:
+        token = _get_user_access_token(user_id)
+        if not token:
+            return _json_response(401, {"error": "Spotify account not connected"})
+
+        # Get user's Spotify ID
+        profile = _http_request(
+            f"{SPOTIFY_API_BASE}/v1/me",
+            headers={"Authorization": f"Bearer {token}"},
+        )
+        if profile["status"] != 200:
+            return _json_response(500, {"error": "Could not fetch Spotify profile"})
+
+        spotify_user_id = profile["body"]["id"]
+
+        # Create the playlist
+        create_result = _http_request(
+            f"{SPOTIFY_API_BASE}/v1/users/{spotify_user_id}/playlists",
+            headers={
+                "Authorization": f"Bearer {token}",
+                "Content-Type": "application/json",
+            },
+            data=json.dumps({
+                "name": playlist_name,
+                "description": description or f"Curated by babasanmiadeyemi.com",
+                "public": True,
+            }).encode("utf-8"),
+            method="POST",
+        )
+        if create_result["status"] not in (200, 201):
+            error_body = create_result["body"]
+            if isinstance(error_body, dict):
+                error_body = json.dumps(error_body)
+            return _json_response(500, {"error": f"Failed to create playlist: {error_body}"})
+
+        playlist_id = create_result["body"]["id"]
+        playlist_url = create_result["body"]["external_urls"].get("spotify", "")
+
+        # Add tracks to the playlist (max 100 per request)
+        for i in range(0, len(track_uris), 100):
+            batch = track_uris[i:i + 100]
+            add_result = _http_request(
+                f"{SPOTIFY_API_BASE}/v1/playlists/{playlist_id}/tracks",
+                headers={
+                    "Authorization": f"Bearer {token}",
+                    "Content-Type": "application/json",
+                },
+                data=json.dumps({"uris": batch}).encode("utf-8"),
+                method="POST",
+            )
+            if add_result["status"] not in (200, 201):
+                pass  # Continue even if a batch fails
+
+        return _json_response(201, {
+            "message": "Playlist created successfully",
+            "playlist_id": playlist_id,
+            "playlist_url": playlist_url,
+        })
+    except Exception as e:
+        return _json_response(500, {"error": str(e)})
+
+
+def handle_get_playlist_preferences(event):
+    """GET /api/me/playlists/preferences — return current preferences and available genres."""
+    user_id, err = _require_auth(event)
+    if err:
+        return err
+
+    try:
+        prefs = _get_user_playlist_preferences(user_id)
+        available_genres, _ = _get_available_genre_seeds()
+
+        return _json_response(200, {
+            "preferences": prefs,
+            "available_genres": available_genres,
+        })
+    except Exception as e:
+        return _json_response(500, {"error": str(e)})
+
+
+def handle_put_playlist_preferences(event):
+    """PUT /api/me/playlists/preferences — validate and save playlist preferences."""
+    user_id, err = _require_auth(event)
+    if err:
+        return err
+
+    try:
+        body = json.loads(event.get("body") or "{}")
+    except (json.JSONDecodeError, TypeError):
+        return _json_response(400, {"error": "Invalid JSON body"})
+
+    try:
+        current = _get_user_playlist_preferences(user_id)
+        validated = dict(current)
+
+        if "timeframe" in body:
+            validated["timeframe"] = body["timeframe"]
+        if "exclude_listened" in body:
+            validated["exclude_listened"] = bool(body["exclude_listened"])
+        if "genres" in body:
+            validated["genres"] = list(body["genres"])[:15]
+        if "discovery_genres" in body:
+            validated["discovery_genres"] = list(body["discovery_genres"])[:15]
+        if "excluded_genres" in body:
+            validated["excluded_genres"] = list(body["excluded_genres"])[:15]
+
+        _save_user_playlist_preferences(user_id, validated)
+
+        # Invalidate playlist cache since preferences changed
+        _invalidate_playlist_suggestions(user_id)
+
+        return _json_response(200, {"preferences": validated, "message": "Preferences saved"})
+
+    except ValueError as e:
+        return _json_response(400, {"error": str(e)})
+    except Exception as e:
+        return _json_response(500, {"error": str(e)})
+
+
+def handle_available_genres(event):
+    """GET /api/me/playlists/genres — return valid Spotify genre seeds."""
+    user_id, err = _require_auth(event)
+    if err:
+        return err
+
+    try:
+        genres, _ = _get_available_genre_seeds()
+        return _json_response(200, {"genres": genres, "count": len(genres)})
+    except Exception as e:
+        return _json_response(500, {"error": str(e)})
+
+
+def handle_playlist_regenerate(event):
+    """POST /api/me/playlists/regenerate — re-sample playlists from cached pools.
+
+    Themes are re-drawn locally from their candidate pools; a theme's pool is
+    only rebuilt once it runs low, from its stored seeds (a token refresh and
+    one /recommendations call). Supports ?theme=<id> to rebuild just that
+    theme's pool, and ?fields= / ?image_size= like the suggestions route.
+    Falls back to a full regeneration when no pools are cached.
+    """
+    user_id, err = _require_auth(event)
+    if err:
+        return err
+    projection, err = _parse_projection(event)
+    if err:
+        return err
+
+    qs = event.get("queryStringParameters") or {}
+    theme_id = qs.get("theme")
+    themes_by_id = {t["id"]: t for t in PLAYLIST_THEMES}
+    if theme_id and theme_id not in themes_by_id:
+        return _json_response(400, {"error": f"Unknown theme: {theme_id}. "
+                                             f"Must be one of {list(themes_by_id)}"})
+
+    try:
+        result = _get_cached_insight(user_id, "playlist_suggestions")
+        pools, listened = _get_playlist_pools(user_id)
+        if (not result or not pools or set(pools) != set(themes_by_id)
+                or not all("seeds" in pool for pool in pools.values())):
+            _invalidate_playlist_suggestions(user_id)
+            if event.get("queryStringParameters") is None:
+                event["queryStringParameters"] = {}
+            event["queryStringParameters"]["force"] = "true"
+            return handle_playlist_suggestions(event)
+
+        token = None
+        ctx = None
+        playlists = {p["id"]: p for p in result["playlists"]}
+        for theme in PLAYLIST_THEMES:
+            pid = theme["id"]
+            if theme_id and pid != theme_id:
+                continue
+            pool = pools[pid]
+            if pid == theme_id or (pool["seeded"] and len(_pool_remaining(pool)) < PLAYLIST_SIZE):
+                if ctx is None:
+                    token = _get_user_access_token(user_id)
+                    if not token:
+                        return _json_response(401, {"error": "Spotify account not connected"})
+                    ctx = _pool_rebuild_context(user_id, result["preferences"], listened)
+                rebuilt = _build_theme_pool(theme, ctx, token, refresh=True, seeds=pool["seeds"])
+                _carry_served(rebuilt, pool)
+                pool = pools[pid] = rebuilt
+            playlists[pid] = _draw_playlist(theme, pool, shuffle=True)
+
+        result["playlists"] = [playlists[t["id"]] for t in PLAYLIST_THEMES if t["id"] in playlists]
+        _store_playlist_suggestions(user_id, result, pools, listened)
+        images = _playlist_image_variants(result, pools) if _projection_needs_images(projection) else None
+        return _json_response(200, _project_response(result, projection, images))
+    except Exception as e:
+        return _json_response(500, {"error": str(e)})
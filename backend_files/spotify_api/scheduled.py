@@ -0,0 +1,123 @@
+"""Scheduled refresh (EventBridge) and async task handlers."""
+import json
+
+from .core import (
+    S3_BUCKET, _emit_metrics, _get_client_token, _get_s3, _get_spotify_app_credentials,
+    _get_storage, _get_user_access_token,
+)
+from .outbox import _drain_outbox
+from .country_stats import _rebuild_country_stats
+from .insights import _fetch_new_releases, _prewarm_user_insights
+from .deletion import _run_data_deletion
+from .access import _rebuild_access_counts
+from .playlists import (
+    _recommendation_cache_summary, _refresh_genre_seeds, _refresh_playlist_suggestions,
+    _reset_recommendation_cache_stats,
+)
+
+
+# ─── Scheduled Handler (EventBridge) ─────────────────────────────────────────
+def handle_scheduled_refresh(event):
+    """Scheduled job (every 3 days): refresh public new releases and genre seeds,
+    then generate playlists for all users."""
+    errors = []
+    summary = {"new_releases": 0, "genre_seeds": 0, "users_processed": 0, "users_failed": 0}
+    _reset_recommendation_cache_stats()
+
+    # 1. Refresh public new releases
+    try:
+        client_id, client_secret = _get_spotify_app_credentials()
+        client_token = _get_client_token(client_id, client_secret)
+        releases = _fetch_new_releases(client_token)
+
+        s3 = _get_s3()
+        s3.put_object(
+            Bucket=S3_BUCKET,
+            Key="data/spotify_data.json",
+            Body=json.dumps({"albums": releases}),
+            ContentType="application/json",
+        )
+        summary["new_releases"] = len(releases)
+    except Exception as e:
+        errors.append(f"New releases refresh failed: {e}")
+
+    # 2. Refresh the shared genre-seed list used by every user's playlists
+    try:
+        genres = _refresh_genre_seeds()
+        summary["genre_seeds"] = len(genres or [])
+    except Exception as e:
+        errors.append(f"Genre seeds refresh failed: {e}")
+
+    # 3. Generate playlists for all users with tokens
+    try:
+        for item in _get_storage().scan("tokens", ("user_id",)):
+            uid = item.get("user_id")
+            if not uid:
+                continue
+            try:
+                token = _get_user_access_token(uid)
+                if not token:
+                    continue
+
+                _refresh_playlist_suggestions(uid, token)
+                summary["users_processed"] += 1
+
+            except Exception as ue:
+                summary["users_failed"] += 1
+                errors.append(f"User {uid}: {ue}")
+
+    except Exception as e:
+        errors.append(f"User playlist generation scan failed: {e}")
+
+    # 4. Rebuild materialized country stats (corrects any incremental drift)
+    try:
+        summary["countries"] = _rebuild_country_stats()
+    except Exception as e:
+        errors.append(f"Country stats rebuild failed: {e}")
+
+    # 5. Deliver anything left in the email outbox (including admin digests)
+    try:
+        summary["emails"] = _drain_outbox(include_digest=True)
+    except Exception as e:
+        errors.append(f"Email outbox drain failed: {e}")
+
+    # 6. Reconcile access-request counters with the table
+    try:
+        summary["access_requests"] = _rebuild_access_counts()["total"]
+    except Exception as e:
+        errors.append(f"Access request counter reconcile failed: {e}")
+
+    summary["recommendation_cache"] = _recommendation_cache_summary()
+    _emit_metrics({
+        "RecommendationCacheHits": (summary["recommendation_cache"]["hits"], "Count"),
+        "RecommendationCacheMisses": (summary["recommendation_cache"]["misses"], "Count"),
+        "RecommendationCacheHitRate": (summary["recommendation_cache"]["hit_rate"], "None"),
+    }, Source="scheduled")
+
+    status = 200 if not errors else 207
+    return {
+        "statusCode": status,
+        "body": json.dumps({
+            "summary": summary,
+            "errors": errors[:10] if errors else [],
+        }),
+    }
+
+
+# ─── Async Task Handlers ─────────────────────────────────────────────────────
+def handle_outbox_drain(event):
+    """Drain the email outbox (async self-invocation or hourly schedule)."""
+    summary = _drain_outbox(include_digest=bool(event.get("include_digest")))
+    return {"statusCode": 200, "body": json.dumps({"summary": summary})}
+
+
+def handle_insights_prewarm(event):
+    """Prewarm a user's insight caches after login."""
+    written = _prewarm_user_insights(event["user_id"], owner=bool(event.get("owner")))
+    return {"statusCode": 200, "body": json.dumps({"prewarmed": written})}
+
+
+def handle_data_deletion(event):
+    """Run a user data deletion job dispatched by handle_delete_data."""
+    deleted = _run_data_deletion(event["user_id"], event["job_id"], event.get("email", ""))
+    return {"statusCode": 200, "body": json.dumps({"deleted": deleted})}
@@ -0,0 +1,879 @@
+"""Storage backends for every table the API persists to.
+
+Route modules never call DynamoDB directly: they go through the Storage from
+core._get_storage(), naming tables logically ("users", "sessions", ...) and
+passing plain Python items. STORAGE_BACKEND picks the implementation:
+
+  dynamodb  production default: the low-level client with a fast codec
+  memory    in-process dicts, for local profiling and load tests
+  sqlite    a local SQLite file (STORAGE_SQLITE_PATH) that survives restarts
+
+All three share the key schema below and one small condition/update
+vocabulary, so a handler behaves the same on each. The local backends hide an
+item from reads once its TTL attribute has passed and purge expired items
+periodically, standing in for DynamoDB's TTL sweeper.
+"""
+import base64
+import json
+import operator
+import queue
+import threading
+import time
+from collections import namedtuple
+from contextlib import closing, contextmanager
+from decimal import Decimal
+
+
+# ─── Key Schema ──────────────────────────────────────────────────────────────
+# Mirrors infrastructure/modules/dynamodb: partition and sort key, the GSIs
+# the handlers query (name -> (partition, sort)) and the TTL attribute.
+TableSchema = namedtuple("TableSchema", "partition sort indexes ttl")
+
+TABLE_SCHEMAS = {
+    "users": TableSchema("user_id", None, {"spotify-user-id-index": ("spotify_user_id", None)}, None),
+    "tokens": TableSchema("user_id", None, {}, None),
+    "sessions": TableSchema("session_id", None, {"user-id-index": ("user_id", None)}, "expires_at"),
+    "insights": TableSchema("user_id", "insight_key", {}, "expires_at"),
+    "access_requests": TableSchema("request_id", None, {"status-index": ("status", "requested_at")}, None),
+    "play_history": TableSchema("user_id", "played_at", {}, "expires_at"),
+    "email_outbox": TableSchema("job_id", None, {"status-index": ("status", "created_at")}, "expires_at"),
+}
+
+
+def _key_attributes(table, index=None):
+    """(partition, sort) attribute names of a table or one of its indexes."""
+    schema = TABLE_SCHEMAS[table]
+    if index is None:
+        return schema.partition, schema.sort
+    return schema.indexes[index]
+
+
+def _page_key(table, index, item):
+    """The key a query resumes after: the table key plus the index key."""
+    names = [a for a in (*_key_attributes(table), *(_key_attributes(table, index) if index else ())) if a]
+    return {name: item[name] for name in names if name in item}
+
+
+# ─── Conditions and Updates ──────────────────────────────────────────────────
+# Conditions are nested tuples, checked against the stored item (an absent
+# item has no attributes):
+#   ("exists", attr)  ("missing", attr)  ("=" | "<" | "<=" | ">" | ">=", attr, value)
+#   ("and", cond, ...)  ("or", cond, ...)
+# Query sort-key conditions: ("=" | "<" | "<=" | ">" | ">=", value),
+# ("between", low, high) and ("begins_with", prefix).
+class ConditionFailed(Exception):
+    """A conditional write was not applied because its condition was false."""
+
+
+_COMPARE = {
+    "=": operator.eq, "<": operator.lt, "<=": operator.le, ">": operator.gt, ">=": operator.ge,
+}
+
+
+def _compare(op, value, operand):
+    try:
+        return _COMPARE[op](value, operand)
+    except TypeError:
+        return False  # Mismatched types never match, as in DynamoDB
+
+
+def _matches(condition, item):
+    op = condition[0]
+    if op == "and":
+        return all(_matches(c, item) for c in condition[1:])
+    if op == "or":
+        return any(_matches(c, item) for c in condition[1:])
+    if op == "exists":
+        return condition[1] in item
+    if op == "missing":
+        return condition[1] not in item
+    return condition[1] in item and _compare(op, item[condition[1]], condition[2])
+
+
+def _sort_matches(sort, value):
+    op = sort[0]
+    if op == "between":
+        return _compare(">=", value, sort[1]) and _compare("<=", value, sort[2])
+    if op == "begins_with":
+        return isinstance(value, str) and value.startswith(sort[1])
+    return _compare(op, value, sort[1])
+
+
+# ─── Storage Interface ───────────────────────────────────────────────────────
+class Storage:
+    """What every backend implements. Keys and items are plain dicts."""
+
+    def get(self, table, key, attributes=None, consistent=False):
+        """Return the item for `key` (only `attributes`, if given), or None."""
+        raise NotImplementedError
+
+    def put(self, table, item, condition=None):
+        """Create or replace an item. Raises ConditionFailed."""
+        raise NotImplementedError
+
+    def update(self, table, key, changes=None, increments=None, defaults=None, remove=(),
+               condition=None, return_old=False):
+        """Update an item in place, creating it if absent. Raises ConditionFailed.
+
+        changes sets attributes, increments adds to numbers (from 0), defaults
+        sets only attributes that are absent and remove deletes attributes.
+        With return_old the previous item ({} if none) is returned.
+        """
+        raise NotImplementedError
+
+    def delete(self, table, key, condition=None, return_old=False):
+        """Delete an item; with return_old, return the deleted item or None.
+
+        Raises ConditionFailed.
+        """
+        raise NotImplementedError
+
+    def query(self, table, partition, sort=None, index=None, attributes=None,
+              forward=True, limit=None, start_key=None):
+        """One page of a partition in sort-key order: (items, last_key).
+
+        last_key is None on the last page; otherwise pass it back as start_key.
+        """
+        raise NotImplementedError
+
+    def query_all(self, table, partition, **kwargs):
+        """Yield every item of a query, following pagination."""
+        start_key = None
+        while True:
+            items, start_key = self.query(table, partition, start_key=start_key, **kwargs)
+            yield from items
+            if not start_key:
+                return
+
+    def batch_get(self, table, keys, attributes=None):
+        """Yield the items that exist for `keys`, in any order (duplicates dropped)."""
+        raise NotImplementedError
+
+    def batch_put(self, table, items):
+        """Write many items unconditionally. Returns the number written."""
+        raise NotImplementedError
+
+    def batch_delete(self, table, keys):
+        """Delete `keys` (any iterable). Returns the number of keys deleted."""
+        raise NotImplementedError
+
+    def scan(self, table, attributes=None, segments=1):
+        """Yield every item in a table; segments > 1 may scan in parallel."""
+        raise NotImplementedError
+
+
+# ─── DynamoDB Codec ──────────────────────────────────────────────────────────
+# The boto3 resource layer's TypeDeserializer turns every number into a
+# Decimal (slow on list-heavy items, and needs coercing before JSON). This
+# codec maps numbers straight to int/float.
+def _decode_number(value):
+    try:
+        return int(value)
+    except ValueError:
+        return float(value)
+
+
+def _decode_list(values):
+    # Lists of strings (artist_ids, genres) are the common case
+    return [v["S"] if "S" in v else _decode_value(v) for v in values]
+
+
+_DECODERS = {
+    "B": lambda v: v,
+    "BOOL": lambda v: v,
+    "NULL": lambda v: None,
+    "M": lambda v: {k: _decode_value(x) for k, x in v.items()},
+    "L": _decode_list,
+    "SS": set,
+    "NS": lambda v: {_decode_number(n) for n in v},
+    "BS": set,
+}
+
+
+def _decode_value(attribute_value):
+    if "S" in attribute_value:
+        return attribute_value["S"]
+    if "N" in attribute_value:
+        return _decode_number(attribute_value["N"])
+    for tag, value in attribute_value.items():
+        return _DECODERS[tag](value)
+
+
+def _decode_item(item):
+    """Decode a low-level DynamoDB item ({"attr": {"S": ...}}) to plain Python."""
+    return {name: _decode_value(value) for name, value in item.items()}
+
+
+def _encode_value(value):
+    if isinstance(value, str):
+        return {"S": value}
+    if isinstance(value, bool):
+        return {"BOOL": value}
+    if isinstance(value, (int, float, Decimal)):
+        return {"N": str(value)}
+    if isinstance(value, (bytes, bytearray)):
+        return {"B": bytes(value)}
+    if value is None:
+        return {"NULL": True}
+    if isinstance(value, dict):
+        return {"M": {k: _encode_value(v) for k, v in value.items()}}
+    if isinstance(value, (list, tuple)):
+        return {"L": [_encode_value(v) for v in value]}
+    if isinstance(value, (set, frozenset)) and value:
+        sample = next(iter(value))
+        if isinstance(sample, str):
+            return {"SS": list(value)}
+        if isinstance(sample, (bytes, bytearray)):
+            return {"BS": [bytes(v) for v in value]}
+        return {"NS": [str(v) for v in value]}
+    raise TypeError(f"Cannot encode {type(value).__name__} for DynamoDB")
+
+
+def _encode_item(item):
+    return {name: _encode_value(value) for name, value in item.items()}
+
+
+# ─── DynamoDB Backend ────────────────────────────────────────────────────────
+DYNAMODB_BATCH_GET_MAX = 100
+DYNAMODB_BATCH_WRITE_MAX = 25
+DYNAMODB_MAX_BATCH_RETRIES = 8
+
+
+class _Expression:
+    """Builds one request's expressions, aliasing every name and value."""
+
+    def __init__(self):
+        self.names = {}
+        self.values = {}
+        self._aliases = {}
+
+    def name(self, attribute):
+        alias = self._aliases.get(attribute)
+        if alias is None:
+            alias = self._aliases[attribute] = f"#n{len(self._aliases)}"
+            self.names[alias] = attribute
+        return alias
+
+    def value(self, value):
+        alias = f":v{len(self.values)}"
+        self.values[alias] = _encode_value(value)
+        return alias
+
+    def condition(self, condition):
+        op = condition[0]
+        if op in ("and", "or"):
+            return "(" + f" {op.upper()} ".join(self.condition(c) for c in condition[1:]) + ")"
+        if op == "exists":
+            return f"attribute_exists({self.name(condition[1])})"
+        if op == "missing":
+            return f"attribute_not_exists({self.name(condition[1])})"
+        return f"{self.name(condition[1])} {op} {self.value(condition[2])}"
+
+    def key_condition(self, partition_attribute, partition, sort_attribute, sort):
+        expression = f"{self.name(partition_attribute)} = {self.value(partition)}"
+        if not sort:
+            return expression
+        name = self.name(sort_attribute)
+        if sort[0] == "between":
+            return expression + f" AND {name} BETWEEN {self.value(sort[1])} AND {self.value(sort[2])}"
+        if sort[0] == "begins_with":
+            return expression + f" AND begins_with({name}, {self.value(sort[1])})"
+        return expression + f" AND {name} {sort[0]} {self.value(sort[1])}"
+
+    def projection(self, attributes):
+        return ", ".join(self.name(a) for a in attributes)
+
+    def request(self, **kwargs):
+        if self.names:
+            kwargs["ExpressionAttributeNames"] = self.names
+        if self.values:
+            kwargs["ExpressionAttributeValues"] = self.values
+        return kwargs
+
+
+def _retry_backoff(attempt, operation, table_name):
+    if attempt >= DYNAMODB_MAX_BATCH_RETRIES:
+        raise RuntimeError(f"{operation} on {table_name} did not complete")
+    time.sleep(min(2.0, 0.05 * (2 ** attempt)))
+
+
+class DynamoDBStorage(Storage):
+    """Production backend. table_names maps logical names to table names."""
+
+    def __init__(self, table_names, region):
+        import boto3
+        self._client = boto3.client("dynamodb", region_name=region)
+        self._conditional_failed = self._client.exceptions.ConditionalCheckFailedException
+        self._names = table_names
+
+    def get(self, table, key, attributes=None, consistent=False):
+        expression = _Expression()
+        kwargs = {"TableName": self._names[table], "Key": _encode_item(key)}
+        if attributes:
+            kwargs["ProjectionExpression"] = expression.projection(attributes)
+        if consistent:
+            kwargs["ConsistentRead"] = True
+        item = self._client.get_item(**expression.request(**kwargs)).get("Item")
+        return _decode_item(item) if item is not None else None
+
+    def put(self, table, item, condition=None):
+        expression = _Expression()
+        kwargs = {"TableName": self._names[table], "Item": _encode_item(item)}
+        if condition:
+            kwargs["ConditionExpression"] = expression.condition(condition)
+        try:
+            self._client.put_item(**expression.request(**kwargs))
+        except self._conditional_failed:
+            raise ConditionFailed(table) from None
+
+    def update(self, table, key, changes=None, increments=None, defaults=None, remove=(),
+               condition=None, return_old=False):
+        expression = _Expression()
+        assignments = [f"{expression.name(a)} = {expression.value(v)}" for a, v in (changes or {}).items()]
+        for attribute, value in (defaults or {}).items():
+            name = expression.name(attribute)
+            assignments.append(f"{name} = if_not_exists({name}, {expression.value(value)})")
+        clauses = []
+        if assignments:
+            clauses.append("SET " + ", ".join(assignments))
+        if increments:
+            clauses.append("ADD " + ", ".join(
+                f"{expression.name(a)} {expression.value(v)}" for a, v in increments.items()
+            ))
+        if remove:
+            clauses.append("REMOVE " + ", ".join(expression.name(a) for a in remove))
+        kwargs = {
+            "TableName": self._names[table],
+            "Key": _encode_item(key),
+            "UpdateExpression": " ".join(clauses),
+        }
+        if condition:
+            kwargs["ConditionExpression"] = expression.condition(condition)
+        if return_old:
+            kwargs["ReturnValues"] = "ALL_OLD"
+        try:
+            resp = self._client.update_item(**expression.request(**kwargs))
+        except self._conditional_failed:
+            raise ConditionFailed(table) from None
+        if return_old:
+            return _decode_item(resp.get("Attributes") or {})
+        return None
+
+    def delete(self, table, key, condition=None, return_old=False):
+        expression = _Expression()
+        kwargs = {"TableName": self._names[table], "Key": _encode_item(key)}
+        if condition:
+            kwargs["ConditionExpression"] = expression.condition(condition)
+        if return_old:
+            kwargs["ReturnValues"] = "ALL_OLD"
+        try:
+            old = self._client.delete_item(**expression.request(**kwargs)).get("Attributes")
+        except self._conditional_failed:
+            raise ConditionFailed(table) from None
+        return _decode_item(old) if old else None
+
+    def query(self, table, partition, sort=None, index=None, attributes=None,
+              forward=True, limit=None, start_key=None):
+        partition_attribute, sort_attribute = _key_attributes(table, index)
+        expression = _Expression()
+        kwargs = {
+            "TableName": self._names[table],
+            "KeyConditionExpression": expression.key_condition(
+                partition_attribute, partition, sort_attribute, sort
+            ),
+        }
+        if attributes:
+            kwargs["ProjectionExpression"] = expression.projection(attributes)
+        if index:
+            kwargs["IndexName"] = index
+        if not forward:
+            kwargs["ScanIndexForward"] = False
+        if limit:
+            kwargs["Limit"] = limit
+        if start_key:
+            kwargs["ExclusiveStartKey"] = _encode_item(start_key)
+        resp = self._client.query(**expression.request(**kwargs))
+        last_key = resp.get("LastEvaluatedKey")
+        return [_decode_item(item) for item in resp.get("Items", [])], _decode_item(last_key) if last_key else None
+
+    def batch_get(self, table, keys, attributes=None):
+        """BatchGetItem in chunks of 100; UnprocessedKeys retried with backoff."""
+        table_name = self._names[table]
+        unique = {}
+        for key in keys:
+            unique[json.dumps(key, sort_keys=True, default=str)] = key
+        keys = list(unique.values())
+
+        for i in range(0, len(keys), DYNAMODB_BATCH_GET_MAX):
+            expression = _Expression()
+            spec = {"Keys": [_encode_item(key) for key in keys[i:i + DYNAMODB_BATCH_GET_MAX]]}
+            if attributes:
+                spec["ProjectionExpression"] = expression.projection(attributes)
+            if expression.names:
+                spec["ExpressionAttributeNames"] = expression.names
+            request = {table_name: spec}
+            attempt = 0
+            while request:
+                resp = self._client.batch_get_item(RequestItems=request)
+                for item in resp.get("Responses", {}).get(table_name, []):
+                    yield _decode_item(item)
+                request = resp.get("UnprocessedKeys") or {}
+                if request:
+                    _retry_backoff(attempt, "BatchGetItem", table_name)
+                    attempt += 1
+
+    def _batch_write(self, table, requests):
+        """BatchWriteItem in chunks of 25; UnprocessedItems retried with backoff."""
+        table_name = self._names[table]
+
+        def _write(chunk):
+            request = {table_name: chunk}
+            attempt = 0
+            while request:
+                resp = self._client.batch_write_item(RequestItems=request)
+                request = resp.get("UnprocessedItems") or {}
+                if request:
+                    _retry_backoff(attempt, "BatchWriteItem", table_name)
+                    attempt += 1
+
+        written = 0
+        chunk = []
+        for request in requests:
+            chunk.append(request)
+            if len(chunk) == DYNAMODB_BATCH_WRITE_MAX:
+                _write(chunk)
+                written += len(chunk)
+                chunk = []
+        if chunk:
+            _write(chunk)
+            written += len(chunk)
+        return written
+
+    def batch_put(self, table, items):
+        return self._batch_write(table, ({"PutRequest": {"Item": _encode_item(item)}} for item in items))
+
+    def batch_delete(self, table, keys):
+        return self._batch_write(table, ({"DeleteRequest": {"Key": _encode_item(key)}} for key in keys))
+
+    def _scan_pages(self, table, attributes, **kwargs):
+        expression = _Expression()
+        kwargs["TableName"] = self._names[table]
+        if attributes:
+            kwargs["ProjectionExpression"] = expression.projection(attributes)
+        kwargs = expression.request(**kwargs)
+        while True:
+            resp = self._client.scan(**kwargs)
+            yield [_decode_item(item) for item in resp.get("Items", [])]
+            last_key = resp.get("LastEvaluatedKey")
+            if not last_key:
+                return
+            kwargs["ExclusiveStartKey"] = last_key
+
+    def scan(self, table, attributes=None, segments=1):
+        """Scan every item, optionally as a parallel segmented scan.
+
+        With segments > 1 each segment is scanned on its own thread; pages are
+        handed over through a bounded queue so memory stays bounded by a few
+        pages regardless of table size.
+        """
+        if segments <= 1:
+            for page in self._scan_pages(table, attributes):
+                yield from page
+            return
+
+        pages = queue.Queue(maxsize=segments * 2)
+        stop = threading.Event()
+        done = object()
+
+        def _put(value):
+            while not stop.is_set():
+                try:
+                    pages.put(value, timeout=0.5)
+                    return True
+                except queue.Full:
+                    continue
+            return False
+
+        def _worker(segment):
+            try:
+                for page in self._scan_pages(table, attributes, Segment=segment, TotalSegments=segments):
+                    if not _put(page):
+                        return
+            except Exception as e:
+                _put(e)
+            finally:
+                _put(done)
+
+        workers = [threading.Thread(target=_worker, args=(seg,), daemon=True) for seg in range(segments)]
+        for w in workers:
+            w.start()
+        try:
+            remaining = segments
+            while remaining:
+                page = pages.get()
+                if page is done:
+                    remaining -= 1
+                elif isinstance(page, Exception):
+                    raise page
+                else:
+                    yield from page
+        finally:
+            stop.set()
+
+
+# ─── Local Backends ──────────────────────────────────────────────────────────
+def _copy_value(value):
+    # Items handed out are independent of the stored ones, as over the wire
+    if isinstance(value, dict):
+        return {k: _copy_value(v) for k, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_copy_value(v) for v in value]
+    if isinstance(value, (set, frozenset)):
+        return set(value)
+    return value
+
+
+def _project(item, attributes):
+    if not attributes:
+        return _copy_value(item)
+    return {a: _copy_value(item[a]) for a in attributes if a in item}
+
+
+class _LocalStorage(Storage):
+    """Shared semantics of the local backends, over five primitives:
+    _read/_write/_erase one item, _select a partition in order, _items.
+    """
+
+    TTL_PURGE_INTERVAL = 60  # seconds between sweeps of expired items
+
+    def __init__(self):
+        self._purged_at = time.time()
+
+    @contextmanager
+    def _transaction(self, write=False):
+        raise NotImplementedError
+
+    def _key(self, table, item):
+        partition, sort = _key_attributes(table)
+        missing = [a for a in (partition, sort) if a and a not in item]
+        if missing:
+            raise ValueError(f"{table}: key attribute(s) {missing} missing")
+        return item[partition], item[sort] if sort else ""
+
+    def _position(self, table, index, item):
+        """Sort order of an item within a query: index sort key, then table key."""
+        partition, sort = _key_attributes(table)
+        order = _key_attributes(table, index)[1] if index else sort
+        return (item.get(order, "") if order else "", item[partition], item.get(sort, "") if sort else "")
+
+    def _live(self, table, item, now=None):
+        ttl = TABLE_SCHEMAS[table].ttl
+        if item is None or not ttl:
+            return item
+        expires_at = item.get(ttl)
+        if isinstance(expires_at, (int, float)) and not isinstance(expires_at, bool):
+            if expires_at < (now or time.time()):
+                return None
+        return item
+
+    def _sweep(self):
+        now = time.time()
+        if now - self._purged_at < self.TTL_PURGE_INTERVAL:
+            return
+        self._purged_at = now
+        for table, schema in TABLE_SCHEMAS.items():
+            if schema.ttl:
+                self._purge(table, now)
+
+    def get(self, table, key, attributes=None, consistent=False):
+        with self._transaction():
+            item = self._live(table, self._read(table, self._key(table, key)))
+            return _project(item, attributes) if item is not None else None
+
+    def put(self, table, item, condition=None):
+        key = self._key(table, item)
+        with self._transaction(write=True):
+            self._sweep()
+            if condition and not _matches(condition, self._live(table, self._read(table, key)) or {}):
+                raise ConditionFailed(table)
+            self._write(table, key, _copy_value(item))
+
+    def update(self, table, key, changes=None, increments=None, defaults=None, remove=(),
+               condition=None, return_old=False):
+        key_tuple = self._key(table, key)
+        with self._transaction(write=True):
+            self._sweep()
+            old = self._live(table, self._read(table, key_tuple)) or {}
+            if condition and not _matches(condition, old):
+                raise ConditionFailed(table)
+            item = dict(old) or _copy_value(key)
+            for attribute, value in (changes or {}).items():
+                item[attribute] = _copy_value(value)
+            for attribute, value in (defaults or {}).items():
+                item.setdefault(attribute, _copy_value(value))
+            for attribute, value in (increments or {}).items():
+                if isinstance(value, (set, frozenset)):
+                    item[attribute] = set(item.get(attribute, ())) | value
+                else:
+                    item[attribute] = item.get(attribute, 0) + value
+            for attribute in remove:
+                item.pop(attribute, None)
+            self._write(table, key_tuple, item)
+            return _copy_value(old) if return_old else None
+
+    def delete(self, table, key, condition=None, return_old=False):
+        key_tuple = self._key(table, key)
+        with self._transaction(write=True):
+            old = self._live(table, self._read(table, key_tuple))
+            if condition and not _matches(condition, old or {}):
+                raise ConditionFailed(table)
+            self._erase(table, key_tuple)
+            return _copy_value(old) if return_old and old is not None else None
+
+    def query(self, table, partition, sort=None, index=None, attributes=None,
+              forward=True, limit=None, start_key=None):
+        after = self._position(table, index, start_key) if start_key else None
+        now = time.time()
+        items = []
+        last_key = None
+        with self._transaction(), closing(self._select(table, index, partition, sort, forward, after)) as rows:
+            for item in rows:
+                if self._live(table, item, now) is None:
+                    continue
+                if limit and len(items) == limit:
+                    last_key = _page_key(table, index, items[-1])
+                    break
+                items.append(item)
+            return [_project(item, attributes) for item in items], last_key
+
+    def batch_get(self, table, keys, attributes=None):
+        found = {}
+        with self._transaction():
+            for key in keys:
+                key_tuple = self._key(table, key)
+                item = self._live(table, self._read(table, key_tuple))
+                if item is not None:
+                    found[key_tuple] = _project(item, attributes)
+        yield from found.values()
+
+    def batch_put(self, table, items):
+        items = list(items)  # May be a lazy query of this same storage
+        written = 0
+        with self._transaction(write=True):
+            for item in items:
+                self._write(table, self._key(table, item), _copy_value(item))
+                written += 1
+        return written
+
+    def batch_delete(self, table, keys):
+        keys = list(keys)
+        deleted = 0
+        with self._transaction(write=True):
+            for key in keys:
+                self._erase(table, self._key(table, key))
+                deleted += 1
+        return deleted
+
+    def scan(self, table, attributes=None, segments=1):
+        now = time.time()
+        for item in self._items(table):
+            if self._live(table, item, now) is not None:
+                yield _project(item, attributes)
+
+
+class MemoryStorage(_LocalStorage):
+    """In-process backend: table -> partition -> sort key -> item."""
+
+    def __init__(self):
+        super().__init__()
+        self._lock = threading.RLock()
+        self._tables = {table: {} for table in TABLE_SCHEMAS}
+
+    @contextmanager
+    def _transaction(self, write=False):
+        with self._lock:
+            yield
+
+    def _read(self, table, key):
+        return self._tables[table].get(key[0], {}).get(key[1])
+
+    def _write(self, table, key, item):
+        self._tables[table].setdefault(key[0], {})[key[1]] = item
+
+    def _erase(self, table, key):
+        partition = self._tables[table].get(key[0])
+        if partition is not None and partition.pop(key[1], None) is not None and not partition:
+            del self._tables[table][key[0]]
+
+    def _select(self, table, index, partition, sort, forward, after):
+        if index is None:
+            sort_attribute = _key_attributes(table)[1]
+            candidates = self._tables[table].get(partition, {}).values()
+        else:
+            index_partition, sort_attribute = _key_attributes(table, index)
+            candidates = [
+                item for items in self._tables[table].values() for item in items.values()
+                if item.get(index_partition) == partition and (not sort_attribute or sort_attribute in item)
+            ]
+        if sort:
+            candidates = [item for item in candidates if _sort_matches(sort, item.get(sort_attribute))]
+        for item in sorted(candidates, key=lambda item: self._position(table, index, item), reverse=not forward):
+            position = self._position(table, index, item)
+            if after is None or (position > after if forward else position < after):
+                yield item
+
+    def _items(self, table):
+        with self._lock:
+            return [item for items in self._tables[table].values() for item in items.values()]
+
+    def _purge(self, table, now):
+        for key in [
+            self._key(table, item) for item in self._items(table) if self._live(table, item, now) is None
+        ]:
+            self._erase(table, key)
+
+
+def _json_tag(value):
+    if isinstance(value, (bytes, bytearray)):
+        return {"__bytes__": base64.b64encode(value).decode("ascii")}
+    if isinstance(value, (set, frozenset)):
+        return {"__set__": list(value)}
+    if isinstance(value, Decimal):
+        return int(value) if value == value.to_integral_value() else float(value)
+    raise TypeError(f"Cannot store {type(value).__name__}")
+
+
+def _json_untag(obj):
+    if len(obj) == 1:
+        if "__bytes__" in obj:
+            return base64.b64decode(obj["__bytes__"])
+        if "__set__" in obj:
+            return set(obj["__set__"])
+    return obj
+
+
+class SQLiteStorage(_LocalStorage):
+    """Backend on one SQLite file, one table per logical table.
+
+    Key and index attributes get their own columns (indexed, so queries are
+    served by SQLite in order); the item itself is stored as tagged JSON.
+    """
+
+    SCAN_CHUNK = 500
+
+    def __init__(self, path):
+        import sqlite3
+        super().__init__()
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        if path != ":memory:":
+            self._conn.execute("PRAGMA journal_mode=WAL")
+        for table, schema in TABLE_SCHEMAS.items():
+            index_columns = "".join(f", i{n}_pk, i{n}_sk" for n in range(len(schema.indexes)))
+            self._conn.execute(
+                f'CREATE TABLE IF NOT EXISTS "{table}" (pk NOT NULL, sk NOT NULL{index_columns}, '
+                f"expires_at, item TEXT NOT NULL, PRIMARY KEY (pk, sk))"
+            )
+            for n, name in enumerate(schema.indexes):
+                self._conn.execute(
+                    f'CREATE INDEX IF NOT EXISTS "{table}.{name}" ON "{table}" (i{n}_pk, i{n}_sk, pk, sk)'
+                )
+            if schema.ttl:
+                self._conn.execute(
+                    f'CREATE INDEX IF NOT EXISTS "{table}.ttl" ON "{table}" (expires_at)'
+                )
+
+    @contextmanager
+    def _transaction(self, write=False):
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE" if write else "BEGIN")
+            try:
+                yield
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+            self._conn.execute("COMMIT")
+
+    def _read(self, table, key):
+        row = self._conn.execute(
+            f'SELECT item FROM "{table}" WHERE pk = ? AND sk = ?', key
+        ).fetchone()
+        return json.loads(row[0], object_hook=_json_untag) if row else None
+
+    def _write(self, table, key, item):
+        schema = TABLE_SCHEMAS[table]
+        values = list(key)
+        for partition, sort in schema.indexes.values():
+            if partition in item and (not sort or sort in item):
+                values += [item[partition], item[sort] if sort else ""]
+            else:
+                values += [None, None]  # Sparse: not in this index
+        expires_at = item.get(schema.ttl) if schema.ttl else None
+        values.append(expires_at if isinstance(expires_at, (int, float)) else None)
+        values.append(json.dumps(item, default=_json_tag, separators=(",", ":")))
+        self._conn.execute(
+            f'INSERT OR REPLACE INTO "{table}" VALUES ({", ".join("?" * len(values))})', values
+        )
+
+    def _erase(self, table, key):
+        self._conn.execute(f'DELETE FROM "{table}" WHERE pk = ? AND sk = ?', key)
+
+    def _select(self, table, index, partition, sort, forward, after):
+        if index is None:
+            partition_column, order = "pk", ["sk"]
+        else:
+            n = list(TABLE_SCHEMAS[table].indexes).index(index)
+            partition_column, order = f"i{n}_pk", [f"i{n}_sk", "pk", "sk"]
+        where = [f"{partition_column} = ?"]
+        params = [partition]
+        if sort:
+            if sort[0] == "between":
+                where.append(f"{order[0]} BETWEEN ? AND ?")
+                params += [sort[1], sort[2]]
+            elif sort[0] == "begins_with":
+                where.append(f"substr({order[0]}, 1, ?) = ?")
+                params += [len(sort[1]), sort[1]]
+            else:
+                where.append(f"{order[0]} {sort[0]} ?")
+                params.append(sort[1])
+        if after is not None:
+            where.append(f"({', '.join(order)}) {'>' if forward else '<'} ({', '.join('?' * len(order))})")
+            params += list(after[:1] if index is None else after)
+        direction = "" if forward else " DESC"
+        rows = self._conn.execute(
+            f'SELECT item FROM "{table}" WHERE {" AND ".join(where)} '
+            f'ORDER BY {", ".join(c + direction for c in order)}', params
+        )
+        try:
+            for (text,) in rows:
+                yield json.loads(text, object_hook=_json_untag)
+        finally:
+            rows.close()
+
+    def _items(self, table):
+        last = 0
+        while True:
+            with self._transaction():
+                rows = self._conn.execute(
+                    f'SELECT rowid, item FROM "{table}" WHERE rowid > ? ORDER BY rowid LIMIT ?',
+                    (last, self.SCAN_CHUNK),
+                ).fetchall()
+            if not rows:
+                return
+            last = rows[-1][0]
+            for _, text in rows:
+                yield json.loads(text, object_hook=_json_untag)
+
+    def _purge(self, table, now):
+        self._conn.execute(f'DELETE FROM "{table}" WHERE expires_at < ?', (now,))
+
+
+def _open_storage(backend, table_names, region=None, sqlite_path=None):
+    """Create the backend named by STORAGE_BACKEND."""
+    if backend == "dynamodb":
+        return DynamoDBStorage(table_names, region)
+    if backend == "memory":
+        return MemoryStorage()
+    if backend == "sqlite":
+        return SQLiteStorage(sqlite_path)
+    raise ValueError(f"Unknown STORAGE_BACKEND: {backend!r}")
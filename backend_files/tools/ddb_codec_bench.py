@@ -0,0 +1,119 @@
+"""Benchmark the low-level DynamoDB codec against the boto3 resource layer.
+
+Decodes realistic wire-format items (as returned by the low-level client)
+with boto3's TypeDeserializer, which is what the resource layer runs on every
+attribute, and with spotify_api.storage._decode_item. Covers an H(T) page of
+play-history items (full and with the PLAY_HISTORY_ATTRIBUTES projection), a
+user item and an access-request listing page. No AWS access is needed.
+
+    python tools/ddb_codec_bench.py [--items 1000] [--repeat 20]
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from boto3.dynamodb.types import TypeDeserializer  # noqa: E402
+
+from spotify_api.storage import _decode_item, _encode_item  # noqa: E402
+from spotify_api.playlists import PLAY_HISTORY_ATTRIBUTES  # noqa: E402
+
+GENRES = ["indie rock", "bedroom pop", "afrobeats", "uk garage", "neo soul", "shoegaze",
+          "alt z", "amapiano", "jazz rap", "modern rock", "art pop", "dream pop"]
+
+
+def _play_item(rng, i):
+    artists = [f"{rng.getrandbits(64):022x}" for _ in range(rng.randint(1, 3))]
+    played_at = 1_790_000_000_000 + i * 180_000
+    return {
+        "user_id": "6f1c2b57-3d0e-4a8f-9c61-2e5b7d4a9f03",
+        "played_at": played_at,
+        "track_id": f"{rng.getrandbits(64):022x}",
+        "track_name": f"Track {i} (feat. Somebody)",
+        "artist_name": ", ".join(f"Artist {a[:6]}" for a in artists),
+        "artist_ids": artists,
+        "genres": rng.sample(GENRES, rng.randint(2, 8)),
+        "album_name": f"Album {i % 97}",
+        "image_url": f"https://i.scdn.co/image/ab67616d0000b273{rng.getrandbits(96):024x}",
+        "uri": f"spotify:track:{rng.getrandbits(64):022x}",
+        "spotify_url": f"https://open.spotify.com/track/{rng.getrandbits(64):022x}",
+        "expires_at": played_at // 1000 + 95 * 86400,
+    }
+
+
+def _access_item(rng, i):
+    return {
+        "request_id": f"{rng.getrandbits(128):032x}",
+        "full_name": f"Visitor {i}",
+        "spotify_email": f"visitor{i}@example.com",
+        "country": rng.choice(["US", "NG", "GB", "DE", "BR"]),
+        "status": "pending",
+        "requested_at": 1_790_000_000 + i,
+        "expires_at": 1_790_000_000 + i + 90 * 86400,
+    }
+
+
+def _user_item():
+    return {
+        "user_id": "6f1c2b57-3d0e-4a8f-9c61-2e5b7d4a9f03",
+        "spotify_user_id": "visitor123",
+        "display_name": "Visitor",
+        "email": "visitor@example.com",
+        "country": "US",
+        "policy_acknowledged": "2026-02-27",
+        "created_at": 1_790_000_000,
+        "updated_at": 1_790_000_100,
+    }
+
+
+def _project(item, attributes):
+    return {k: v for k, v in item.items() if k in attributes}
+
+
+def _time(fn, items, repeat):
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for item in items:
+            fn(item)
+        best = min(best, time.perf_counter() - start)
+    return best * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--items", type=int, default=1000, help="play-history items per page")
+    parser.add_argument("--repeat", type=int, default=20, help="best-of runs per case")
+    args = parser.parse_args()
+
+    rng = random.Random(7)
+    deserializer = TypeDeserializer()
+
+    def resource_decode(item):
+        return {k: deserializer.deserialize(v) for k, v in item.items()}
+
+    plays = [_encode_item(_play_item(rng, i)) for i in range(args.items)]
+    cases = [
+        (f"H(T) page, {args.items} plays, all attributes", plays),
+        (f"H(T) page, {args.items} plays, projected",
+         [_project(p, PLAY_HISTORY_ATTRIBUTES) for p in plays]),
+        ("access requests page, 50 items", [_encode_item(_access_item(rng, i)) for i in range(50)]),
+        ("user item x100 (auth status)", [_encode_item(_user_item())] * 100),
+        ("user item x100, projected", [_project(_encode_item(_user_item()), ("display_name", "policy_acknowledged"))] * 100),
+    ]
+
+    print(f"{'case':<44} {'wire KB':>8} {'resource ms':>12} {'codec ms':>9} {'speedup':>8}")
+    for label, items in cases:
+        wire_kb = len(json.dumps(items)) / 1024
+        resource_ms = _time(resource_decode, items, args.repeat)
+        codec_ms = _time(_decode_item, items, args.repeat)
+        print(f"{label:<44} {wire_kb:8.1f} {resource_ms:12.2f} {codec_ms:9.2f} {resource_ms / codec_ms:7.1f}x")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,560 @@
+"""Local stand-in for the Spotify Web API and accounts service.
+
+Serves seeded synthetic users, artists, albums, tracks and genres over the
+endpoints the Lambda calls: /authorize and /api/token (client credentials,
+authorization code, refresh), /v1/me, top artists/tracks, recently played
+(with after/before cursors), /v1/artists?ids=, recommendations, available
+genre seeds, new releases and playlist creation. The same --seed always yields
+the same catalogue; with --now the play history is frozen too. Latency, 429s
+and failures are injected from a seeded stream so runs are reproducible.
+
+Point the Lambda code at it with:
+
+    SPOTIFY_API_BASE=http://127.0.0.1:8765 SPOTIFY_ACCOUNTS_BASE=http://127.0.0.1:8765
+
+    python tools/fake_spotify.py [--port 8765] [--seed 7] [--users 50] [--latency-ms 40]
+                                 [--rate-limit 0.02] [--failure-rate 0.01]
+
+Access tokens are "user-<spotify id>" (any authorization code "code-<id>" or
+refresh token "refresh-<id>" exchanges to one) and "client" for client
+credentials. GET /_stats returns request counts per route and status.
+"""
+import argparse
+import json
+import random
+import re
+import string
+import sys
+import threading
+import time
+import urllib.parse
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+GENRE_PREFIXES = ["indie", "dream", "neo", "uk", "alt", "art", "jazz", "deep", "nu", "afro",
+                  "chamber", "dark", "modern", "bedroom", "post", "lo-fi"]
+GENRE_ROOTS = ["rock", "pop", "soul", "garage", "house", "rap", "folk", "punk", "wave",
+               "techno", "r&b", "jazz", "metal", "disco"]
+COUNTRIES = ["US", "GB", "NG", "DE", "BR", "FR", "CA", "JP", "MX", "ZA"]
+IMAGE_SIZES = (640, 300, 64)
+
+PLAY_INTERVAL_MS = 210_000       # one play every 3.5 minutes, around the clock
+PLAY_HISTORY_DAYS = 95           # matches the Lambda's play-history TTL
+TOP_ITEMS = 50                   # per user and time_range
+ID_ALPHABET = string.ascii_letters + string.digits
+
+
+# ─── Catalogue ───────────────────────────────────────────────────────────────
+def _spotify_id(rng):
+    return "".join(rng.choice(ID_ALPHABET) for _ in range(22))
+
+
+def _images(rng, kind):
+    key = f"{rng.getrandbits(96):024x}"
+    return [{"url": f"https://i.scdn.co/image/{kind}{size}{key}", "width": size, "height": size}
+            for size in IMAGE_SIZES]
+
+
+def _simplified(entity, kind):
+    return {
+        "id": entity["id"],
+        "name": entity["name"],
+        "type": kind,
+        "uri": entity["uri"],
+        "external_urls": entity["external_urls"],
+    }
+
+
+class FakeSpotify:
+    """Seeded synthetic catalogue and users, plus the playlists created so far."""
+
+    def __init__(self, seed=7, users=50, artists=2000, tracks=20000, genres=120, now=None):
+        rng = random.Random(seed)
+        self.seed = seed
+        self.now = now  # epoch seconds; None follows the wall clock
+
+        combos = [f"{p} {r}" for p in GENRE_PREFIXES for r in GENRE_ROOTS]
+        self.genres = sorted(rng.sample(combos, min(genres, len(combos)))
+                             + [f"genre {i}" for i in range(len(combos), genres)])
+
+        self.artists = []
+        for i in range(artists):
+            artist_id = _spotify_id(rng)
+            self.artists.append({
+                "id": artist_id,
+                "name": f"Artist {i:05d}",
+                "type": "artist",
+                "uri": f"spotify:artist:{artist_id}",
+                "external_urls": {"spotify": f"https://open.spotify.com/artist/{artist_id}"},
+                "genres": rng.sample(self.genres, rng.randint(1, 4)),
+                "popularity": rng.randint(5, 95),
+                "followers": {"href": None, "total": rng.randint(100, 5_000_000)},
+                "images": _images(rng, "ab6761610000"),
+            })
+        self.artists_by_id = {a["id"]: a for a in self.artists}
+        self.artists_by_genre = {}
+        for artist in self.artists:
+            for genre in artist["genres"]:
+                self.artists_by_genre.setdefault(genre, []).append(artist)
+
+        release_start = 1_700_000_000
+        self.albums = []
+        albums_by_artist = {}
+        for i in range(max(tracks // 10, 1)):
+            artist = self.artists[i % len(self.artists)]
+            album_id = _spotify_id(rng)
+            released = time.gmtime(release_start + rng.randrange(0, 2 * 365 * 86400))
+            album = {
+                "id": album_id,
+                "name": f"Album {i:05d}",
+                "type": "album",
+                "album_type": rng.choice(["album", "single", "single", "compilation"]),
+                "uri": f"spotify:album:{album_id}",
+                "external_urls": {"spotify": f"https://open.spotify.com/album/{album_id}"},
+                "artists": [_simplified(artist, "artist")],
+                "images": _images(rng, "ab67616d0000"),
+                "release_date": time.strftime("%Y-%m-%d", released),
+                "release_date_precision": "day",
+                "total_tracks": 0,
+            }
+            self.albums.append(album)
+            albums_by_artist.setdefault(artist["id"], []).append(album)
+
+        self.tracks = []
+        self.tracks_by_artist = {}
+        for i in range(tracks):
+            artist = self.artists[i % len(self.artists)]
+            credited = [artist] + rng.sample(self.artists, 1 if rng.random() < 0.2 else 0)
+            album = rng.choice(albums_by_artist.get(artist["id"]) or self.albums)
+            album["total_tracks"] += 1
+            track_id = _spotify_id(rng)
+            track = {
+                "id": track_id,
+                "name": f"Track {i:06d}",
+                "type": "track",
+                "uri": f"spotify:track:{track_id}",
+                "external_urls": {"spotify": f"https://open.spotify.com/track/{track_id}"},
+                "artists": [_simplified(a, "artist") for a in credited],
+                "album": {key: album[key] for key in (
+                    "id", "name", "type", "album_type", "uri", "external_urls", "artists",
+                    "images", "release_date", "release_date_precision", "total_tracks",
+                )},
+                "duration_ms": rng.randint(90_000, 420_000),
+                "popularity": rng.randint(0, 100),
+                "explicit": rng.random() < 0.15,
+                "preview_url": None,
+                "track_number": album["total_tracks"],
+            }
+            self.tracks.append(track)
+            for a in credited:
+                self.tracks_by_artist.setdefault(a["id"], []).append(track)
+        self.tracks_by_id = {t["id"]: t for t in self.tracks}
+        self.new_releases = sorted(self.albums, key=lambda a: (a["release_date"], a["id"]), reverse=True)
+
+        self.users = {}
+        for i in range(users):
+            user_id = f"fakeuser{i:04d}"
+            favourite_genres = rng.sample(self.genres, rng.randint(3, 6))
+            pool = [a for g in favourite_genres for a in self.artists_by_genre.get(g, [])]
+            picks = rng.sample(pool, min(len(pool), 3 * TOP_ITEMS)) + rng.sample(self.artists, TOP_ITEMS)
+            favourites = list({a["id"]: a for a in picks}.values())
+            top_artists = {"long_term": favourites[:TOP_ITEMS]}
+            for time_range, keep in (("medium_term", 0.7), ("short_term", 0.4)):
+                kept = [a for a in favourites if rng.random() < keep]
+                top_artists[time_range] = (kept + favourites)[:TOP_ITEMS]
+            top_tracks = {
+                time_range: sorted(
+                    (t for a in artists_[:20] for t in self.tracks_by_artist.get(a["id"], [])[:5]),
+                    key=lambda t: -t["popularity"],
+                )[:TOP_ITEMS]
+                for time_range, artists_ in top_artists.items()
+            }
+            self.users[user_id] = {
+                "index": i,
+                "profile": {
+                    "id": user_id,
+                    "display_name": f"Fake User {i}",
+                    "email": f"{user_id}@example.com",
+                    "country": rng.choice(COUNTRIES),
+                    "product": "premium",
+                    "type": "user",
+                    "uri": f"spotify:user:{user_id}",
+                    "external_urls": {"spotify": f"https://open.spotify.com/user/{user_id}"},
+                    "followers": {"href": None, "total": rng.randint(0, 500)},
+                    "images": [],
+                },
+                "top_artists": top_artists,
+                "top_tracks": top_tracks,
+                # Listening mixes top tracks with deeper cuts by favourite artists
+                "listening": [t for a in favourites for t in self.tracks_by_artist.get(a["id"], [])],
+                "offset_ms": rng.randrange(PLAY_INTERVAL_MS),
+            }
+
+        self.playlists = {}
+        self.playlists_lock = threading.Lock()
+
+    def now_ms(self):
+        return int((self.now if self.now is not None else time.time()) * 1000)
+
+    def play(self, user, slot):
+        """The play in `slot` of a user's endless, deterministic listening stream."""
+        rng = random.Random(f"{self.seed}:{user['index']}:{slot}")
+        top = user["top_tracks"]["short_term"]
+        track = rng.choice(top) if top and rng.random() < 0.6 else rng.choice(user["listening"] or self.tracks)
+        played_at = slot * PLAY_INTERVAL_MS + user["offset_ms"]
+        millis = played_at % 1000
+        return played_at, {
+            "track": track,
+            "played_at": time.strftime("%Y-%m-%dT%H:%M:%S", time.gmtime(played_at // 1000)) + f".{millis:03d}Z",
+            "context": None,
+        }
+
+
+# ─── Fault Injection ─────────────────────────────────────────────────────────
+class Faults:
+    """Latency, 429 and failure injection drawn from one seeded stream."""
+
+    def __init__(self, seed=7, latency_ms=0.0, jitter_ms=0.0, rate_limit=0.0, failure_rate=0.0,
+                 retry_after=1):
+        self.rng = random.Random(seed)
+        self.lock = threading.Lock()
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.rate_limit = rate_limit
+        self.failure_rate = failure_rate
+        self.retry_after = retry_after
+
+    def draw(self):
+        """Return (delay seconds, injected status or None) for the next request."""
+        with self.lock:
+            delay = max(0.0, self.latency_ms + self.rng.uniform(-self.jitter_ms, self.jitter_ms)) / 1000
+            roll = self.rng.random()
+            if roll < self.rate_limit:
+                return delay, 429
+            if roll < self.rate_limit + self.failure_rate:
+                return delay, self.rng.choice((500, 502, 503))
+            return delay, None
+
+
+# ─── HTTP Handler ────────────────────────────────────────────────────────────
+class _ApiError(Exception):
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+
+def _int_param(qs, name, default, low, high):
+    try:
+        value = int(qs.get(name, default))
+    except ValueError:
+        raise _ApiError(400, f"Invalid {name}")
+    if not low <= value <= high:
+        raise _ApiError(400, f"Invalid {name}")
+    return value
+
+
+def _page(items, qs, default, maximum):
+    limit = _int_param(qs, "limit", default, 1, maximum)
+    offset = _int_param(qs, "offset", 0, 0, 100_000)
+    return {"items": items[offset:offset + limit], "total": len(items), "limit": limit,
+            "offset": offset, "next": None, "previous": None, "href": None}
+
+
+class _Handler(BaseHTTPRequestHandler):
+    server_version = "FakeSpotify/1.0"
+    fake = None
+    faults = None
+    stats = None
+    verbose = False
+
+    # (method, path pattern) → handler method; path groups become arguments
+    ROUTES = [
+        ("GET",  re.compile(r"/authorize"), "authorize"),
+        ("POST", re.compile(r"/api/token"), "token"),
+        ("GET",  re.compile(r"/v1/me"), "me"),
+        ("GET",  re.compile(r"/v1/me/top/(artists|tracks)"), "top"),
+        ("GET",  re.compile(r"/v1/me/player/recently-played"), "recently_played"),
+        ("GET",  re.compile(r"/v1/artists"), "artists"),
+        ("GET",  re.compile(r"/v1/recommendations"), "recommendations"),
+        ("GET",  re.compile(r"/v1/recommendations/available-genre-seeds"), "genre_seeds"),
+        ("GET",  re.compile(r"/v1/browse/new-releases"), "new_releases"),
+        ("POST", re.compile(r"/v1/users/([^/]+)/playlists"), "create_playlist"),
+        ("POST", re.compile(r"/v1/playlists/([^/]+)/tracks"), "add_tracks"),
+        ("GET",  re.compile(r"/_stats"), "stats_route"),
+    ]
+
+    def log_message(self, format, *args):
+        if self.verbose:
+            super().log_message(format, *args)
+
+    def do_GET(self):
+        self._dispatch("GET")
+
+    def do_POST(self):
+        self._dispatch("POST")
+
+    def _dispatch(self, method):
+        parsed = urllib.parse.urlsplit(self.path)
+        qs = dict(urllib.parse.parse_qsl(parsed.query))
+        for route_method, pattern, name in self.ROUTES:
+            match = pattern.fullmatch(parsed.path)
+            if match and route_method == method:
+                break
+        else:
+            name, match = None, None
+
+        status, body, headers = 404, {"error": {"status": 404, "message": "Service not found"}}, {}
+        if name == "stats_route":
+            status, body = 200, {"requests": dict(self.stats["routes"]), "statuses": dict(self.stats["statuses"])}
+        elif name:
+            delay, injected = self.faults.draw()
+            if delay:
+                time.sleep(delay)
+            if injected == 429:
+                status, body = 429, {"error": {"status": 429, "message": "API rate limit exceeded"}}
+                headers["Retry-After"] = str(self.faults.retry_after)
+            elif injected:
+                status, body = injected, {"error": {"status": injected, "message": "Injected failure"}}
+            else:
+                try:
+                    status, body, headers = getattr(self, name)(qs, *match.groups())
+                except _ApiError as e:
+                    status, body = e.status, {"error": {"status": e.status, "message": str(e)}}
+            with self.stats["lock"]:
+                self.stats["routes"][f"{method} {pattern.pattern}"] += 1
+                self.stats["statuses"][str(status)] += 1
+        self._send(status, body, headers)
+
+    def _send(self, status, body, headers):
+        payload = b"" if body is None else json.dumps(body).encode("utf-8")
+        self.send_response(status)
+        for key, value in headers.items():
+            self.send_header(key, value)
+        if body is not None:
+            self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def _read_body(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        return self.rfile.read(length).decode("utf-8") if length else ""
+
+    def _json_body(self):
+        try:
+            return json.loads(self._read_body() or "{}")
+        except json.JSONDecodeError:
+            raise _ApiError(400, "Error parsing JSON.")
+
+    def _user(self, required=True):
+        """The user behind the bearer token (None for a client-credentials token)."""
+        auth = self.headers.get("Authorization", "")
+        token = auth[len("Bearer "):] if auth.startswith("Bearer ") else ""
+        if token == "client" and not required:
+            return None
+        user = self.fake.users.get(token[len("user-"):]) if token.startswith("user-") else None
+        if user is None:
+            raise _ApiError(401, "Invalid access token")
+        return user
+
+    # ─── Accounts ───
+    def authorize(self, qs):
+        redirect_uri = qs.get("redirect_uri")
+        if not redirect_uri:
+            raise _ApiError(400, "Missing redirect_uri")
+        user_id = qs.get("user") or next(iter(self.fake.users))
+        params = urllib.parse.urlencode({"code": f"code-{user_id}", "state": qs.get("state", "")})
+        separator = "&" if "?" in redirect_uri else "?"
+        return 302, None, {"Location": f"{redirect_uri}{separator}{params}"}
+
+    def token(self, qs):
+        form = dict(urllib.parse.parse_qsl(self._read_body()))
+        if not self.headers.get("Authorization", "").startswith("Basic "):
+            return 400, {"error": "invalid_client"}, {}
+        grant = form.get("grant_type")
+        if grant == "client_credentials":
+            return 200, {"access_token": "client", "token_type": "Bearer", "expires_in": 3600}, {}
+        prefix, field = {"authorization_code": ("code-", "code"),
+                         "refresh_token": ("refresh-", "refresh_token")}.get(grant, (None, None))
+        value = form.get(field or "", "")
+        user_id = value[len(prefix):] if prefix and value.startswith(prefix) else None
+        if user_id not in self.fake.users:
+            return 400, {"error": "invalid_grant"}, {}
+        return 200, {
+            "access_token": f"user-{user_id}",
+            "token_type": "Bearer",
+            "expires_in": 3600,
+            "refresh_token": f"refresh-{user_id}",
+            "scope": form.get("scope", ""),
+        }, {}
+
+    # ─── Web API ───
+    def me(self, qs):
+        return 200, self._user()["profile"], {}
+
+    def top(self, qs, kind):
+        time_range = qs.get("time_range", "medium_term")
+        items = self._user()[f"top_{kind}"].get(time_range)
+        if items is None:
+            raise _ApiError(400, "Invalid time range")
+        return 200, _page(items, qs, 20, 50), {}
+
+    def recently_played(self, qs):
+        user = self._user()
+        limit = _int_param(qs, "limit", 20, 1, 50)
+        now = self.fake.now_ms()
+        oldest_slot = (now - PLAY_HISTORY_DAYS * 86400 * 1000 - user["offset_ms"]) // PLAY_INTERVAL_MS + 1
+        newest_slot = (now - user["offset_ms"]) // PLAY_INTERVAL_MS
+        if "after" in qs and "before" in qs:
+            raise _ApiError(400, "Only one of after or before may be given")
+        if "after" in qs:
+            after = _int_param(qs, "after", 0, 0, 1 << 62)
+            first = max(oldest_slot, (after - user["offset_ms"]) // PLAY_INTERVAL_MS + 1)
+            slots = range(min(first + limit, newest_slot + 1) - 1, first - 1, -1)
+        else:
+            before = _int_param(qs, "before", now + 1, 0, 1 << 62)
+            last = min(newest_slot, (before - user["offset_ms"] - 1) // PLAY_INTERVAL_MS)
+            slots = range(last, max(last - limit, oldest_slot - 1), -1)
+        plays = [self.fake.play(user, slot) for slot in slots]
+        return 200, {
+            "items": [item for _, item in plays],
+            "limit": limit,
+            "next": None,
+            "cursors": {"after": str(plays[0][0]), "before": str(plays[-1][0])} if plays else None,
+            "href": None,
+        }, {}
+
+    def artists(self, qs):
+        self._user(required=False)
+        ids = [i for i in qs.get("ids", "").split(",") if i]
+        if not ids or len(ids) > 50:
+            raise _ApiError(400, "Invalid ids")
+        return 200, {"artists": [self.fake.artists_by_id.get(i) for i in ids]}, {}
+
+    def recommendations(self, qs):
+        self._user(required=False)
+        seeds = {kind: [s for s in qs.get(f"seed_{kind}s", "").split(",") if s]
+                 for kind in ("artist", "track", "genre")}
+        total = sum(len(s) for s in seeds.values())
+        if not 1 <= total <= 5:
+            raise _ApiError(400, "Between 1 and 5 seeds must be given")
+        limit = _int_param(qs, "limit", 20, 1, 100)
+        seed_artists = [self.fake.artists_by_id[a] for a in seeds["artist"] if a in self.fake.artists_by_id]
+        for track_id in seeds["track"]:
+            track = self.fake.tracks_by_id.get(track_id)
+            seed_artists += [self.fake.artists_by_id[a["id"]] for a in track["artists"]] if track else []
+        genres = set(seeds["genre"]) | {g for a in seed_artists for g in a["genres"]}
+        related = {a["id"]: a for g in sorted(genres) for a in self.fake.artists_by_genre.get(g, [])}
+        pool = list({t["id"]: t for a in [*seed_artists, *related.values()]
+                     for t in self.fake.tracks_by_artist.get(a["id"], [])}.values())
+        # Same seeds and parameters always give the same answer
+        rng = random.Random(f"{self.fake.seed}:{sorted(qs.items())}")
+        tracks = rng.sample(pool, min(limit, len(pool)))
+        return 200, {
+            "tracks": tracks,
+            "seeds": [{"id": s, "type": kind.upper(), "initialPoolSize": len(pool),
+                       "afterFilteringSize": len(pool), "afterRelinkingSize": len(pool), "href": None}
+                      for kind, values in seeds.items() for s in values],
+        }, {}
+
+    def genre_seeds(self, qs):
+        self._user(required=False)
+        return 200, {"genres": self.fake.genres}, {}
+
+    def new_releases(self, qs):
+        self._user(required=False)
+        return 200, {"albums": _page(self.fake.new_releases, qs, 20, 50)}, {}
+
+    def create_playlist(self, qs, owner_id):
+        user = self._user()
+        if user["profile"]["id"] != owner_id:
+            raise _ApiError(403, "You cannot create a playlist for another user")
+        body = self._json_body()
+        if not body.get("name"):
+            raise _ApiError(400, "Missing required field: name")
+        with self.fake.playlists_lock:
+            playlist_id = f"fakeplaylist{len(self.fake.playlists):010d}"
+            playlist = self.fake.playlists[playlist_id] = {
+                "id": playlist_id,
+                "name": body["name"],
+                "description": body.get("description", ""),
+                "public": body.get("public", True),
+                "collaborative": False,
+                "type": "playlist",
+                "uri": f"spotify:playlist:{playlist_id}",
+                "external_urls": {"spotify": f"https://open.spotify.com/playlist/{playlist_id}"},
+                "owner": _simplified({**user["profile"], "name": user["profile"]["display_name"]}, "user"),
+                "tracks": {"total": 0, "items": []},
+                "snapshot_id": "0",
+            }
+            return 201, {**playlist, "tracks": {"total": 0}}, {}
+
+    def add_tracks(self, qs, playlist_id):
+        user = self._user()
+        uris = self._json_body().get("uris") or []
+        if not uris or len(uris) > 100:
+            raise _ApiError(400, "Between 1 and 100 uris must be given")
+        with self.fake.playlists_lock:
+            playlist = self.fake.playlists.get(playlist_id)
+            if playlist is None:
+                raise _ApiError(404, "Not found")
+            if playlist["owner"]["id"] != user["profile"]["id"]:
+                raise _ApiError(403, "You cannot add tracks to a playlist you don't own")
+            playlist["tracks"]["items"] += uris
+            playlist["tracks"]["total"] = len(playlist["tracks"]["items"])
+            playlist["snapshot_id"] = str(int(playlist["snapshot_id"]) + 1)
+            return 201, {"snapshot_id": playlist["snapshot_id"]}, {}
+
+
+def make_server(fake, faults=None, host="127.0.0.1", port=8765, verbose=False):
+    """Build (not start) a threaded server; port=0 picks a free port."""
+    handler = type("FakeSpotifyHandler", (_Handler,), {
+        "fake": fake,
+        "faults": faults or Faults(fake.seed),
+        "stats": {"routes": Counter(), "statuses": Counter(), "lock": threading.Lock()},
+        "verbose": verbose,
+    })
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--seed", type=int, default=7, help="catalogue, history and fault seed")
+    parser.add_argument("--users", type=int, default=50)
+    parser.add_argument("--artists", type=int, default=2000)
+    parser.add_argument("--tracks", type=int, default=20000)
+    parser.add_argument("--genres", type=int, default=120)
+    parser.add_argument("--now", type=float, help="freeze the clock at this epoch second")
+    parser.add_argument("--latency-ms", type=float, default=0.0, help="mean added latency per request")
+    parser.add_argument("--jitter-ms", type=float, default=0.0, help="uniform +/- jitter on the latency")
+    parser.add_argument("--rate-limit", type=float, default=0.0, help="fraction of requests answered 429")
+    parser.add_argument("--failure-rate", type=float, default=0.0, help="fraction answered 500/502/503")
+    parser.add_argument("--retry-after", type=int, default=1, help="Retry-After seconds on a 429")
+    parser.add_argument("--verbose", action="store_true", help="log every request")
+    args = parser.parse_args()
+
+    started = time.perf_counter()
+    fake = FakeSpotify(args.seed, args.users, args.artists, args.tracks, args.genres, args.now)
+    faults = Faults(args.seed, args.latency_ms, args.jitter_ms, args.rate_limit, args.failure_rate,
+                    args.retry_after)
+    server = make_server(fake, faults, args.host, args.port, args.verbose)
+    base = f"http://{server.server_address[0]}:{server.server_address[1]}"
+    print(f"fake Spotify on {base}: {len(fake.users)} users, {len(fake.artists)} artists, "
+          f"{len(fake.tracks)} tracks, {len(fake.genres)} genres "
+          f"(built in {(time.perf_counter() - started) * 1000:.0f} ms)")
+    print(f"  export SPOTIFY_API_BASE={base} SPOTIFY_ACCOUNTS_BASE={base}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,82 @@
+"""Measure cold-start import cost per route.
+
+Each sample runs in a fresh interpreter: it imports lambda_function (the init
+phase) and then resolves one route's handler (the lazy import its first request
+pays). Reports the median of both, how many modules were loaded and whether
+boto3 had to be imported. --clients also times creating the storage backend
+(the DynamoDB client in production), the other cost a first request usually
+pays.
+
+    python tools/import_bench.py [--runs 5] [--clients]
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+BACKEND_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+
+CHILD = """
+import json, sys, time
+start_modules = len(sys.modules)
+t0 = time.perf_counter()
+import lambda_function
+t1 = time.perf_counter()
+lambda_function._resolve_handler(sys.argv[1])
+t2 = time.perf_counter()
+result = {
+    "init_ms": (t1 - t0) * 1000,
+    "route_ms": (t2 - t1) * 1000,
+    "modules": len(sys.modules) - start_modules,
+    "boto3": "boto3" in sys.modules,
+}
+if sys.argv[2] == "1":
+    lambda_function._get_storage()
+    result["clients_ms"] = (time.perf_counter() - t2) * 1000
+print(json.dumps(result))
+"""
+
+
+def _sample(target, clients):
+    env = dict(os.environ, AWS_REGION=os.environ.get("AWS_REGION", "us-east-1"))
+    env.pop("AWS_LAMBDA_INITIALIZATION_TYPE", None)
+    out = subprocess.run(
+        [sys.executable, "-c", CHILD, target, "1" if clients else "0"],
+        cwd=BACKEND_DIR, env=env, capture_output=True, text=True, check=True,
+    )
+    return json.loads(out.stdout.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--runs", type=int, default=5, help="fresh interpreters per route")
+    parser.add_argument("--clients", action="store_true", help="also time the storage backend")
+    args = parser.parse_args()
+
+    sys.path.insert(0, BACKEND_DIR)
+    import lambda_function
+
+    routes = {}
+    for (method, path), target in lambda_function.ROUTES.items():
+        routes.setdefault(target, f"{method} {path}")
+    for source, target in lambda_function.TASKS.items():
+        routes.setdefault(target, f"task {source}")
+
+    columns = "init ms  route ms  total ms  modules  boto3" + ("  clients ms" if args.clients else "")
+    print(f"{'route':<42} {columns}")
+    for target, label in routes.items():
+        samples = [_sample(target, args.clients) for _ in range(args.runs)]
+        init = statistics.median(s["init_ms"] for s in samples)
+        route = statistics.median(s["route_ms"] for s in samples)
+        line = (f"{label:<42} {init:7.1f}  {route:8.1f}  {init + route:8.1f}  "
+                f"{samples[0]['modules']:7d}  {'yes' if samples[0]['boto3'] else 'no':>5}")
+        if args.clients:
+            line += f"  {statistics.median(s['clients_ms'] for s in samples):10.1f}"
+        print(line)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
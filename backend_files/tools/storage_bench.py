@@ -0,0 +1,103 @@
+"""Time the storage-bound handler paths at realistic data sizes, locally.
+
+Seeds the memory or SQLite storage backend with a user's retained play
+history and a backlog of access requests, then times the helpers the hot
+handlers run on them: H(T) for each timeframe, the exclusion-filter rebuild,
+an admin listing page and the access-count reconcile. No AWS access is needed;
+wrap a run in cProfile (python -m cProfile -s cumtime ...) to profile it.
+
+    python tools/storage_bench.py [--backend memory|sqlite] [--plays 5000] [--requests 5000]
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+
+BACKEND_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+
+GENRES = ["indie rock", "bedroom pop", "afrobeats", "uk garage", "neo soul", "shoegaze",
+          "alt z", "amapiano", "jazz rap", "modern rock", "art pop", "dream pop"]
+USER_ID = "6f1c2b57-3d0e-4a8f-9c61-2e5b7d4a9f03"
+
+
+def _seed(storage, rng, plays, requests):
+    now = int(time.time())
+    # Spread the retained history evenly over the last 95 days
+    step_ms = 95 * 86400 * 1000 // max(plays, 1)
+    storage.put("users", {"user_id": USER_ID, "spotify_user_id": "visitor123"})
+    storage.batch_put("play_history", ({
+        "user_id": USER_ID,
+        "played_at": (now * 1000) - i * step_ms,
+        "track_id": f"{rng.getrandbits(64):022x}",
+        "track_name": f"Track {i}",
+        "artist_name": f"Artist {i % 311}",
+        "artist_ids": [f"{rng.getrandbits(64):022x}" for _ in range(rng.randint(1, 3))],
+        "genres": rng.sample(GENRES, rng.randint(2, 8)),
+        "album_name": f"Album {i % 97}",
+        "expires_at": now + 95 * 86400 - i * step_ms // 1000,
+    } for i in range(plays)))
+    storage.batch_put("access_requests", ({
+        "request_id": f"{rng.getrandbits(128):032x}",
+        "full_name": f"Visitor {i}",
+        "spotify_email": f"visitor{i}@example.com",
+        "country": rng.choice(["US", "NG", "GB", "DE", "BR"]),
+        "status": rng.choice(["pending", "pending", "approved", "rejected"]),
+        "requested_at": now - i,
+        "expires_at": now - i + 90 * 86400,
+    } for i in range(requests)))
+
+
+def _time(fn, repeat):
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn()
+        best = min(best, time.perf_counter() - start)
+    return best * 1000, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--backend", choices=("memory", "sqlite"), default="memory")
+    parser.add_argument("--path", help="SQLite file (default: a temporary file)")
+    parser.add_argument("--plays", type=int, default=5000, help="retained plays for the user")
+    parser.add_argument("--requests", type=int, default=5000, help="access requests")
+    parser.add_argument("--repeat", type=int, default=5, help="best-of runs per case")
+    args = parser.parse_args()
+
+    os.environ["STORAGE_BACKEND"] = args.backend
+    if args.backend == "sqlite":
+        os.environ["STORAGE_SQLITE_PATH"] = args.path or os.path.join(
+            tempfile.mkdtemp(prefix="storage_bench_"), "bench.sqlite3")
+    sys.path.insert(0, BACKEND_DIR)
+    from spotify_api.core import ADMIN_PAGE_SIZE, _get_storage
+    from spotify_api.access import _rebuild_access_counts
+    from spotify_api.playlists import _build_play_history, _rebuild_exclusion_filter
+
+    storage = _get_storage()
+    started = time.perf_counter()
+    _seed(storage, random.Random(7), args.plays, args.requests)
+    print(f"seeded {args.plays} plays, {args.requests} requests into {args.backend} "
+          f"in {(time.perf_counter() - started) * 1000:.0f} ms")
+
+    cases = [(f"H({timeframe})", lambda t=timeframe: _build_play_history(USER_ID, t))
+             for timeframe in ("2w", "1m", "3m")]
+    cases += [
+        ("exclusion filter rebuild", lambda: _rebuild_exclusion_filter(USER_ID).count),
+        (f"admin listing page ({ADMIN_PAGE_SIZE})", lambda: storage.query(
+            "access_requests", "pending", index="status-index", forward=False, limit=ADMIN_PAGE_SIZE)[0]),
+        ("access count reconcile", lambda: _rebuild_access_counts()["total"]),
+    ]
+
+    print(f"{'case':<32} {'items':>7} {'ms':>9}")
+    for label, fn in cases:
+        ms, result = _time(fn, args.repeat)
+        size = result if isinstance(result, int) else len(result)
+        print(f"{label:<32} {size:7d} {ms:9.2f}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
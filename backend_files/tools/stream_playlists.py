@@ -0,0 +1,121 @@
+"""Consume the playlist-suggestions NDJSON stream locally and time it.
+
+Runs handle_playlist_suggestions_stream in-process, printing each line as it
+is written with its arrival time, then time-to-first-playlist and total time.
+Runs standalone: it uses the memory (or SQLite) storage backend and starts
+tools/fake_spotify.py in-process, then logs a fake user in directly (user,
+refresh token and session) and streams their suggestions. No AWS access or
+network is needed.
+
+    python tools/stream_playlists.py [--user fakeuser0000] [--force] [--image-size small]
+                                     [--latency-ms 40] [--backend memory|sqlite]
+
+With --session, an existing session in the configured backend is used as is
+(e.g. a SQLite file from an earlier run, or DynamoDB with the Lambda's
+environment), against whatever SPOTIFY_API_BASE points at.
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+import threading
+import time
+
+TOOLS_DIR = os.path.dirname(os.path.abspath(__file__))
+BACKEND_DIR = os.path.join(TOOLS_DIR, "..")
+
+
+def _start_fake_spotify(args):
+    """Serve a seeded fake Spotify on a free port. Returns (server, base URL)."""
+    sys.path.insert(0, TOOLS_DIR)
+    from fake_spotify import FakeSpotify, Faults, make_server
+
+    fake = FakeSpotify(seed=args.seed)
+    server = make_server(fake, Faults(args.seed, latency_ms=args.latency_ms), port=0)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://{server.server_address[0]}:{server.server_address[1]}"
+
+
+def _log_in(spotify_user_id):
+    """Create the user, their refresh token and a session, as the callback would."""
+    from spotify_api.auth import _find_or_create_user
+    from spotify_api.core import _create_session, _store_encrypted_token
+
+    user_id = _find_or_create_user(spotify_user_id, spotify_user_id, f"{spotify_user_id}@example.com")
+    _store_encrypted_token(user_id, f"refresh-{spotify_user_id}")
+    return _create_session(user_id)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--session", help="stream for this existing session_id instead")
+    parser.add_argument("--user", default="fakeuser0000", help="fake Spotify user to log in")
+    parser.add_argument("--backend", choices=("memory", "sqlite"), default="memory")
+    parser.add_argument("--seed", type=int, default=7, help="fake Spotify catalogue seed")
+    parser.add_argument("--latency-ms", type=float, default=0.0, help="added fake Spotify latency")
+    parser.add_argument("--force", action="store_true", help="bypass the cached result")
+    parser.add_argument("--image-size", help="image_size projection (small|medium|large|<px>)")
+    args = parser.parse_args()
+
+    server = None
+    if not args.session:
+        server, base = _start_fake_spotify(args)
+        os.environ.update(
+            STORAGE_BACKEND=args.backend,
+            SPOTIFY_API_BASE=base,
+            SPOTIFY_ACCOUNTS_BASE=base,
+            SPOTIFY_CLIENT_ID="local",
+            SPOTIFY_CLIENT_SECRET="local",
+        )
+        if args.backend == "sqlite":
+            os.environ.setdefault("STORAGE_SQLITE_PATH", os.path.join(
+                tempfile.mkdtemp(prefix="stream_playlists_"), "stream.sqlite3"))
+    sys.path.insert(0, BACKEND_DIR)
+    from spotify_api.playlists import handle_playlist_suggestions_stream
+
+    session_id = args.session or _log_in(args.user)
+    qs = {}
+    if args.force:
+        qs["force"] = "true"
+    if args.image_size:
+        qs["image_size"] = args.image_size
+    event = {
+        "requestContext": {"http": {"method": "GET", "path": "/api/me/playlists/suggestions"}},
+        "queryStringParameters": qs,
+        "cookies": [f"session_id={session_id}"],
+        "headers": {},
+    }
+
+    started = time.monotonic()
+    first_playlist = None
+
+    def write(line):
+        nonlocal first_playlist
+        elapsed = (time.monotonic() - started) * 1000
+        message = json.loads(line)
+        if message["type"] == "playlist":
+            first_playlist = first_playlist or elapsed
+            playlist = message["playlist"]
+            detail = f"#{message['index']} {playlist['id']} ({len(playlist['tracks'])} tracks)"
+        elif message["type"] == "stats":
+            detail = json.dumps(message["stats"])
+        else:
+            detail = ""
+        print(f"{elapsed:8.1f} ms  {message['type']:<8} {detail}")
+
+    error = handle_playlist_suggestions_stream(event, write)
+    if error:
+        print(f"error {error['statusCode']}: {error['body']}", file=sys.stderr)
+        return 1
+    total = (time.monotonic() - started) * 1000
+    print(f"time to first playlist: {first_playlist or total:.1f} ms, total: {total:.1f} ms")
+    if server is not None:
+        routes = server.RequestHandlerClass.stats["routes"]
+        print(f"fake Spotify requests: {sum(routes.values())}")
+        server.shutdown()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
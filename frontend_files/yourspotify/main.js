@@ -200,8 +200,10 @@
       })
         .then(function (res) {
           if (res.ok) {
-            alert("Your data has been deleted. You will be logged out.");
-            window.location.href = "/yourspotify/";
+            return res.json().then(function (d) {
+              alert("Your data is being deleted (reference: " + d.job_id + "). You will be logged out.");
+              window.location.href = "/yourspotify/";
+            });
           } else {
             return res.json().then(function (d) {
               alert("Error: " + (d.error || "Could not delete data."));
@@ -387,7 +389,7 @@
       regenerateBtn.textContent = "Generating\u2026";
       if (playlistsContainer) playlistsContainer.innerHTML = '<p class="loading-text">Regenerating your playlists\u2026</p>';
 
-      fetch("/api/me/playlists/regenerate", {
+      fetch("/api/me/playlists/regenerate?image_size=small", {
         method: "POST",
         credentials: "include"
       })
@@ -441,6 +443,8 @@
         + ' data-playlist-name="' + escapeAttr(pl.name) + '"'
         + ' data-playlist-desc="' + escapeAttr(pl.description) + '"'
         + '>&#10010; Save to Spotify</button>';
+      html += '<button class="save-playlist-btn refresh-playlist-btn" data-theme="' + pl.id + '"'
+        + ' title="Get fresh tracks for this playlist">&#8635; Refresh</button>';
       html += '</div>';
       if (pl.message) {
         html += '<p class="muted-text">' + escapeHtml(pl.message) + '</p>';
@@ -460,8 +464,31 @@
     });
     playlistsContainer.innerHTML = html;
 
+    /* Attach per-theme refresh handlers */
+    playlistsContainer.querySelectorAll(".refresh-playlist-btn").forEach(function (btn) {
+      btn.addEventListener("click", function () {
+        btn.disabled = true;
+        btn.textContent = "Refreshing\u2026";
+        fetch("/api/me/playlists/regenerate?image_size=small&theme=" + encodeURIComponent(btn.getAttribute("data-theme")), {
+          method: "POST",
+          credentials: "include"
+        })
+          .then(function (res) {
+            if (!res.ok) throw new Error("HTTP " + res.status);
+            return res.json();
+          })
+          .then(function (d) { renderPlaylists(d); })
+          .catch(function () {
+            /* Keep the current list; just flag the failed refresh */
+            btn.textContent = "Error";
+            btn.disabled = false;
+            setTimeout(function () { btn.textContent = "\u21BB Refresh"; }, 2000);
+          });
+      });
+    });
+
     /* Attach save handlers */
-    playlistsContainer.querySelectorAll(".save-playlist-btn").forEach(function (btn) {
+    playlistsContainer.querySelectorAll(".save-playlist-btn[data-playlist-id]").forEach(function (btn) {
       btn.addEventListener("click", function () {
         var plId = btn.getAttribute("data-playlist-id");
         var plName = btn.getAttribute("data-playlist-name");
@@ -502,7 +529,7 @@
 
   function loadPlaylistSuggestions() {
     loadPreferences().then(function () {
-      fetch("/api/me/playlists/suggestions", { credentials: "include" })
+      fetch("/api/me/playlists/suggestions?image_size=small", { credentials: "include" })
         .then(function (res) { return res.json(); })
         .then(function (data) { renderPlaylists(data); })
         .catch(function () {
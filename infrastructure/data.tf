@@ -1,7 +1,20 @@
 data "archive_file" "lambda" {
   type        = "zip"
-  source_file = "${var.backend_path}${var.lambda_template}"
   output_path = local.lambda_zip_path
+
+  source {
+    content  = file("${var.backend_path}${var.lambda_template}")
+    filename = var.lambda_template
+  }
+
+  # Route modules imported lazily by the entry point
+  dynamic "source" {
+    for_each = fileset(var.backend_path, "spotify_api/*.py")
+    content {
+      content  = file("${var.backend_path}${source.value}")
+      filename = source.value
+    }
+  }
 }
 
 data "local_file" "files" {
@@ -59,6 +59,7 @@ locals {
     INSIGHTS_TABLE         = module.dynamodb.insights_table_name
     ACCESS_REQUESTS_TABLE  = module.dynamodb.access_requests_table_name
     PLAY_HISTORY_TABLE     = module.dynamodb.play_history_table_name
+    EMAIL_OUTBOX_TABLE     = module.dynamodb.email_outbox_table_name
     WEBSITE_DOMAIN         = var.website_domain_name
     SPOTIFY_REDIRECT_URI   = local.spotify_redirect_uri
     OWNER_SPOTIFY_USER_ID  = var.owner_spotify_user_id
@@ -45,6 +45,7 @@ module "backend" {
     module.dynamodb.insights_table_arn,
     module.dynamodb.access_requests_table_arn,
     module.dynamodb.play_history_table_arn,
+    module.dynamodb.email_outbox_table_arn,
   ]
   kms_key_arn                  = module.kms.kms_key_arn
   ses_identity_arn             = module.ses.ses_domain_identity_arn
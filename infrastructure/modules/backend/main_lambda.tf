@@ -73,7 +73,10 @@ resource "aws_iam_role_policy" "data_processor_policy" {
           "dynamodb:PutItem",
           "dynamodb:UpdateItem",
           "dynamodb:DeleteItem",
-          "dynamodb:Query"
+          "dynamodb:Query",
+          "dynamodb:Scan",
+          "dynamodb:BatchGetItem",
+          "dynamodb:BatchWriteItem"
         ],
         Resource = concat(
           var.dynamodb_table_arns,
@@ -95,6 +98,14 @@ resource "aws_iam_role_policy" "data_processor_policy" {
           "ses:SendRawEmail"
         ],
         Resource = var.ses_identity_arn
+      },
+      {
+        # Self-invocation for async tasks (email outbox drain)
+        Effect   = "Allow",
+        Action   = [
+          "lambda:InvokeFunction"
+        ],
+        Resource = aws_lambda_function.data_processor.arn
       }
     ]
   })
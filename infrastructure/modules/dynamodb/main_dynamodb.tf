@@ -60,6 +60,18 @@ resource "aws_dynamodb_table" "sessions" {
     type = "S"
   }
 
+  attribute {
+    name = "user_id"
+    type = "S"
+  }
+
+  # Sparse: only login sessions carry user_id (used by data deletion)
+  global_secondary_index {
+    name            = "user-id-index"
+    hash_key        = "user_id"
+    projection_type = "KEYS_ONLY"
+  }
+
   ttl {
     attribute_name = "expires_at"
     enabled        = true
@@ -115,9 +127,16 @@ resource "aws_dynamodb_table" "access_requests" {
     type = "S"
   }
 
+  attribute {
+    name = "requested_at"
+    type = "N"
+  }
+
+  # Admin listing pages through one status at a time, newest first
   global_secondary_index {
     name            = "status-index"
     hash_key        = "status"
+    range_key       = "requested_at"
     projection_type = "ALL"
   }
 
@@ -155,6 +174,46 @@ resource "aws_dynamodb_table" "play_history" {
   }
 }
 
+# Email outbox — queued notification jobs drained asynchronously to SES
+resource "aws_dynamodb_table" "email_outbox" {
+  name         = "${var.project_name}-email-outbox"
+  billing_mode = "PAY_PER_REQUEST"
+  hash_key     = "job_id"
+
+  attribute {
+    name = "job_id"
+    type = "S"
+  }
+
+  attribute {
+    name = "status"
+    type = "S"
+  }
+
+  attribute {
+    name = "created_at"
+    type = "N"
+  }
+
+  # Drain queries pending / digest / sending jobs, oldest first
+  global_secondary_index {
+    name            = "status-index"
+    hash_key        = "status"
+    range_key       = "created_at"
+    projection_type = "ALL"
+  }
+
+  ttl {
+    attribute_name = "expires_at"
+    enabled        = true
+  }
+
+  tags = {
+    Name    = "${var.project_name}-email-outbox"
+    Project = var.project_name
+  }
+}
+
 ############################################################################################################
 # End of File
 ############################################################################################################
@@ -58,6 +58,16 @@ output "play_history_table_arn" {
   value       = aws_dynamodb_table.play_history.arn
 }
 
+output "email_outbox_table_name" {
+  description = "Name of the email_outbox DynamoDB table"
+  value       = aws_dynamodb_table.email_outbox.name
+}
+
+output "email_outbox_table_arn" {
+  description = "ARN of the email_outbox DynamoDB table"
+  value       = aws_dynamodb_table.email_outbox.arn
+}
+
 ############################################################################################################
 # End of File
 ############################################################################################################
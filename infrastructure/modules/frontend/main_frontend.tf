@@ -268,6 +268,42 @@ resource "aws_cloudfront_function" "rewrite_uri" {
 ############################################################################################################
 # CloudFront distribution Resources
 ############################################################################################################
+# Public, anonymous API routes that may be served from the CloudFront cache
+locals {
+  public_api_paths = [
+    "/api/owner/*",
+    "/api/stats/*",
+    "/api/access/count",
+    "/api/me/new-releases",
+  ]
+}
+
+# Cache policy for public API routes: TTL comes from the origin's
+# Cache-Control (max-age / stale-while-revalidate); cookies are not part of
+# the key, query strings are (e.g. ?sections=)
+resource "aws_cloudfront_cache_policy" "public_api" {
+  name        = "${var.project_name}-public-api"
+  comment     = "Honor origin Cache-Control for public API routes"
+  min_ttl     = 0
+  default_ttl = 0
+  max_ttl     = 86400
+
+  parameters_in_cache_key_and_forwarded_to_origin {
+    enable_accept_encoding_gzip   = true
+    enable_accept_encoding_brotli = true
+
+    cookies_config {
+      cookie_behavior = "none"
+    }
+    headers_config {
+      header_behavior = "none"
+    }
+    query_strings_config {
+      query_string_behavior = "all"
+    }
+  }
+}
+
 # Origin Access Control for the S3 bucket
 resource "aws_cloudfront_origin_access_control" "oac" {
   name                              = var.oac_name
@@ -308,6 +344,23 @@ resource "aws_cloudfront_distribution" "this" {
     }
   }
 
+  # Public API routes — cached per the origin's Cache-Control (must precede /api/*)
+  dynamic "ordered_cache_behavior" {
+    for_each = var.api_origin_domain != "" ? local.public_api_paths : []
+    content {
+      path_pattern             = ordered_cache_behavior.value
+      target_origin_id         = "${var.project_name}-api-origin"
+      allowed_methods          = ["GET", "HEAD", "OPTIONS"]
+      cached_methods           = ["GET", "HEAD"]
+      viewer_protocol_policy   = "redirect-to-https"
+      compress                 = true
+
+      cache_policy_id          = aws_cloudfront_cache_policy.public_api.id
+      # Managed policy: AllViewerExceptHostHeader
+      origin_request_policy_id = "b689b0a8-53d0-40ab-baf2-68738e2966ac"
+    }
+  }
+
   # API cache behavior — no caching, forward all cookies/headers
   dynamic "ordered_cache_behavior" {
     for_each = var.api_origin_domain != "" ? [1] : []
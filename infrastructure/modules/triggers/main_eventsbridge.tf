@@ -17,3 +17,25 @@ resource "aws_lambda_permission" "allow_eventbridge" {
   principal     = "events.amazonaws.com"
   source_arn    = aws_cloudwatch_event_rule.lambda_schedule.arn
 }
+
+# Hourly email outbox drain — retries failed sends and delivers the admin digest
+resource "aws_cloudwatch_event_rule" "outbox_drain" {
+  name                = "${var.cloudwatch_event_rule_name}-outbox-drain"
+  description         = "Drain the email outbox and send the admin digest every hour"
+  schedule_expression = "rate(1 hour)"
+}
+
+resource "aws_cloudwatch_event_target" "outbox_drain_target" {
+  rule      = aws_cloudwatch_event_rule.outbox_drain.name
+  target_id = "${var.lambda_function_name}-outbox-drain"
+  arn       = var.lambda_function_arn
+  input     = jsonencode({ source = "outbox.drain", include_digest = true })
+}
+
+resource "aws_lambda_permission" "allow_eventbridge_outbox_drain" {
+  statement_id  = "AllowExecutionFromEventBridgeOutboxDrain"
+  action        = "lambda:InvokeFunction"
+  function_name = var.lambda_function_name
+  principal     = "events.amazonaws.com"
+  source_arn    = aws_cloudwatch_event_rule.outbox_drain.arn
+}